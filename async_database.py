@@ -0,0 +1,96 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import database
+from config import DB_EXECUTOR_WORKERS, INITIAL_BALANCE
+from models import TransactionType
+from user_cache import user_cache
+
+logger = logging.getLogger(__name__)
+
+# Синхронные запросы SQLAlchemy выполняются в отдельных потоках,
+# чтобы не блокировать цикл событий бота и веб-приложения
+_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+
+def _call_with_session(func: Callable, *args, **kwargs) -> Any:
+    with database.get_db() as session:
+        return func(session, *args, **kwargs)
+
+async def run_db(func: Callable, *args, **kwargs) -> Any:
+    """Выполнить func(session, *args, **kwargs) в потоке базы данных"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _executor, functools.partial(_call_with_session, func, *args, **kwargs)
+    )
+
+def shutdown() -> None:
+    """Дождаться завершения запросов и остановить потоки базы данных"""
+    _executor.shutdown(wait=True)
+    logger.info("Потоки базы данных остановлены")
+
+async def get_user(user_id: int) -> Optional[Dict]:
+    """Получить данные пользователя (из кэша, при промахе из БД)"""
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await run_db(database.get_user, user_id)
+        if user is not None:
+            user_cache.put(user)
+    return user
+
+async def get_or_create_user(user_id: int, username: str) -> Dict:
+    """Получить пользователя или создать нового и положить его в кэш"""
+    user = await run_db(database.get_or_create_user, user_id, username, INITIAL_BALANCE)
+    user_cache.put(user)
+    return user
+
+async def get_user_id_by_username(username: str) -> Optional[int]:
+    """Найти ID пользователя по username"""
+    return await run_db(database.get_user_id_by_username, username)
+
+async def set_user_banned(username: str, banned: bool) -> bool:
+    """Забанить или разбанить пользователя"""
+    return await run_db(database.set_user_banned, username, banned)
+
+async def get_user_balance(user_id: int) -> int:
+    """Получить баланс пользователя"""
+    user = await get_user(user_id)
+    return user["balance"] if user else 0
+
+async def update_balance(user_id: int, amount: int,
+                         transaction_type: TransactionType, game_type: str = None,
+                         wager: Optional[int] = None,
+                         idempotency_key: Optional[str] = None) -> bool:
+    """Обновить баланс пользователя и создать транзакцию"""
+    return await run_db(database.update_balance, user_id, amount, transaction_type, game_type,
+                        wager, idempotency_key)
+
+async def change_balance(user_id: int, amount: int,
+                         transaction_type: TransactionType, game_type: str = None,
+                         wager: Optional[int] = None,
+                         idempotency_key: Optional[str] = None) -> Optional[int]:
+    """Обновить баланс и вернуть новое значение (None, если списание невозможно)"""
+    return await run_db(database.change_balance, user_id, amount, transaction_type, game_type,
+                        wager, idempotency_key)
+
+async def create_game_session(game_type: str, players: List[Dict]) -> int:
+    """Создать новую игровую сессию"""
+    return await run_db(database.create_game_session, game_type, players)
+
+async def update_game_session(session_id: int, outcome: Dict) -> bool:
+    """Обновить результат игровой сессии"""
+    return await run_db(database.update_game_session, session_id, outcome)
+
+async def get_user_stats(user_id: int) -> Dict:
+    """Получить статистику пользователя"""
+    return await run_db(database.get_user_stats, user_id)
+
+async def get_leaderboard(limit: int = 10) -> List[Dict]:
+    """Получить таблицу лидеров"""
+    return await run_db(database.get_leaderboard, limit)
+
+async def check_rate_limit(user_id: int) -> bool:
+    """Проверить ограничение на количество игр в час"""
+    return await run_db(database.check_rate_limit, user_id)
@@ -3,16 +3,26 @@ import logging
 import traceback
 import asyncio
 import sys
+import math
 import nest_asyncio
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, filters
-from config import BOT_TOKEN, INITIAL_BALANCE, BLACKJACK_MIN_BET, SLOTS_MIN_BET, ROULETTE_MIN_BET
-from models import User, Transaction, TransactionType
-from database import init_db, get_db, update_balance
+from telegram.ext import Application, ApplicationHandlerStop, CommandHandler, CallbackQueryHandler, ContextTypes, filters
+from config import (BOT_TOKEN, BLACKJACK_MIN_BET, BLACKJACK_HINTS, SLOTS_MIN_BET, ROULETTE_MIN_BET, LEADERBOARD_REFRESH_INTERVAL,
+                    SLOTS_AUTOPLAY_SPINS, SLOTS_AUTOPLAY_STOP_MULTIPLIER, ROULETTE_TABLES)
+from models import TransactionType
+from database import Replayed, init_db
+import async_database as db
+from ledger import ledger
+from rate_limit import rate_limiter
+from leaderboard import leaderboard
+from user_cache import user_cache
+from idempotency import recent_keys
 from datetime import datetime
-from games.blackjack import BlackjackGame
-from games.roulette import RouletteGame, Bet
-from games.slots import SlotsGame
+from typing import Optional
+from games.blackjack import BlackjackGame, Shoe
+from games.blackjack_tables import get_tables
+from games.roulette import BET_OPTIONS, QUICK_BETS, RouletteGame, RouletteTable, Bet, number_color
+from games.slots import SlotsGame, autoplay, autoplay_summary
 
 if sys.platform.startswith('win') and sys.version_info >= (3, 8):
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
@@ -29,6 +39,83 @@ logger = logging.getLogger(__name__)
 # Глобальный словарь для хранения активных игр
 active_games = {}
 
+# Шузы мультиплеерных столов блэкджека: раунды в одной комнате играют из общего шуза
+room_shoes = {}
+
+# Общие столы рулетки: окно ставок на всех, вращение по таймеру JobQueue
+roulette_tables = {table_id: RouletteTable(table_id, title) for table_id, title in ROULETTE_TABLES.items()}
+
+QUICK_BET_LABELS = {
+    "red": "🔴 Красное",
+    "black": "⚫ Чёрное",
+    "zero": "🟢 Зеро",
+    "even": "2️⃣ Четное",
+    "odd": "1️⃣ Нечетное"
+}
+
+# Кнопки, с которых начинается ставка (проверяются ограничителем частоты)
+BET_ACTIONS = {
+    "slots_spin", "roulette_spin", "blackjack_single",
+    "roulette_red", "roulette_black", "roulette_zero", "roulette_even", "roulette_odd"
+}
+BET_ACTION_PREFIXES = ("blackjack_room_", "slots_auto_", "roulette_tbet_", "roulette_tretry_")
+
+# Почему остановилась автоигра крутилки
+AUTOPLAY_STOP_REASONS = {
+    "spins": "сыграны все вращения",
+    "win": "крупный выигрыш",
+    "balance": "не хватает баланса на ставку"
+}
+
+def is_bet_action(data: str) -> bool:
+    """Проверить, начинает ли нажатие кнопки новую ставку"""
+    return data in BET_ACTIONS or data.startswith(BET_ACTION_PREFIXES)
+
+def bet_games(data: str) -> int:
+    """Сколько игр начинает нажатие: автоигра крутилки - по числу вращений"""
+    spins = data[len("slots_auto_"):] if data.startswith("slots_auto_") else ""
+    return int(spins) if spins.isdigit() else 1
+
+async def rate_limit_guard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Отклонить ставку до обработчиков игр, если пользователь играет слишком часто"""
+    query = update.callback_query
+    if not query or not query.from_user or not query.data or not is_bet_action(query.data):
+        return
+    allowed, retry_after = rate_limiter.check(query.from_user.id, games=bet_games(query.data))
+    if not allowed:
+        await query.answer(
+            f"Слишком часто! Попробуйте через {math.ceil(retry_after)} сек.",
+            show_alert=True
+        )
+        raise ApplicationHandlerStop
+
+async def duplicate_callback_guard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Не обрабатывать повторно доставленный callback второй раз"""
+    query = update.callback_query
+    if query and query.id and recent_keys.seen(f"tg:{query.id}"):
+        logger.info(f"Повторная доставка callback {query.id} пропущена")
+        raise ApplicationHandlerStop
+
+def settlement_key(query, user_id: int) -> str:
+    """Ключ идемпотентности проводки: один callback проводится для игрока один раз"""
+    return f"tg:{query.id}:{user_id}"
+
+def replayed_outcome(replay: Replayed) -> Optional[dict]:
+    """Исход уже проведенной игры из ее сессии (None, если сессия не записана)"""
+    return replay.sessions[0]["outcome"] if replay.sessions else None
+
+def replayed_text(replay: Replayed) -> str:
+    """Ответ на повтор, когда исход показать не по чему: только проведенный итог"""
+    return f"Эта ставка уже проведена: {replay.result:+} монет\nВаш баланс: {replay.balance} монет"
+
+def get_leaderboard_text(user_id: Optional[int] = None) -> str:
+    """Таблица лидеров из памяти с местом текущего игрока"""
+    text = leaderboard.render()
+    rank = leaderboard.rank(user_id) if user_id is not None else None
+    if rank is not None:
+        text += f"\nВаше место: {rank} из {len(leaderboard)}"
+    return text
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /start"""
     if not update.effective_user:
@@ -42,37 +129,30 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
     username = update.effective_user.username or update.effective_user.first_name or str(user_id)
     
-    with get_db() as session:
-        # Проверяем, существует ли пользователь
-        user = session.query(User).filter(User.user_id == user_id).first()
-        if not user:
-            # Создаем нового пользователя
-            user = User(user_id=user_id, username=username, balance=INITIAL_BALANCE)
-            session.add(user)
-            session.commit()
-            logger.info(f"Создан новый пользователь: {username} (ID: {user_id})")
-        
-        if user and getattr(user, 'is_banned', 0):
-            await update.effective_message.reply_text("Гетаут отсюда позорник нищий")
-            return
-        
-        # Создаем клавиатуру
-        keyboard = [
-            [InlineKeyboardButton("💰 Баланс", callback_data="balance")],
-            [
-                InlineKeyboardButton("🎰 Крутилка", callback_data="slots_menu"),
-                InlineKeyboardButton("🎲 Рулетка", callback_data="roulette_menu")
-            ],
-            [InlineKeyboardButton("🃏 21", callback_data="blackjack_menu")],
-            [InlineKeyboardButton("🏆 Таблица лидеров", callback_data="leaderboard")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.effective_message.reply_text(
-            f"Добро пожаловать в казино, {username}!\n"
-            f"Ваш текущий баланс: {user.balance} монет",
-            reply_markup=reply_markup
-        )
+    # Получаем пользователя или создаем нового
+    user = await db.get_or_create_user(user_id, username)
+    
+    if user["is_banned"]:
+        await update.effective_message.reply_text("Гетаут отсюда позорник нищий")
+        return
+    
+    # Создаем клавиатуру
+    keyboard = [
+        [InlineKeyboardButton("💰 Баланс", callback_data="balance")],
+        [
+            InlineKeyboardButton("🎰 Крутилка", callback_data="slots_menu"),
+            InlineKeyboardButton("🎲 Рулетка", callback_data="roulette_menu")
+        ],
+        [InlineKeyboardButton("🃏 21", callback_data="blackjack_menu")],
+        [InlineKeyboardButton("🏆 Таблица лидеров", callback_data="leaderboard")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    await update.effective_message.reply_text(
+        f"Добро пожаловать в казино, {username}!\n"
+        f"Ваш текущий баланс: {user['balance']} монет",
+        reply_markup=reply_markup
+    )
 
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик нажатий на кнопки"""
@@ -90,775 +170,931 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     
     await query.answer()  # Отвечаем на callback_query
     
-    with get_db() as session:
-        # Получаем пользователя из базы данных
-        user = session.query(User).filter(User.user_id == user_id).first()
-        if not user:
-            logger.error(f"Пользователь не найден в базе данных: {user_id}")
-            await query.message.reply_text("Произошла ошибка. Пожалуйста, используйте /start")
+    # Получаем пользователя из базы данных
+    user = await db.get_user(user_id)
+    if not user:
+        logger.error(f"Пользователь не найден в базе данных: {user_id}")
+        await query.message.reply_text("Произошла ошибка. Пожалуйста, используйте /start")
+        return
+        
+    if user["is_banned"]:
+        await query.message.reply_text("Гетаут отсюда позорник нищий")
+        return
+        
+    if query.data == "balance":
+        await query.message.reply_text(f"Ваш баланс: {user['balance']} монет")
+        
+    elif query.data == "slots_menu":
+        keyboard = [
+            [InlineKeyboardButton("🎰 Крутить (10 монет)", callback_data="slots_spin")],
+            [InlineKeyboardButton(f"🔁 Автоигра ×{spins}", callback_data=f"slots_auto_{spins}")
+             for spins in SLOTS_AUTOPLAY_SPINS],
+            [InlineKeyboardButton("« Назад", callback_data="main_menu")]
+        ]
+        await query.message.edit_text(
+            "🎰 Крутилка\nМинимальная ставка: 10 монет",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        
+    elif query.data == "roulette_menu":
+        keyboard = [
+            [InlineKeyboardButton("🔴 Красное", callback_data="roulette_red")],
+            [InlineKeyboardButton("⚫ Чёрное", callback_data="roulette_black")],
+            [InlineKeyboardButton("🟢 Зеро", callback_data="roulette_zero")],
+            [InlineKeyboardButton("2️⃣ Четное", callback_data="roulette_even")],
+            [InlineKeyboardButton("1️⃣ Нечетное", callback_data="roulette_odd")],
+        ]
+        if context.job_queue is not None:
+            keyboard.append([
+                InlineKeyboardButton(table.title, callback_data=f"roulette_table_{table.table_id}")
+                for table in roulette_tables.values()
+            ])
+        keyboard.append([InlineKeyboardButton("« Назад", callback_data="main_menu")])
+        await query.message.edit_text(
+            "🎲 Рулетка\nВыберите тип ставки:",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        
+    elif query.data == "blackjack_menu":
+        keyboard = [
+            [InlineKeyboardButton("🃏 Начать игру (50 монет)", callback_data="blackjack_start")],
+            [InlineKeyboardButton("« Назад", callback_data="main_menu")]
+        ]
+        await query.message.edit_text(
+            "🃏 21\nМинимальная ставка: 50 монет",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        
+    elif query.data == "main_menu":
+        keyboard = [
+            [InlineKeyboardButton("💰 Баланс", callback_data="balance")],
+            [
+                InlineKeyboardButton("🎰 Крутилка", callback_data="slots_menu"),
+                InlineKeyboardButton("🎲 Рулетка", callback_data="roulette_menu")
+            ],
+            [InlineKeyboardButton("🃏 21", callback_data="blackjack_menu")],
+            [InlineKeyboardButton("🏆 Таблица лидеров", callback_data="leaderboard")]
+        ]
+        await query.message.edit_text(
+            f"Добро пожаловать в казино, {username}!\nВаш текущий баланс: {user['balance']} монет",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        
+    elif query.data.startswith("roulette_table_"):
+        table = roulette_tables.get(query.data[len("roulette_table_"):])
+        if table is None:
+            await query.message.reply_text("Стол не найден")
             return
-            
-        if user and getattr(user, 'is_banned', 0):
-            await query.message.reply_text("Гетаут отсюда позорник нищий")
+        text, reply_markup = roulette_table_view(table, user_id)
+        await query.message.reply_text(text, reply_markup=reply_markup)
+    
+    # Ставка на общем столе: первая ставка раунда запускает таймер вращения
+    elif query.data.startswith("roulette_tbet_"):
+        table_id, _, bet_name = query.data[len("roulette_tbet_"):].rpartition("_")
+        table = roulette_tables.get(table_id)
+        if table is None or bet_name not in QUICK_BETS or context.job_queue is None:
+            await query.message.reply_text("Неверная ставка")
             return
-            
-        if query.data == "balance":
-            await query.message.reply_text(f"Ваш баланс: {user.balance} монет")
-            
-        elif query.data == "slots_menu":
-            keyboard = [
-                [InlineKeyboardButton("🎰 Крутить (10 монет)", callback_data="slots_spin")],
-                [InlineKeyboardButton("« Назад", callback_data="main_menu")]
-            ]
-            await query.message.edit_text(
-                "🎰 Крутилка\nМинимальная ставка: 10 монет",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-            
-        elif query.data == "roulette_menu":
-            keyboard = [
-                [InlineKeyboardButton("🔴 Красное", callback_data="roulette_red")],
-                [InlineKeyboardButton("⚫ Чёрное", callback_data="roulette_black")],
-                [InlineKeyboardButton("🟢 Зеро", callback_data="roulette_zero")],
-                [InlineKeyboardButton("2️⃣ Четное", callback_data="roulette_even")],
-                [InlineKeyboardButton("1️⃣ Нечетное", callback_data="roulette_odd")],
-                [InlineKeyboardButton("« Назад", callback_data="main_menu")]
-            ]
-            await query.message.edit_text(
-                "🎲 Рулетка\nВыберите тип ставки:",
-                reply_markup=InlineKeyboardMarkup(keyboard)
+        bet = Bet(*QUICK_BETS[bet_name], ROULETTE_MIN_BET)
+        ok, message, opened = table.place_bet(user_id, bet, user["balance"], query.message.chat_id)
+        if not ok:
+            await query.message.reply_text(message)
+            return
+        if opened:
+            context.job_queue.run_once(close_roulette_table, table.betting_time, data=table.table_id,
+                                       name=f"roulette_table_{table.table_id}")
+        text, reply_markup = roulette_table_view(table, user_id)
+        await query.message.edit_text(text, reply_markup=reply_markup)
+    
+    # Повтор ставок аннулированного раунда стола в текущем раунде
+    elif query.data.startswith("roulette_tretry_"):
+        table = roulette_tables.get(query.data[len("roulette_tretry_"):])
+        if table is None or context.job_queue is None:
+            await query.message.reply_text("Стол не найден")
+            return
+        ok, message, opened = table.retry_voided(user_id, user["balance"], query.message.chat_id)
+        if opened:
+            context.job_queue.run_once(close_roulette_table, table.betting_time, data=table.table_id,
+                                       name=f"roulette_table_{table.table_id}")
+        if not ok:
+            await query.message.reply_text(message)
+            return
+        text, reply_markup = roulette_table_view(table, user_id)
+        await query.message.reply_text(f"{message}\n\n{text}", reply_markup=reply_markup)
+    
+    elif query.data[len("roulette_"):] in QUICK_BETS:
+        bet_type = query.data[len("roulette_"):]
+        if user["balance"] < ROULETTE_MIN_BET:
+            await query.message.reply_text(
+                f"Недостаточно монет. Минимальная ставка: {ROULETTE_MIN_BET}"
             )
-            
-        elif query.data == "blackjack_menu":
-            keyboard = [
-                [InlineKeyboardButton("🃏 Начать игру (50 монет)", callback_data="blackjack_start")],
-                [InlineKeyboardButton("« Назад", callback_data="main_menu")]
-            ]
-            await query.message.edit_text(
-                "🃏 21\nМинимальная ставка: 50 монет",
-                reply_markup=InlineKeyboardMarkup(keyboard)
+            return
+        game = RouletteGame()
+        result = game.play(bet_type)
+        if "error" in result:
+            await query.message.reply_text(result["error"])
+            return
+        net_result = result["prize"] if result["win"] else -result["bet"]
+        number = result["number"]
+        # Баланс и сессия - одна операция журнала
+        balances = await ledger.settle_round("roulette", [{
+            "user_id": user_id,
+            "bet": result["bet"],
+            "result": net_result
+        }], {"number": number, "fair": game.fairness()}, f"tg:{query.id}")
+        new_balance = balances.get(user_id)
+        if new_balance is None:
+            await query.message.reply_text(
+                f"Недостаточно монет. Минимальная ставка: {ROULETTE_MIN_BET}"
             )
-            
-        elif query.data == "main_menu":
-            keyboard = [
-                [InlineKeyboardButton("💰 Баланс", callback_data="balance")],
-                [
-                    InlineKeyboardButton("🎰 Крутилка", callback_data="slots_menu"),
-                    InlineKeyboardButton("🎲 Рулетка", callback_data="roulette_menu")
-                ],
-                [InlineKeyboardButton("🃏 21", callback_data="blackjack_menu")],
-                [InlineKeyboardButton("🏆 Таблица лидеров", callback_data="leaderboard")]
-            ]
-            await query.message.edit_text(
-                f"Добро пожаловать в казино, {username}!\nВаш текущий баланс: {user.balance} монет",
-                reply_markup=InlineKeyboardMarkup(keyboard)
+            return
+        if isinstance(new_balance, Replayed):
+            # Повтор callback: показываем проведенный исход, а не новое вращение
+            outcome = replayed_outcome(new_balance)
+            if outcome is None:
+                await query.message.reply_text(replayed_text(new_balance))
+                return
+            number, net_result, new_balance = outcome["number"], new_balance.result, new_balance.balance
+        color = COLOR_EMOJI[number_color(number)]
+        if net_result > 0:
+            await query.message.reply_text(
+                f"🎲 Выпало число {number} {color}\nВы выиграли {net_result} монет!\nВаш новый баланс: {new_balance}"
             )
-            
-        elif query.data.startswith("roulette_"):
-            bet_type = query.data.split("_")[1]
-            if bet_type in ["red", "black", "zero", "even", "odd"]:
-                user = session.query(User).filter(User.user_id == user_id).with_for_update().first()
-                if user is None or user.balance < ROULETTE_MIN_BET:
-                    await query.message.reply_text(
-                        f"Недостаточно монет. Минимальная ставка: {ROULETTE_MIN_BET}"
-                    )
-                    return
-                game = RouletteGame()
-                result = game.play(bet_type)
-                if "error" in result:
-                    await query.message.reply_text(result["error"])
-                    return
-                if result["win"]:
-                    update_balance(session, user_id, result["prize"], TransactionType.GAME_WIN, "roulette")
-                    user.balance += result["prize"]
-                    await query.message.reply_text(
-                        f"🎲 Выпало число {result['number']} {result['color']}\nВы выиграли {result['prize']} монет!\nВаш новый баланс: {user.balance}"
-                    )
-                else:
-                    update_balance(session, user_id, -result["bet"], TransactionType.GAME_LOSS, "roulette")
-                    user.balance -= result["bet"]
-                    await query.message.reply_text(
-                        f"🎲 Выпало число {result['number']} {result['color']}\nВы проиграли {result['bet']} монет.\nВаш новый баланс: {user.balance}"
-                    )
-                # Кнопки после игры
-                keyboard = [
-                    [InlineKeyboardButton("Сыграть снова", callback_data="roulette_menu")],
-                    [InlineKeyboardButton("« Выйти в меню", callback_data="main_menu")]
-                ]
-                await query.message.reply_text("Выберите действие:", reply_markup=InlineKeyboardMarkup(keyboard))
-            else:
-                await query.message.reply_text("Неверный тип ставки")
-        
-        elif query.data == "leaderboard":
-            top_users = session.query(User).order_by(User.balance.desc()).limit(10).all()
-            logger.info(f"Получено {len(top_users)} пользователей для таблицы лидеров")
-            
-            leaderboard_text = "🏆 Таблица лидеров:\n\n"
-            for i, user in enumerate(top_users, 1):
-                leaderboard_text += f"{i}. {user.username}: {user.balance} монет\n"
-            
-            await query.message.reply_text(leaderboard_text)
-            logger.info("Таблица лидеров успешно отправлена")
-        
-        elif query.data == "help":
-            help_text = (
-                "🎮 Доступные игры:\n\n"
-                "🎰 Крутилка:\n"
-                "- Минимальная ставка: 5 монет\n"
-                "- 3 одинаковых символа: x5\n\n"
-                "🃏 21:\n"
-                "- Минимальная ставка: 15 монет\n"
-                "- Одиночная игра против дилера\n"
-                "- Мультиплеер (2-6 игроков)\n\n"
-                "🎲 Рулетка:\n"
-                "- Минимальная ставка: 10 монет\n"
-                "- Разные типы ставок\n\n"
-                "🏆 /leaderboard - Таблица лидеров\n"
-                "💰 /balance - Проверить баланс\n"
-                "/start - Главное меню\n"
-                "/help - Это сообщение"
+        else:
+            await query.message.reply_text(
+                f"🎲 Выпало число {number} {color}\nВы проиграли {-net_result} монет.\nВаш новый баланс: {new_balance}"
             )
-            await query.message.reply_text(help_text)
-            logger.info("Справка успешно отправлена")
-        
-        elif query.data == "game_blackjack":
-            logger.info("Пользователь выбрал игру в блэкджек")
-            # Создаем клавиатуру для выбора режима игры
+        # Кнопки после игры
+        keyboard = [
+            [InlineKeyboardButton("Сыграть снова", callback_data="roulette_menu")],
+            [InlineKeyboardButton("« Выйти в меню", callback_data="main_menu")]
+        ]
+        await query.message.reply_text("Выберите действие:", reply_markup=InlineKeyboardMarkup(keyboard))
+    
+    elif query.data == "leaderboard":
+        await query.message.reply_text(get_leaderboard_text(user_id))
+        logger.info("Таблица лидеров успешно отправлена")
+    
+    elif query.data == "help":
+        help_text = (
+            "🎮 Доступные игры:\n\n"
+            "🎰 Крутилка:\n"
+            "- Минимальная ставка: 5 монет\n"
+            "- 3 одинаковых символа: x5\n\n"
+            "🃏 21:\n"
+            "- Минимальная ставка: 15 монет\n"
+            "- Одиночная игра против дилера\n"
+            "- Мультиплеер (2-6 игроков)\n\n"
+            "🎲 Рулетка:\n"
+            "- Минимальная ставка: 10 монет\n"
+            "- Разные типы ставок\n\n"
+            "🏆 /leaderboard - Таблица лидеров\n"
+            "💰 /balance - Проверить баланс\n"
+            "/start - Главное меню\n"
+            "/help - Это сообщение"
+        )
+        await query.message.reply_text(help_text)
+        logger.info("Справка успешно отправлена")
+    
+    elif query.data == "game_blackjack":
+        logger.info("Пользователь выбрал игру в блэкджек")
+        # Создаем клавиатуру для выбора режима игры
+        keyboard = [
+            [
+                InlineKeyboardButton("🎮 Одиночная игра", callback_data="blackjack_single"),
+                InlineKeyboardButton("👥 Мультиплеер", callback_data="blackjack_multi")
+            ],
+            [
+                InlineKeyboardButton("🔙 Назад", callback_data="back_to_menu")
+            ]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        await query.message.edit_text(
+            "Выберите режим игры в 21:\n\n"
+            "🎮 Одиночная игра - игра против дилера\n"
+            "👥 Мультиплеер - игра с другими игроками (2-6 человек)",
+            reply_markup=reply_markup
+        )
+    
+    elif query.data == "back_to_menu":
+        logger.info("Пользователь вернулся в главное меню")
+        # Восстановленное меню с game_*
+        keyboard = [
+            [
+                InlineKeyboardButton("🎰 Крутилка", callback_data="game_slots"),
+                InlineKeyboardButton("🃏 21", callback_data="game_blackjack")
+            ],
+            [
+                InlineKeyboardButton("🎲 Рулетка", callback_data="game_roulette"),
+                InlineKeyboardButton("💰 Баланс", callback_data="balance")
+            ],
+            [
+                InlineKeyboardButton("📊 Таблица лидеров", callback_data="leaderboard"),
+                InlineKeyboardButton("❓ Помощь", callback_data="help")
+            ]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        await query.message.edit_text("Выберите игру:", reply_markup=reply_markup)
+    
+    elif query.data.startswith("game_"):
+        game_type = query.data.split("_")[1]
+        if game_type == "blackjack":
+            # Существующая логика для блэкджека
             keyboard = [
                 [
                     InlineKeyboardButton("🎮 Одиночная игра", callback_data="blackjack_single"),
                     InlineKeyboardButton("👥 Мультиплеер", callback_data="blackjack_multi")
                 ],
                 [
-                    InlineKeyboardButton("🔙 Назад", callback_data="back_to_menu")
+                    InlineKeyboardButton("🔙 Вернуться в меню", callback_data="back_to_menu")
                 ]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
+            await query.message.edit_text("Выберите режим игры:", reply_markup=reply_markup)
+        elif game_type == "slots":
+            game = SlotsGame(game_mode="single", chat_id=query.message.chat_id)
+            username = query.from_user.username or query.from_user.first_name
+            success, message = game.add_player(query.from_user.id, SLOTS_MIN_BET, username)
+            if not success:
+                await query.message.reply_text(message)
+                return
+            success, message = game.start_game()
+            if not success:
+                await query.message.reply_text(message)
+                return
+            active_games[query.from_user.id] = game
+            keyboard = [
+                [InlineKeyboardButton("🎰 Крутить", callback_data="slots_spin")],
+                [InlineKeyboardButton("🔙 Выйти из игры", callback_data="slots_exit")]
+            ]
+            reply_markup = InlineKeyboardMarkup(keyboard)
             await query.message.edit_text(
-                "Выберите режим игры в 21:\n\n"
-                "🎮 Одиночная игра - игра против дилера\n"
-                "👥 Мультиплеер - игра с другими игроками (2-6 человек)",
+                f"Игра началась!\n\n{game.get_game_state()}",
                 reply_markup=reply_markup
             )
-        
-        elif query.data == "back_to_menu":
-            logger.info("Пользователь вернулся в главное меню")
-            # Восстановленное меню с game_*
-            keyboard = [
-                [
-                    InlineKeyboardButton("🎰 Крутилка", callback_data="game_slots"),
-                    InlineKeyboardButton("🃏 21", callback_data="game_blackjack")
-                ],
-                [
-                    InlineKeyboardButton("🎲 Рулетка", callback_data="game_roulette"),
-                    InlineKeyboardButton("💰 Баланс", callback_data="balance")
-                ],
-                [
-                    InlineKeyboardButton("📊 Таблица лидеров", callback_data="leaderboard"),
-                    InlineKeyboardButton("❓ Помощь", callback_data="help")
-                ]
+        elif game_type == "roulette":
+            personal_roulette(query.from_user.id, query.message.chat_id)
+            await query.message.edit_text(
+                "🎲 Рулетка\n\nВыберите тип ставки, затем крутите:",
+                reply_markup=InlineKeyboardMarkup(roulette_type_rows())
+            )
+    
+    # Крутилка (слоты)
+    elif query.data == "slots_spin":
+        game = active_games.get(query.from_user.id)
+        chat_id = query.message.chat_id
+        if not game:
+            game = SlotsGame()
+            active_games[query.from_user.id] = game
+        # Добавляем игрока и стартуем игру перед spin
+        add_ok, add_msg = game.add_player(query.from_user.id, SLOTS_MIN_BET, query.from_user.username or query.from_user.first_name)
+        if not add_ok:
+            print(f"[ERROR] Не удалось добавить игрока в крутилку: {add_msg}")
+        start_ok, start_msg = game.start_game()
+        if not start_ok:
+            print(f"[ERROR] Не удалось стартовать игру в крутилке: {start_msg}")
+        # Проверяем баланс
+        if user["balance"] < SLOTS_MIN_BET:
+            await query.message.reply_text("Недостаточно средств для игры!")
+            return
+        # Крутим слоты
+        results = game.spin()
+        if query.from_user.id not in results:
+            print(f"[ERROR] Нет результата для user_id {query.from_user.id} в крутилке")
+            await query.message.reply_text("Произошла ошибка при определении результата. Попробуйте еще раз.")
+            del active_games[query.from_user.id]
+            return
+        symbols, win_amount = results[query.from_user.id]
+        # Списываем ставку, начисляем выигрыш и пишем сессию одной операцией журнала
+        net_result = win_amount - SLOTS_MIN_BET
+        balances = await ledger.settle_round("slots", [{
+            "user_id": query.from_user.id,
+            "bet": SLOTS_MIN_BET,
+            "result": net_result
+        }], {"symbols": symbols, "fair": game.fairness()}, f"tg:{query.id}")
+        new_balance = balances.get(query.from_user.id)
+        if new_balance is None:
+            await query.message.reply_text("Недостаточно средств для игры!")
+            del active_games[query.from_user.id]
+            return
+        if isinstance(new_balance, Replayed):
+            # Повтор callback: показываем проведенное вращение
+            outcome = replayed_outcome(new_balance)
+            if outcome is None:
+                await query.message.reply_text(replayed_text(new_balance))
+                del active_games[query.from_user.id]
+                return
+            symbols, win_amount = outcome["symbols"], new_balance.result + SLOTS_MIN_BET
+        # Формируем сообщение для текущего чата
+        game_message = "🎰 Крутилка\n\n"
+        game_message += f"Игрок: {query.from_user.username or query.from_user.first_name}\n"
+        game_message += f"Ставка: {SLOTS_MIN_BET} монет\n\n"
+        game_message += f"{symbols[0]} | {symbols[1]} | {symbols[2]}\n\n"
+        if win_amount > 0:
+            game_message += f"🎉 Поздравляем! Выигрыш: {win_amount} монет!"
+        else:
+            game_message += f"😔 К сожалению, проигрыш. Вы проиграли {SLOTS_MIN_BET} монет. Попробуйте еще раз!"
+        # Создаем клавиатуру
+        keyboard = [
+            [
+                InlineKeyboardButton("🎰 Крутить еще раз", callback_data="slots_spin"),
+                InlineKeyboardButton("🔙 В меню", callback_data="back_to_menu")
             ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.message.edit_text("Выберите игру:", reply_markup=reply_markup)
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        print(f"[DEBUG] Отправляю сообщение о результате крутилки: {game_message}")
+        await query.message.reply_text(game_message, reply_markup=reply_markup)
+        del active_games[query.from_user.id]
+    
+    # Автоигра: серия вращений одним запросом и одной проводкой
+    elif query.data.startswith("slots_auto_"):
+        try:
+            series = autoplay(query.from_user.id, SLOTS_MIN_BET, bet_games(query.data), user["balance"],
+                              stop_on_win=SLOTS_MIN_BET * SLOTS_AUTOPLAY_STOP_MULTIPLIER)
+        except ValueError as e:
+            await query.message.reply_text(str(e))
+            return
+        if not series["rounds"]:
+            await query.message.reply_text("Недостаточно средств для игры!")
+            return
+        new_balance = await ledger.settle_series(query.from_user.id, "slots", series["rounds"],
+                                                 settlement_key(query, query.from_user.id))
+        if new_balance is None:
+            await query.message.reply_text("Недостаточно средств для игры!")
+            return
+        game_message = "🎰 Крутилка: автоигра\n\n"
+        if isinstance(new_balance, Replayed):
+            # Повтор callback: серия уже проведена, показываем ее по записанным сессиям
+            if not new_balance.sessions:
+                await query.message.reply_text(replayed_text(new_balance))
+                return
+            symbols = new_balance.sessions[-1]["outcome"]["symbols"]
+            game_message += f"Эта серия уже проведена, вращений: {len(new_balance.sessions)}\n"
+            game_message += f"Последнее: {symbols[0]} | {symbols[1]} | {symbols[2]}\n"
+            game_message += f"Итог: {new_balance.result:+} монет, баланс: {new_balance.balance} монет"
+        else:
+            summary = autoplay_summary(series)
+            symbols = summary["last_symbols"]
+            game_message += f"Вращений: {summary['spins']} по {SLOTS_MIN_BET} монет, выигрышных: {summary['wins']}\n"
+            game_message += f"Последнее: {symbols[0]} | {symbols[1]} | {symbols[2]}\n"
+            game_message += f"Лучший выигрыш: {summary['biggest_win']} монет\n"
+            game_message += f"Итог: {summary['net']:+} монет, баланс: {new_balance} монет\n"
+            game_message += f"Остановлено: {AUTOPLAY_STOP_REASONS[summary['stopped']]}"
+        keyboard = [
+            [
+                InlineKeyboardButton("🔁 Еще серию", callback_data=query.data),
+                InlineKeyboardButton("🔙 В меню", callback_data="back_to_menu")
+            ]
+        ]
+        await query.message.reply_text(game_message, reply_markup=InlineKeyboardMarkup(keyboard))
+    
+    elif query.data == "slots_exit":
+        if query.from_user.id in active_games:
+            del active_games[query.from_user.id]
+        await query.message.edit_text(
+            "Вы вышли из игры.",
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("🔙 Вернуться в меню", callback_data="back_to_menu")
+            ]])
+        )
+    
+    # Обработка действий в рулетке: выбор типа ставки
+    elif query.data.startswith("roulette_bet_"):
+        bet_type = query.data[len("roulette_bet_"):]
+        if bet_type not in ROULETTE_BET_TITLES:
+            await query.message.reply_text("Неверный тип ставки")
+            return
+        game = personal_roulette(query.from_user.id, query.message.chat_id)
+        game_message = f"🎰 Рулетка: {ROULETTE_BET_TITLES[bet_type]}\n\n"
+        game_message += roulette_bets_text(game.players.get(query.from_user.id, []))
+        keyboard = roulette_value_rows(bet_type)
+        keyboard.append([
+            InlineKeyboardButton("🔄 Спин", callback_data="roulette_spin"),
+            InlineKeyboardButton("🔙 Назад", callback_data="game_roulette")
+        ])
+        await query.message.reply_text(game_message, reply_markup=InlineKeyboardMarkup(keyboard))
+    
+    # Ставка: roulette_number_<тип>:<значение>, без типа - ставка на число
+    elif query.data.startswith("roulette_number_"):
+        bet_type, _, bet_value = query.data[len("roulette_number_"):].rpartition(":")
+        bet = Bet(bet_type=bet_type or "number", value=bet_value, amount=ROULETTE_MIN_BET)
+        game = personal_roulette(query.from_user.id, query.message.chat_id)
+        staked = sum(placed.amount for placed in game.players.get(query.from_user.id, []))
+        if staked + bet.amount > user["balance"]:
+            await query.message.reply_text("Недостаточно монет для этой ставки")
+            return
+        success, msg = game.place_bet(query.from_user.id, bet)
+        if not success:
+            await query.message.reply_text(msg)
+            return
         
-        elif query.data.startswith("game_"):
-            game_type = query.data.split("_")[1]
-            if game_type == "blackjack":
-                # Существующая логика для блэкджека
-                keyboard = [
-                    [
-                        InlineKeyboardButton("🎮 Одиночная игра", callback_data="blackjack_single"),
-                        InlineKeyboardButton("👥 Мультиплеер", callback_data="blackjack_multi")
-                    ],
-                    [
-                        InlineKeyboardButton("🔙 Вернуться в меню", callback_data="back_to_menu")
-                    ]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await query.message.edit_text("Выберите режим игры:", reply_markup=reply_markup)
-            elif game_type == "slots":
-                game = SlotsGame(game_mode="single", chat_id=query.message.chat_id)
-                username = query.from_user.username or query.from_user.first_name
-                success, message = game.add_player(query.from_user.id, SLOTS_MIN_BET, username)
-                if not success:
-                    await query.message.reply_text(message)
-                    return
-                success, message = game.start_game()
-                if not success:
-                    await query.message.reply_text(message)
-                    return
-                active_games[query.from_user.id] = game
-                keyboard = [
-                    [InlineKeyboardButton("🎰 Крутить", callback_data="slots_spin")],
-                    [InlineKeyboardButton("🔙 Выйти из игры", callback_data="slots_exit")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await query.message.edit_text(
-                    f"Игра началась!\n\n{game.get_game_state()}",
-                    reply_markup=reply_markup
-                )
-            elif game_type == "roulette":
-                game = RouletteGame(game_mode="single", chat_id=query.message.chat_id)
-                username = query.from_user.username or query.from_user.first_name
-                success, message = game.add_player(query.from_user.id, ROULETTE_MIN_BET, username)
-                if not success:
-                    await query.message.reply_text(message)
-                    return
-                success, message = game.start_game()
-                if not success:
-                    await query.message.reply_text(message)
-                    return
-                active_games[query.from_user.id] = game
-                keyboard = [
-                    [InlineKeyboardButton("🔴 Красное", callback_data="roulette_bet_red"),
-                     InlineKeyboardButton("⚫ Черное", callback_data="roulette_bet_black")],
-                    [InlineKeyboardButton("2️⃣ Четное", callback_data="roulette_bet_even"),
-                     InlineKeyboardButton("1️⃣ Нечетное", callback_data="roulette_bet_odd")],
-                    [InlineKeyboardButton("🎲 Крутить", callback_data="roulette_spin")],
-                    [InlineKeyboardButton("🔙 Выйти из игры", callback_data="roulette_exit")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await query.message.edit_text(
-                    f"Игра началась!\n\n{game.get_game_state()}",
-                    reply_markup=reply_markup
-                )
+        # Обновляем персональное сообщение игрока
+        personal_message = "🎰 Рулетка\n\n" + roulette_bets_text(game.players[query.from_user.id])
+        await query.message.edit_text(text=personal_message, reply_markup=query.message.reply_markup)
+    
+    # Одно вращение и одна проводка на все ставки игрока
+    elif query.data == "roulette_spin":
+        game = active_games.get(query.from_user.id)
+        if not isinstance(game, RouletteGame) or not game.players.get(query.from_user.id):
+            await query.message.reply_text("Сделайте хотя бы одну ставку!")
+            return
+        del active_games[query.from_user.id]
+        results = game.spin()
+        number = game.current_number
+        players = game.session_players(results)
+        balances = await ledger.settle_round("roulette", players, {"number": number, "fair": game.fairness()},
+                                             f"tg:{query.id}")
+        result = results[query.from_user.id]
+        balance = balances.get(query.from_user.id)
+        if isinstance(balance, Replayed):
+            # Повтор callback: раунд уже проведен, показываем его исход
+            outcome = replayed_outcome(balance)
+            if outcome is None:
+                await query.message.reply_text(replayed_text(balance))
+                return
+            number, result, balance = outcome["number"], balance.result, balance.balance
         
-        # Крутилка (слоты)
-        elif query.data == "slots_spin":
-            game = active_games.get(query.from_user.id)
-            chat_id = query.message.chat_id
-            if not game:
-                game = SlotsGame()
-                active_games[query.from_user.id] = game
-            # Добавляем игрока и стартуем игру перед spin
-            add_ok, add_msg = game.add_player(query.from_user.id, SLOTS_MIN_BET, query.from_user.username or query.from_user.first_name)
-            if not add_ok:
-                print(f"[ERROR] Не удалось добавить игрока в крутилку: {add_msg}")
-            start_ok, start_msg = game.start_game()
-            if not start_ok:
-                print(f"[ERROR] Не удалось стартовать игру в крутилке: {start_msg}")
-            # Проверяем баланс
-            if user.balance < SLOTS_MIN_BET:
-                await query.message.reply_text("Недостаточно средств для игры!")
+        personal_result = "🎲 Результаты:\n\n"
+        personal_result += f"Выпало число: {COLOR_EMOJI[number_color(number)]} {number}\n\n"
+        personal_result += roulette_bets_text(game.players[query.from_user.id])
+        if balance is None:
+            personal_result += "\nСтавки не приняты: недостаточно монет"
+        else:
+            personal_result += f"\nИтого: {'+' if result > 0 else ''}{result} монет\n"
+            personal_result += f"Ваш баланс: {balance} монет"
+        keyboard = [[
+            InlineKeyboardButton("🔄 Играть снова", callback_data="game_roulette"),
+            InlineKeyboardButton("🔙 В меню", callback_data="back_to_menu")
+        ]]
+        await query.message.reply_text(personal_result, reply_markup=InlineKeyboardMarkup(keyboard))
+    
+    elif query.data == "roulette_exit" or query.data == "roulette_menu":
+        if query.from_user.id in active_games:
+            del active_games[query.from_user.id]
+        await query.message.edit_text(
+            "Вы вышли из игры.",
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("🔙 Вернуться в меню", callback_data="back_to_menu")
+            ]])
+        )
+
+# Рулетка: ставки всех типов
+
+COLOR_EMOJI = {"red": "🔴", "black": "⚫", "green": "🟢"}
+
+# Типы ставок в меню; внешние ставки собраны на одном экране
+ROULETTE_BET_TITLES = {
+    "number": "🔢 Число",
+    "split": "➗ Сплит",
+    "street": "🛤 Улица",
+    "corner": "⬛ Угол",
+    "six_line": "📏 Линия",
+    "neighbours": "🎡 Соседи",
+    "outside": "🔴⚫ Внешние"
+}
+
+OUTSIDE_BET_LABELS = {
+    ("color", "red"): "🔴 Красное",
+    ("color", "black"): "⚫ Черное",
+    ("even_odd", "even"): "Четное",
+    ("even_odd", "odd"): "Нечетное",
+    ("high_low", "low"): "1-18",
+    ("high_low", "high"): "19-36",
+    ("dozen", "first"): "1-12",
+    ("dozen", "second"): "13-24",
+    ("dozen", "third"): "25-36",
+    ("column", "first"): "1-я колонка",
+    ("column", "second"): "2-я колонка",
+    ("column", "third"): "3-я колонка"
+}
+
+def personal_roulette(user_id: int, chat_id: int) -> RouletteGame:
+    """Одиночная рулетка игрока: ставки копятся до вращения"""
+    game = active_games.get(user_id)
+    if not isinstance(game, RouletteGame):
+        game = RouletteGame(game_mode="single", chat_id=chat_id)
+        game.add_player(user_id, ROULETTE_MIN_BET)
+        game.start_game()
+        active_games[user_id] = game
+    return game
+
+def roulette_type_rows() -> list:
+    """Кнопки выбора типа ставки, вращения и выхода"""
+    titles = list(ROULETTE_BET_TITLES.items())
+    rows = [
+        [InlineKeyboardButton(title, callback_data=f"roulette_bet_{bet_type}") for bet_type, title in titles[i:i + 2]]
+        for i in range(0, len(titles), 2)
+    ]
+    rows.append([InlineKeyboardButton("🎲 Крутить", callback_data="roulette_spin")])
+    rows.append([InlineKeyboardButton("🔙 Выйти из игры", callback_data="roulette_exit")])
+    return rows
+
+def roulette_value_rows(bet_type: str) -> list:
+    """Сетка значений ставки: кнопка ставит ROULETTE_MIN_BET (roulette_number_<тип>:<значение>)"""
+    if bet_type == "outside":
+        buttons = [InlineKeyboardButton(label, callback_data=f"roulette_number_{kind}:{value}")
+                   for (kind, value), label in OUTSIDE_BET_LABELS.items()]
+        per_row = 2
+    else:
+        values = BET_OPTIONS[bet_type]
+        # Линию подписываем крайними числами, остальное - как есть
+        labels = [f"{value.split('-')[0]}-{value.split('-')[-1]}" if bet_type == "six_line" else value for value in values]
+        buttons = [InlineKeyboardButton(label, callback_data=f"roulette_number_{bet_type}:{value}")
+                   for label, value in zip(labels, values)]
+        per_row = 3 if bet_type in ("number", "street") else 4
+    return [buttons[i:i + per_row] for i in range(0, len(buttons), per_row)]
+
+def roulette_bets_text(bets) -> str:
+    if not bets:
+        return "Ставок пока нет\n"
+    return "Ваши ставки:\n" + "".join(f"• {bet.amount} монет на {bet.bet_type} {bet.value}\n" for bet in bets)
+
+# Общие столы рулетки
+
+def roulette_table_view(table: RouletteTable, user_id: int):
+    """Состояние стола для игрока и кнопки ставок"""
+    text = f"{table.title}\nСтавка: {ROULETTE_MIN_BET} монет за нажатие\n\n"
+    if table.round is None:
+        text += "Раунд откроется первой ставкой"
+    else:
+        text += f"До вращения: {math.ceil(table.seconds_left())} сек., игроков: {len(table.round.players)}"
+        bets = table.round.players.get(user_id, [])
+        if bets:
+            text += "\n\nВаши ставки:\n" + "\n".join(f"• {bet.amount} монет на {bet.bet_type} {bet.value}" for bet in bets)
+    keyboard = [
+        [InlineKeyboardButton(label, callback_data=f"roulette_tbet_{table.table_id}_{name}")]
+        for name, label in QUICK_BET_LABELS.items()
+    ]
+    keyboard.append([
+        InlineKeyboardButton("🔄 Обновить", callback_data=f"roulette_table_{table.table_id}"),
+        InlineKeyboardButton("« Назад", callback_data="roulette_menu")
+    ])
+    return text, InlineKeyboardMarkup(keyboard)
+
+async def close_roulette_table(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Закрыть раунд стола по таймеру: одно вращение, одна проводка на всех, результаты игрокам"""
+    table = roulette_tables[context.job.data]
+    game, results, chats = table.close_round()
+    if game is None or not results:
+        return
+    number = game.current_number
+    fair = game.fairness()
+    players = game.session_players(results)
+    try:
+        balances = await ledger.settle_round("roulette", players, {"number": number, "fair": fair},
+                                             f"table:{table.table_id}:{fair['commitment'][:16]}")
+    except Exception as e:
+        logger.error(f"Не удалось провести раунд стола {table.table_id}, раунд аннулирован: {e}")
+        logger.error(traceback.format_exc())
+        table.void_round(game)
+        await notify_voided_round(context, table, chats)
+        return
+    logger.info(f"Стол {table.table_id}: раунд {table.rounds_played}, выпало {number}, игроков {len(players)}")
+
+    color = COLOR_EMOJI[number_color(number)]
+    keyboard = InlineKeyboardMarkup([[
+        InlineKeyboardButton("🔄 Играть снова", callback_data=f"roulette_table_{table.table_id}"),
+        InlineKeyboardButton("🔙 В меню", callback_data="back_to_menu")
+    ]])
+    for player in players:
+        chat_id = chats.get(player["user_id"])
+        if chat_id is None:
+            continue
+        text = f"{table.title}\n🎲 Выпало: {color} {number}\n\n"
+        balance = balances.get(player["user_id"])
+        if isinstance(balance, Replayed):
+            balance = balance.balance
+        if balance is None:
+            text += "Ставки не приняты: недостаточно монет"
+        else:
+            text += f"Итого: {player['result']:+} монет\nВаш баланс: {balance} монет"
+        try:
+            await context.bot.send_message(chat_id, text, reply_markup=keyboard)
+        except Exception as e:
+            logger.error(f"Не удалось отправить результат стола игроку {player['user_id']}: {e}")
+
+async def notify_voided_round(context: ContextTypes.DEFAULT_TYPE, table: RouletteTable, chats: dict) -> None:
+    """Сообщить игрокам аннулированного раунда, что ставки не списаны и их можно повторить"""
+    keyboard = InlineKeyboardMarkup([[
+        InlineKeyboardButton("🔁 Повторить ставки", callback_data=f"roulette_tretry_{table.table_id}"),
+        InlineKeyboardButton("🔙 В меню", callback_data="back_to_menu")
+    ]])
+    text = (f"{table.title}\n⚠️ Раунд не состоялся: вращение не засчитано, ставки не списаны.\n"
+            f"Ставки сохранены, их можно повторить в следующем раунде.")
+    for user_id, chat_id in chats.items():
+        try:
+            await context.bot.send_message(chat_id, text, reply_markup=keyboard)
+        except Exception as e:
+            logger.error(f"Не удалось сообщить игроку {user_id} об аннулированном раунде стола: {e}")
+
+# Подсказка 21: действие по готовым таблицам EV
+
+HINT_ACTIONS = {"stand": "✋ Стоп", "hit": "🎴 Взять карту", "double": "💰 Удвоить"}
+
+def blackjack_action_rows() -> list:
+    """Кнопки хода в 21 (с подсказкой, если она включена)"""
+    rows = [
+        [
+            InlineKeyboardButton("🎴 Взять карту", callback_data="blackjack_hit"),
+            InlineKeyboardButton("✋ Стоп", callback_data="blackjack_stand")
+        ],
+        [
+            InlineKeyboardButton("💰 Удвоить", callback_data="blackjack_double")
+        ]
+    ]
+    if BLACKJACK_HINTS:
+        rows[1].append(InlineKeyboardButton("💡 Подсказка", callback_data="blackjack_hint"))
+    return rows
+
+def blackjack_hint_text(game: BlackjackGame, player) -> str:
+    tables = get_tables()
+    upcard = game.dealer.hand[0]
+    # Закрытая карта дилера игроку не видна: возвращаем ее в остаток шуза
+    composition = tables.composition_class(game.shoe, game.dealer.hand[1:])
+    evs = tables.action_evs(player, upcard, composition)
+    best = tables.best_action(player, upcard, composition)
+    text = f"💡 Подсказка: {HINT_ACTIONS[best]}\n\nОжидаемый результат на единицу ставки:\n"
+    text += "\n".join(f"{HINT_ACTIONS[action]}: {ev:+.2f}" for action, ev in evs.items())
+    return text
+
+async def blackjack_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик игры в блэкджек"""
+    query = update.callback_query
+    if query is None or query.message is None or query.from_user is None or query.data is None:
+        print("[ERROR] Некорректный callback_query в blackjack_handler")
+        return
+    await query.answer()
+    print(f"[DEBUG] blackjack_handler: callback_data={query.data}")
+    
+    user_id = query.from_user.id
+    username = query.from_user.username or query.from_user.first_name
+    chat_id = query.message.chat_id  # Получаем ID чата
+    
+    try:
+        user = await db.get_user(user_id)
+        if not user:
+            await query.message.reply_text("Ошибка: пользователь не найден")
+            return
+        
+        if user["is_banned"]:
+            await query.message.reply_text("Гетаут отсюда позорник нищий")
+            return
+        
+        if query.data == "blackjack_single":
+            logger.info(f"Начало одиночной игры для пользователя {user_id}")
+            # Создаем новую одиночную игру
+            game = BlackjackGame(game_mode="single", chat_id=chat_id)
+            success, message = game.add_player(user_id, BLACKJACK_MIN_BET, username)
+            if not success:
+                await query.message.reply_text(message)
                 return
-            # Списываем ставку
-            user.balance -= SLOTS_MIN_BET
-            session.add(Transaction(
-                user_id=query.from_user.id,
-                amount=-SLOTS_MIN_BET,
-                type=TransactionType.GAME_LOSS,
-                game_type="slots"
-            ))
-            session.commit()
-            # Крутим слоты
-            results = game.spin()
-            if query.from_user.id not in results:
-                print(f"[ERROR] Нет результата для user_id {query.from_user.id} в крутилке")
-                await query.message.reply_text("Произошла ошибка при определении результата. Попробуйте еще раз.")
-                del active_games[query.from_user.id]
+            
+            success, message = game.start_game()
+            if not success:
+                await query.message.reply_text(message)
                 return
-            symbols, win_amount = results[query.from_user.id]
-            # Формируем сообщение для текущего чата
-            game_message = "🎰 Крутилка\n\n"
-            game_message += f"Игрок: {query.from_user.username or query.from_user.first_name}\n"
-            game_message += f"Ставка: {SLOTS_MIN_BET} монет\n\n"
-            game_message += f"{symbols[0]} | {symbols[1]} | {symbols[2]}\n\n"
-            if win_amount > 0:
-                game_message += f"🎉 Поздравляем! Выигрыш: {win_amount} монет!"
-                user.balance += win_amount
-                session.add(Transaction(
-                    user_id=query.from_user.id,
-                    amount=win_amount,
-                    type=TransactionType.GAME_WIN,
-                    game_type="slots"
-                ))
-            else:
-                game_message += f"😔 К сожалению, проигрыш. Вы проиграли {SLOTS_MIN_BET} монет. Попробуйте еще раз!"
-            session.commit()
-            # Создаем клавиатуру
-            keyboard = [
+            
+            active_games[user_id] = game
+            
+            # Создаем клавиатуру для игры
+            keyboard = blackjack_action_rows() + [
                 [
-                    InlineKeyboardButton("🎰 Крутить еще раз", callback_data="slots_spin"),
-                    InlineKeyboardButton("🔙 В меню", callback_data="back_to_menu")
+                    InlineKeyboardButton("🚪 Выйти из игры", callback_data="blackjack_exit")
                 ]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
-            print(f"[DEBUG] Отправляю сообщение о результате крутилки: {game_message}")
-            await query.message.reply_text(game_message, reply_markup=reply_markup)
-            del active_games[query.from_user.id]
-        
-        elif query.data == "slots_exit":
-            if query.from_user.id in active_games:
-                del active_games[query.from_user.id]
+            
             await query.message.edit_text(
-                "Вы вышли из игры.",
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("🔙 Вернуться в меню", callback_data="back_to_menu")
-                ]])
+                f"Игра началась!\n\n{game.get_game_state()}",
+                reply_markup=reply_markup
             )
         
-        # Обработка действий в рулетке
-        elif query.data.startswith("roulette_bet_"):
-            bet_type = query.data.split("_")[2]
-            game = active_games.get(query.from_user.id)
-            chat_id = query.message.chat_id
-            
-            if not game:
-                game = RouletteGame()
-                active_games[query.from_user.id] = game
-            
-            # Создаем сообщение для текущего чата
-            game_message = "🎰 Рулетка\n\n"
-            game_message += f"Ставки игрока {query.from_user.username or query.from_user.first_name}:\n"
-            for bet in game.players.get(query.from_user.id, []):  # Используем словарь players из класса RouletteGame
-                game_message += f"• {bet.amount} монет на {bet.bet_type} {bet.value}\n"
-            
+        elif query.data == "blackjack_multi":
+            logger.info(f"Пользователь выбрал мультиплеер")
+            # Создаем клавиатуру с комнатами
             keyboard = []
-            # Добавляем кнопки для ставок
-            if bet_type == "number":
-                rows = []
-                for i in range(0, 37, 3):
-                    row = []
-                    for j in range(3):
-                        if i + j <= 36:
-                            row.append(InlineKeyboardButton(
-                                str(i + j),
-                                callback_data=f"roulette_number_{i+j}"
-                            ))
-                    rows.append(row)
-                keyboard.extend(rows)
-            elif bet_type == "color":
-                keyboard.append([
-                    InlineKeyboardButton("🔴 Красное", callback_data="roulette_color_red"),
-                    InlineKeyboardButton("⚫ Черное", callback_data="roulette_color_black")
-                ])
-            elif bet_type == "parity":
-                keyboard.append([
-                    InlineKeyboardButton("Четное", callback_data="roulette_parity_even"),
-                    InlineKeyboardButton("Нечетное", callback_data="roulette_parity_odd")
-                ])
-            
-            # Добавляем общие кнопки управления
+            # Комнаты для 2 игроков
+            keyboard.append([
+                InlineKeyboardButton("Комната 1 (2 игрока)", callback_data="blackjack_room_1_2"),
+                InlineKeyboardButton("Комната 2 (2 игрока)", callback_data="blackjack_room_2_2")
+            ])
+            # Комнаты для 3 игроков
+            keyboard.append([
+                InlineKeyboardButton("Комната 3 (3 игрока)", callback_data="blackjack_room_3_3"),
+                InlineKeyboardButton("Комната 4 (3 игрока)", callback_data="blackjack_room_4_3")
+            ])
+            # Комнаты для 4 игроков
             keyboard.append([
-                InlineKeyboardButton("🔄 Спин", callback_data="roulette_spin"),
-                InlineKeyboardButton("🔙 Назад", callback_data="roulette_menu")
+                InlineKeyboardButton("Комната 5 (4 игрока)", callback_data="blackjack_room_5_4"),
+                InlineKeyboardButton("Комната 6 (4 игрока)", callback_data="blackjack_room_6_4")
+            ])
+            # Комнаты для 5 игроков
+            keyboard.append([
+                InlineKeyboardButton("Комната 7 (5 игроков)", callback_data="blackjack_room_7_5"),
+                InlineKeyboardButton("Комната 8 (5 игроков)", callback_data="blackjack_room_8_5")
+            ])
+            # Комнаты для 6 игроков
+            keyboard.append([
+                InlineKeyboardButton("Комната 9 (6 игроков)", callback_data="blackjack_room_9_6"),
+                InlineKeyboardButton("Комната 10 (6 игроков)", callback_data="blackjack_room_10_6")
+            ])
+            keyboard.append([
+                InlineKeyboardButton("🔙 Назад", callback_data="back_to_menu")
             ])
             
             reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            # Отправляем сообщение в текущий чат
-            await query.message.reply_text(game_message, reply_markup=reply_markup)
+            await query.message.edit_text(
+                "Выберите комнату для игры:",
+                reply_markup=reply_markup
+            )
         
-        elif query.data.startswith("roulette_number_") or \
-             query.data.startswith("roulette_color_") or \
-             query.data.startswith("roulette_parity_"):
+        elif query.data.startswith("blackjack_room_"):
+            room_id = query.data.split("_")[2]
+            max_players = int(query.data.split("_")[3])
+            logger.info(f"Пользователь {user_id} пытается присоединиться к комнате {room_id}")
             
-            game = active_games.get(query.from_user.id)
-            if not game:
-                await query.message.reply_text("Вы не в игре!")
+            # Проверяем, не находится ли пользователь уже в игре
+            if user_id in active_games:
+                await query.message.reply_text("Вы уже в игре!")
                 return
             
-            bet_parts = query.data.split("_")
-            bet_type = bet_parts[1]
-            bet_value = bet_parts[2]
+            # Ищем существующую игру в этой комнате
+            game = None
+            for g in active_games.values():
+                if hasattr(g, 'room_id') and g.room_id == f"room_{room_id}_{max_players}":
+                    game = g
+                    break
             
-            # Создаем ставку с правильными типами
-            bet = Bet(
-                bet_type=bet_type,  # str
-                value=str(bet_value),  # конвертируем в str
-                amount=ROULETTE_MIN_BET  # int
-            )
-            # Передаем user_id в place_bet
-            success, msg = game.place_bet(query.from_user.id, bet)
-            if not success:
-                await query.message.reply_text(msg)
-                return
-            
-            # Обновляем персональное сообщение игрока
-            personal_message = "🎰 Рулетка\n\n"
-            personal_message += "Ваши текущие ставки:\n"
-            for bet in game.players.get(query.from_user.id, []):
-                personal_message += f"• {bet.amount} монет на {bet.bet_type} {bet.value}\n"
-            if query.message.reply_markup is not None:
-                await query.message.edit_text(
-                    text=personal_message,
-                    reply_markup=query.message.reply_markup
-                )
-            else:
-                await query.message.edit_text(
-                    text=personal_message
-                )
-        
-        elif query.data == "roulette_spin":
-            game = active_games.get(query.from_user.id)
+            # Если игры нет, создаем новую
             if not game:
-                await query.message.reply_text("Вы не в игре!")
-                return
+                room_key = f"room_{room_id}_{max_players}"
+                game = BlackjackGame(game_mode="multi", room_id=room_key, chat_id=chat_id,
+                                     shoe=room_shoes.setdefault(room_key, Shoe()))
             
-            if not game.has_bets():
-                await query.message.reply_text("Сделайте хотя бы одну ставку!")
+            # Добавляем игрока
+            success, message = game.add_player(user_id, BLACKJACK_MIN_BET, username)
+            if not success:
+                await query.message.reply_text(message)
                 return
             
-            # Крутим рулетку
-            result = game.spin()
-            
-            # Отправляем общий результат в чат
-            result_message = f"🎲 Выпало число: {result}\n"
-            if result in game.RED_NUMBERS:
-                result_message += "🔴 Красное"
-            else:
-                result_message += "⚫ Черное"
-            result_message += ", " + ("Четное" if result % 2 == 0 else "Нечетное")
+            # ВАЖНО: всем игрокам комнаты присваиваем ссылку на одну и ту же игру
+            for pid in game.players:
+                active_games[pid] = game
             
-            await query.message.reply_text(result_message)
+            # Создаем клавиатуру для ожидания
+            keyboard = [
+                [InlineKeyboardButton("🔙 Вернуться в меню комнат", callback_data="blackjack_multi")]
+            ]
+            reply_markup = InlineKeyboardMarkup(keyboard)
             
-            # Обрабатываем результаты для каждого игрока
-            results = game.process_bets(result)
-            for player_id, player_result in results.items():
-                # Обновляем баланс
-                player = session.query(User).filter(User.user_id == player_id).first()
-                if player:
-                    player.balance += player_result
-                    session.add(Transaction(
-                        user_id=player_id,
-                        amount=player_result,
-                        type=TransactionType.GAME_WIN if player_result > 0 else TransactionType.GAME_LOSS,
-                        game_type="roulette"
-                    ))
-                
-                # Отправляем персональный результат
-                personal_result = f"🎲 Результаты:\n\n"
-                personal_result += f"Выпало число: {result}\n"
-                if result in game.RED_NUMBERS:
-                    personal_result += "🔴 Красное"
-                else:
-                    personal_result += "⚫ Черное"
-                personal_result += ", " + ("Четное" if result % 2 == 0 else "Нечетное") + "\n\n"
-                
-                personal_result += "Ваши ставки:\n"
-                for bet in game.players.get(player_id, []):  # Используем словарь players из класса RouletteGame
-                    personal_result += f"• {bet.amount} монет на {bet.bet_type} {bet.value}\n"
-                
-                personal_result += f"\nИтого: {'+' if player_result > 0 else ''}{player_result} монет"
-                
-                keyboard = [[
-                    InlineKeyboardButton("🔄 Играть снова", callback_data="roulette_menu"),
-                    InlineKeyboardButton("🔙 В меню", callback_data="back_to_menu")
-                ]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+            if len(game.players) >= game.min_players:
+                success, message = game.start_game()
+                if success:
+                    # Отправляем состояние игры в текущий чат
+                    game_message = f"Игра началась! Комната {room_id}\n"
+                    game_message += f"Игроки: {', '.join(p.username for p in game.players.values())}\n\n"
+                    game_message += "Карты игроков:\n"
+                    for player in game.players.values():
+                        game_message += f"{player.username}: {' '.join(str(card) for card in player.hand)} (Счет: {player.get_score()})\n"
+                    game_message += f"\nКарты дилера: {game.dealer.hand[0]} ?\n\n"
+                    
+                    current_player = game.get_current_player()
+                    if current_player:
+                        game_message += f"Ход игрока: {current_player.username}\n\n"
+                    
+                    # Создаем клавиатуру для текущего игрока
+                    if current_player and current_player.user_id == user_id:
+                        keyboard = blackjack_action_rows()
+                    keyboard.append([InlineKeyboardButton("🚪 Выйти из игры", callback_data="blackjack_exit")])
+                    reply_markup = InlineKeyboardMarkup(keyboard)
+                    
+                    await query.message.reply_text(
+                        game_message,
+                        reply_markup=reply_markup
+                    )
+            else:
+                # Обновляем информацию о комнате
+                room_info = f"Комната {room_id} ({max_players} игроков)\n"
+                room_info += f"Ожидание игроков... ({len(game.players)}/{max_players})\n\n"
+                room_info += "Игроки в комнате:\n"
+                for player in game.players.values():
+                    room_info += f"• {player.username}\n"
                 
-                print(f"[DEBUG] Отправляю сообщение: {personal_result}")
                 await query.message.reply_text(
-                    personal_result,
+                    room_info,
                     reply_markup=reply_markup
                 )
-            
-            session.commit()
-            
-            # Очищаем игру
-            del active_games[query.from_user.id]
         
-        elif query.data == "roulette_exit" or query.data == "roulette_menu":
-            if query.from_user.id in active_games:
-                del active_games[query.from_user.id]
-            await query.message.edit_text(
-                "Вы вышли из игры.",
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("🔙 Вернуться в меню", callback_data="back_to_menu")
-                ]])
-            )
-
-async def blackjack_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработчик игры в блэкджек"""
-    query = update.callback_query
-    if query is None or query.message is None or query.from_user is None or query.data is None:
-        print("[ERROR] Некорректный callback_query в blackjack_handler")
-        return
-    await query.answer()
-    print(f"[DEBUG] blackjack_handler: callback_data={query.data}")
-    
-    user_id = query.from_user.id
-    username = query.from_user.username or query.from_user.first_name
-    chat_id = query.message.chat_id  # Получаем ID чата
-    
-    try:
-        with get_db() as session:
-            user = session.query(User).filter(User.user_id == user_id).first()
-            if not user:
-                await query.message.reply_text("Ошибка: пользователь не найден")
+        elif query.data == "blackjack_hint":
+            game = active_games.get(user_id)
+            if not game or user_id not in game.players or not game.game_started:
+                await query.message.reply_text("Вы не в игре!")
                 return
+            player = game.players[user_id]
+            if player.is_standing:
+                await query.message.reply_text("Вы уже остановились")
+                return
+            await query.message.reply_text(blackjack_hint_text(game, player))
+        
+        elif query.data in ["blackjack_hit", "blackjack_stand", "blackjack_double"]:
+            logger.info(f"Действие в игре: {query.data} от пользователя {user_id}")
             
-            if user and getattr(user, 'is_banned', 0):
-                await query.message.reply_text("Гетаут отсюда позорник нищий")
+            game = active_games.get(user_id)
+            if not game or user_id not in game.players:
+                await query.message.reply_text("Вы не в игре!")
                 return
             
-            if query.data == "blackjack_single":
-                logger.info(f"Начало одиночной игры для пользователя {user_id}")
-                # Создаем новую одиночную игру
-                game = BlackjackGame(game_mode="single", chat_id=chat_id)
-                success, message = game.add_player(user_id, BLACKJACK_MIN_BET, username)
-                if not success:
-                    await query.message.reply_text(message)
-                    return
-                
-                success, message = game.start_game()
-                if not success:
-                    await query.message.reply_text(message)
-                    return
-                
-                active_games[user_id] = game
-                
-                # Создаем клавиатуру для игры
-                keyboard = [
-                    [
-                        InlineKeyboardButton("🎴 Взять карту", callback_data="blackjack_hit"),
-                        InlineKeyboardButton("✋ Стоп", callback_data="blackjack_stand")
-                    ],
-                    [
-                        InlineKeyboardButton("💰 Удвоить", callback_data="blackjack_double")
-                    ],
-                    [
-                        InlineKeyboardButton("🚪 Выйти из игры", callback_data="blackjack_exit")
-                    ]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await query.message.edit_text(
-                    f"Игра началась!\n\n{game.get_game_state()}",
-                    reply_markup=reply_markup
-                )
+            current_player = game.get_current_player()
+            if not current_player or current_player.user_id != user_id:
+                await query.message.reply_text("Сейчас не ваш ход!")
+                return
             
-            elif query.data == "blackjack_multi":
-                logger.info(f"Пользователь выбрал мультиплеер")
-                # Создаем клавиатуру с комнатами
-                keyboard = []
-                # Комнаты для 2 игроков
-                keyboard.append([
-                    InlineKeyboardButton("Комната 1 (2 игрока)", callback_data="blackjack_room_1_2"),
-                    InlineKeyboardButton("Комната 2 (2 игрока)", callback_data="blackjack_room_2_2")
-                ])
-                # Комнаты для 3 игроков
-                keyboard.append([
-                    InlineKeyboardButton("Комната 3 (3 игрока)", callback_data="blackjack_room_3_3"),
-                    InlineKeyboardButton("Комната 4 (3 игрока)", callback_data="blackjack_room_4_3")
-                ])
-                # Комнаты для 4 игроков
-                keyboard.append([
-                    InlineKeyboardButton("Комната 5 (4 игрока)", callback_data="blackjack_room_5_4"),
-                    InlineKeyboardButton("Комната 6 (4 игрока)", callback_data="blackjack_room_6_4")
-                ])
-                # Комнаты для 5 игроков
-                keyboard.append([
-                    InlineKeyboardButton("Комната 7 (5 игроков)", callback_data="blackjack_room_7_5"),
-                    InlineKeyboardButton("Комната 8 (5 игроков)", callback_data="blackjack_room_8_5")
-                ])
-                # Комнаты для 6 игроков
-                keyboard.append([
-                    InlineKeyboardButton("Комната 9 (6 игроков)", callback_data="blackjack_room_9_6"),
-                    InlineKeyboardButton("Комната 10 (6 игроков)", callback_data="blackjack_room_10_6")
-                ])
-                keyboard.append([
-                    InlineKeyboardButton("🔙 Назад", callback_data="back_to_menu")
-                ])
-                
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await query.message.edit_text(
-                    "Выберите комнату для игры:",
-                    reply_markup=reply_markup
-                )
+            # Выполняем действие
+            if query.data == "blackjack_hit":
+                success, message = game.hit(user_id)
+            elif query.data == "blackjack_stand":
+                success, message = game.stand(user_id)
+            else:  # blackjack_double
+                success, message = game.double(user_id)
             
-            elif query.data.startswith("blackjack_room_"):
-                room_id = query.data.split("_")[2]
-                max_players = int(query.data.split("_")[3])
-                logger.info(f"Пользователь {user_id} пытается присоединиться к комнате {room_id}")
-                
-                # Проверяем, не находится ли пользователь уже в игре
-                if user_id in active_games:
-                    await query.message.reply_text("Вы уже в игре!")
-                    return
-                
-                # Ищем существующую игру в этой комнате
-                game = None
-                for g in active_games.values():
-                    if hasattr(g, 'room_id') and g.room_id == f"room_{room_id}_{max_players}":
-                        game = g
-                        break
-                
-                # Если игры нет, создаем новую
-                if not game:
-                    game = BlackjackGame(game_mode="multi", room_id=f"room_{room_id}_{max_players}", chat_id=chat_id)
-                
-                # Добавляем игрока
-                success, message = game.add_player(user_id, BLACKJACK_MIN_BET, username)
-                if not success:
-                    await query.message.reply_text(message)
-                    return
-                
-                # ВАЖНО: всем игрокам комнаты присваиваем ссылку на одну и ту же игру
-                for pid in game.players:
-                    active_games[pid] = game
-                
-                # Создаем клавиатуру для ожидания
-                keyboard = [
-                    [InlineKeyboardButton("🔙 Вернуться в меню комнат", callback_data="blackjack_multi")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                if len(game.players) >= game.min_players:
-                    success, message = game.start_game()
-                    if success:
-                        # Отправляем состояние игры в текущий чат
-                        game_message = f"Игра началась! Комната {room_id}\n"
-                        game_message += f"Игроки: {', '.join(p.username for p in game.players.values())}\n\n"
-                        game_message += "Карты игроков:\n"
-                        for player in game.players.values():
-                            game_message += f"{player.username}: {' '.join(str(card) for card in player.hand)} (Счет: {player.get_score()})\n"
-                        game_message += f"\nКарты дилера: {game.dealer.hand[0]} ?\n\n"
-                        
-                        current_player = game.get_current_player()
-                        if current_player:
-                            game_message += f"Ход игрока: {current_player.username}\n\n"
-                        
-                        # Создаем клавиатуру для текущего игрока
-                        if current_player and current_player.user_id == user_id:
-                            keyboard = [
-                                [
-                                    InlineKeyboardButton("🎴 Взять карту", callback_data="blackjack_hit"),
-                                    InlineKeyboardButton("✋ Стоп", callback_data="blackjack_stand")
-                                ],
-                                [
-                                    InlineKeyboardButton("💰 Удвоить", callback_data="blackjack_double")
-                                ]
-                            ]
-                        keyboard.append([InlineKeyboardButton("🚪 Выйти из игры", callback_data="blackjack_exit")])
-                        reply_markup = InlineKeyboardMarkup(keyboard)
-                        
-                        await query.message.reply_text(
-                            game_message,
-                            reply_markup=reply_markup
-                        )
-                else:
-                    # Обновляем информацию о комнате
-                    room_info = f"Комната {room_id} ({max_players} игроков)\n"
-                    room_info += f"Ожидание игроков... ({len(game.players)}/{max_players})\n\n"
-                    room_info += "Игроки в комнате:\n"
-                    for player in game.players.values():
-                        room_info += f"• {player.username}\n"
-                    
+            if not success:
+                await query.message.reply_text(message)
+                return
+            
+            # Обновляем состояние игры
+            if game.is_game_over():
+                logger.info("Игра завершена, подсчет результатов")
+                results = game.finish_game()
+                # Балансы игроков и сессия - одна операция журнала с ключом callback
+                balances = await ledger.settle_round("blackjack", [
+                    {"user_id": player_id, "bet": game.players[player_id].bet, "result": result}
+                    for player_id, result in results.items()
+                ], {"dealer_score": game.dealer.get_score(), "fair": game.fairness()}, f"tg:{query.id}")
+                # При повторе callback показываем уже проведенные результаты
+                results = {
+                    player_id: balance.result if isinstance(balance, Replayed) else results[player_id]
+                    for player_id, balance in balances.items()
+                }
+                # Формируем и отправляем персональное сообщение каждому игроку
+                for player_id, result in results.items():
+                    player = game.players[player_id]
+                    personal_result = f"Игра завершена!\n\n"
+                    personal_result += f"Ваши карты: {' '.join(str(card) for card in player.hand)}\n"
+                    personal_result += f"Ваш счет: {player.get_score()}\n"
+                    personal_result += f"Ваш результат: {'+' if result > 0 else ''}{result} монет\n\n"
+                    personal_result += f"Карты дилера: {' '.join(str(card) for card in game.dealer.hand)}\n"
+                    personal_result += f"Счет дилера: {game.dealer.get_score()}\n\n"
+                    # Общий результат по всем игрокам
+                    personal_result += "Результаты всех игроков:\n"
+                    for pid, res in results.items():
+                        p = game.players[pid]
+                        personal_result += f"{p.username}: {'+' if res > 0 else ''}{res} монет\n"
+                    keyboard = [[
+                        InlineKeyboardButton("🔙 Вернуться в меню", callback_data="back_to_menu")
+                    ]]
+                    reply_markup = InlineKeyboardMarkup(keyboard)
+                    print(f"[DEBUG] Отправляю сообщение: {personal_result}")
                     await query.message.reply_text(
-                        room_info,
+                        personal_result,
                         reply_markup=reply_markup
                     )
-            
-            elif query.data in ["blackjack_hit", "blackjack_stand", "blackjack_double"]:
-                logger.info(f"Действие в игре: {query.data} от пользователя {user_id}")
-                
-                game = active_games.get(user_id)
-                if not game or user_id not in game.players:
-                    await query.message.reply_text("Вы не в игре!")
-                    return
-                
-                current_player = game.get_current_player()
-                if not current_player or current_player.user_id != user_id:
-                    await query.message.reply_text("Сейчас не ваш ход!")
-                    return
-                
-                # Выполняем действие
-                if query.data == "blackjack_hit":
-                    success, message = game.hit(user_id)
-                elif query.data == "blackjack_stand":
-                    success, message = game.stand(user_id)
-                else:  # blackjack_double
-                    success, message = game.double(user_id)
-                
-                if not success:
-                    await query.message.reply_text(message)
-                    return
-                
-                # Обновляем состояние игры
-                if game.is_game_over():
-                    logger.info("Игра завершена, подсчет результатов")
-                    results = game.finish_game()
-                    # Обновляем балансы игроков
-                    for player_id, result in results.items():
-                        player = session.query(User).filter(User.user_id == player_id).first()
-                        if player:
-                            player.balance += result
-                            session.add(Transaction(
-                                user_id=player_id,
-                                amount=result,
-                                type=TransactionType.GAME_WIN if result > 0 else TransactionType.GAME_LOSS,
-                                game_type="blackjack"
-                            ))
-                    session.commit()
-                    # Формируем и отправляем персональное сообщение каждому игроку
-                    for player_id, result in results.items():
-                        player = game.players[player_id]
-                        personal_result = f"Игра завершена!\n\n"
-                        personal_result += f"Ваши карты: {' '.join(str(card) for card in player.hand)}\n"
-                        personal_result += f"Ваш счет: {player.get_score()}\n"
-                        personal_result += f"Ваш результат: {'+' if result > 0 else ''}{result} монет\n\n"
-                        personal_result += f"Карты дилера: {' '.join(str(card) for card in game.dealer.hand)}\n"
-                        personal_result += f"Счет дилера: {game.dealer.get_score()}\n\n"
-                        # Общий результат по всем игрокам
-                        personal_result += "Результаты всех игроков:\n"
-                        for pid, res in results.items():
-                            p = game.players[pid]
-                            personal_result += f"{p.username}: {'+' if res > 0 else ''}{res} монет\n"
-                        keyboard = [[
-                            InlineKeyboardButton("🔙 Вернуться в меню", callback_data="back_to_menu")
-                        ]]
-                        reply_markup = InlineKeyboardMarkup(keyboard)
-                        print(f"[DEBUG] Отправляю сообщение: {personal_result}")
-                        await query.message.reply_text(
-                            personal_result,
-                            reply_markup=reply_markup
-                        )
-                    # Удаляем игру у всех участников
-                    for pid in list(active_games.keys()):
-                        if active_games.get(pid) is game:
-                            del active_games[pid]
-                else:
-                    # Обновляем состояние для всех игроков
-                    for player_id, player in game.players.items():
-                        # Формируем персональное состояние для игрока
-                        player_state = f"Ваши карты: {' '.join(str(card) for card in player.hand)}\n"
-                        player_state += f"Ваш счет: {player.get_score()}\n"
-                        player_state += f"Ваша ставка: {player.bet}\n\n"
-                        player_state += f"Карты дилера: {game.dealer.hand[0]} ?\n\n"
-                        
-                        current = game.get_current_player()
-                        if current:
-                            if current.user_id == player_id:
-                                player_state += "Сейчас ваш ход!"
-                            else:
-                                player_state += f"Ход игрока: {current.username}"
-                        
-                        # Создаем клавиатуру (активную только для текущего игрока)
-                        keyboard = []
-                        if current and current.user_id == player_id:
-                            keyboard = [
-                                [
-                                    InlineKeyboardButton("🎴 Взять карту", callback_data="blackjack_hit"),
-                                    InlineKeyboardButton("✋ Стоп", callback_data="blackjack_stand")
-                                ],
-                                [
-                                    InlineKeyboardButton("💰 Удвоить", callback_data="blackjack_double")
-                                ]
-                            ]
-                        keyboard.append([InlineKeyboardButton("🚪 Выйти из игры", callback_data="blackjack_exit")])
-                        reply_markup = InlineKeyboardMarkup(keyboard)
-                        
-                        await query.message.reply_text(
-                            player_state,
-                            reply_markup=reply_markup
-                        )
+                # Удаляем игру у всех участников
+                for pid in list(active_games.keys()):
+                    if active_games.get(pid) is game:
+                        del active_games[pid]
+            else:
+                # Обновляем состояние для всех игроков
+                for player_id, player in game.players.items():
+                    # Формируем персональное состояние для игрока
+                    player_state = f"Ваши карты: {' '.join(str(card) for card in player.hand)}\n"
+                    player_state += f"Ваш счет: {player.get_score()}\n"
+                    player_state += f"Ваша ставка: {player.bet}\n\n"
+                    player_state += f"Карты дилера: {game.dealer.hand[0]} ?\n\n"
+                    
+                    current = game.get_current_player()
+                    if current:
+                        if current.user_id == player_id:
+                            player_state += "Сейчас ваш ход!"
+                        else:
+                            player_state += f"Ход игрока: {current.username}"
+                    
+                    # Создаем клавиатуру (активную только для текущего игрока)
+                    keyboard = []
+                    if current and current.user_id == player_id:
+                        keyboard = blackjack_action_rows()
+                    keyboard.append([InlineKeyboardButton("🚪 Выйти из игры", callback_data="blackjack_exit")])
+                    reply_markup = InlineKeyboardMarkup(keyboard)
                     
-                    # Отправляем общее состояние в чат
                     await query.message.reply_text(
-                        f"Ход игрока: {current_player.username}"
+                        player_state,
+                        reply_markup=reply_markup
                     )
-    
+                
+                # Отправляем общее состояние в чат
+                await query.message.reply_text(
+                    f"Ход игрока: {current_player.username}"
+                )
+
     except Exception as e:
         logger.error(f"Ошибка в блэкджеке: {e}")
         logger.error(traceback.format_exc())
@@ -879,29 +1115,51 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "- Разные типы ставок\n\n"
         "🏆 /leaderboard - Таблица лидеров\n"
         "💰 /balance - Проверить баланс\n"
+        "📊 /stats - Статистика по играм\n"
         "/start - Главное меню\n"
         "/help - Это сообщение"
     )
     await update.message.reply_text(help_text)
 
 async def leaderboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    with get_db() as session:
-        top_users = session.query(User).order_by(User.balance.desc()).limit(10).all()
-        leaderboard_text = "🏆 Таблица лидеров:\n\n"
-        for i, user in enumerate(top_users, 1):
-            leaderboard_text += f"{i}. {user.username}: {user.balance} монет\n"
-        await update.message.reply_text(leaderboard_text)
+    user_id = update.effective_user.id if update.effective_user else None
+    await update.message.reply_text(get_leaderboard_text(user_id))
+
+# Названия игр для статистики
+GAME_TITLES = {
+    "slots": "🎰 Крутилка",
+    "roulette": "🎲 Рулетка",
+    "blackjack": "🃏 21"
+}
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not update.effective_user or not update.message:
+        return
+    stats = await db.get_user_stats(update.effective_user.id)
+    if not stats:
+        await update.message.reply_text("Пользователь не найден. Используйте /start")
+        return
+    stats_text = "📊 Ваша статистика:\n\n"
+    stats_text += f"Баланс: {stats['balance']} монет\n"
+    stats_text += f"Сыграно игр: {stats['games_played']}, побед: {stats['wins']}\n"
+    for game_type, game_stats in stats["by_game"].items():
+        stats_text += (
+            f"\n{GAME_TITLES.get(game_type, game_type)}:\n"
+            f"- Игр: {game_stats['games']} (побед: {game_stats['wins']}, поражений: {game_stats['losses']})\n"
+            f"- Поставлено: {game_stats['wagered']}, выиграно: {game_stats['won']}\n"
+            f"- Крупнейший выигрыш: {game_stats['biggest_win']}\n"
+        )
+    await update.message.reply_text(stats_text)
 
 async def balance_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not update.effective_user or not update.message:
         return
     user_id = update.effective_user.id
-    with get_db() as session:
-        user = session.query(User).filter(User.user_id == user_id).first()
-        if user:
-            await update.message.reply_text(f"Ваш баланс: {user.balance} монет")
-        else:
-            await update.message.reply_text("Пользователь не найден. Используйте /start")
+    user = await db.get_user(user_id)
+    if user:
+        await update.message.reply_text(f"Ваш баланс: {user['balance']} монет")
+    else:
+        await update.message.reply_text("Пользователь не найден. Используйте /start")
 
 async def addmoney_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not update.effective_user or not update.message:
@@ -919,14 +1177,15 @@ async def addmoney_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     except (ValueError, TypeError):
         await update.message.reply_text("Сумма должна быть числом.")
         return
-    with get_db() as session:
-        target_user = session.query(User).filter(User.username == target_username).first()
-        if not target_user:
-            await update.message.reply_text("Пользователь не найден.")
-            return
-        target_user.balance += amount
-        session.commit()
-        await update.message.reply_text(f"Пользователю @{target_username} начислено {amount} монет. Новый баланс: {target_user.balance}")
+    target_id = await db.get_user_id_by_username(target_username)
+    if target_id is None:
+        await update.message.reply_text("Пользователь не найден.")
+        return
+    new_balance = await db.change_balance(target_id, amount, TransactionType.DEPOSIT)
+    if new_balance is None:
+        await update.message.reply_text("Баланс не может стать отрицательным.")
+        return
+    await update.message.reply_text(f"Пользователю @{target_username} начислено {amount} монет. Новый баланс: {new_balance}")
 
 async def ban_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not update.effective_user or not update.message:
@@ -939,14 +1198,10 @@ async def ban_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         await update.message.reply_text("Использование: /ban <username>")
         return
     target_username = context.args[0].lstrip('@')
-    with get_db() as session:
-        target_user = session.query(User).filter(User.username == target_username).first()
-        if not target_user:
-            await update.message.reply_text("Пользователь не найден.")
-            return
-        target_user.is_banned = 1
-        session.commit()
-        await update.message.reply_text(f"Пользователь @{target_username} забанен.")
+    if not await db.set_user_banned(target_username, True):
+        await update.message.reply_text("Пользователь не найден.")
+        return
+    await update.message.reply_text(f"Пользователь @{target_username} забанен.")
 
 async def unban_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not update.effective_user or not update.message:
@@ -959,14 +1214,41 @@ async def unban_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         await update.message.reply_text("Использование: /unban <username>")
         return
     target_username = context.args[0].lstrip('@')
-    with get_db() as session:
-        target_user = session.query(User).filter(User.username == target_username).first()
-        if not target_user:
-            await update.message.reply_text("Пользователь не найден.")
-            return
-        target_user.is_banned = 0
-        session.commit()
-        await update.message.reply_text(f"Пользователь @{target_username} разбанен.")
+    if not await db.set_user_banned(target_username, False):
+        await update.message.reply_text("Пользователь не найден.")
+        return
+    await update.message.reply_text(f"Пользователь @{target_username} разбанен.")
+
+async def refresh_leaderboard() -> None:
+    """Периодически перезагружать таблицу лидеров (учесть изменения других процессов)"""
+    while True:
+        await asyncio.sleep(LEADERBOARD_REFRESH_INTERVAL)
+        try:
+            await db.run_db(leaderboard.rebuild)
+        except Exception as e:
+            logger.error(f"Ошибка при обновлении таблицы лидеров: {e}")
+
+async def post_init(application: Application) -> None:
+    """Запуск фоновых служб после инициализации приложения"""
+    ledger.start()
+    await db.run_db(leaderboard.rebuild)
+    logger.info(f"Таблица лидеров загружена: {len(leaderboard)} игроков")
+    if application.job_queue is None:
+        logger.warning("JobQueue недоступна (нужен python-telegram-bot[job-queue]): общие столы рулетки отключены")
+    if BLACKJACK_HINTS:
+        # Таблицы 21 грузятся (или считаются) до первой подсказки, а не во время нее
+        get_tables()
+    application.bot_data["leaderboard_refresher"] = asyncio.create_task(refresh_leaderboard())
+
+async def post_shutdown(application: Application) -> None:
+    """Сброс журнала транзакций на диск при остановке"""
+    refresher = application.bot_data.pop("leaderboard_refresher", None)
+    if refresher:
+        refresher.cancel()
+    await ledger.close()
+    stats = user_cache.stats()
+    logger.info(f"Кэш пользователей: {stats['size']} записей, попаданий {stats['hits']}, "
+                f"промахов {stats['misses']} ({stats['hit_rate']:.0%})")
 
 async def main() -> None:
     """Запуск бота"""
@@ -978,16 +1260,25 @@ async def main() -> None:
         print("[DEBUG] DB initialized")
         logger.info("DB initialized")
         # Создание и настройка приложения
-        application = Application.builder().token(BOT_TOKEN).build()
+        application = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .post_init(post_init)
+            .post_shutdown(post_shutdown)
+            .build()
+        )
         print("[DEBUG] Application built")
         logger.info("Application built")
         # Регистрация обработчиков
+        application.add_handler(CallbackQueryHandler(duplicate_callback_guard), group=-2)
+        application.add_handler(CallbackQueryHandler(rate_limit_guard), group=-1)
         application.add_handler(CommandHandler("start", start))
         application.add_handler(CallbackQueryHandler(blackjack_handler, pattern="^blackjack_"))
         application.add_handler(CallbackQueryHandler(button_handler))
         application.add_handler(CommandHandler("help", help_command))
         application.add_handler(CommandHandler("leaderboard", leaderboard_command))
         application.add_handler(CommandHandler("balance", balance_command))
+        application.add_handler(CommandHandler("stats", stats_command))
         application.add_handler(CommandHandler("addmoney", addmoney_command, filters.ALL))
         application.add_handler(CommandHandler("ban", ban_command, filters.ALL))
         application.add_handler(CommandHandler("unban", unban_command, filters.ALL))
@@ -999,6 +1290,7 @@ async def main() -> None:
         await application.run_polling()
         print("[DEBUG] run_polling finished")
         logger.info("run_polling finished")
+        db.shutdown()
     except Exception as e:
         print(f"[EXCEPTION] {e}")
         print(traceback.format_exc())
@@ -1,10 +1,13 @@
 from sqlalchemy.orm import Session
-from models import User, Transaction, GameSession, TransactionType
+from models import User, Transaction, GameSession, GameSessionPlayer, UserGameStats, TransactionType
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from typing import Callable, List, Dict, NamedTuple, Optional, Tuple, Union
+from sqlalchemy import event, update, case, func, delete, select
+from sqlalchemy.dialects import postgresql, sqlite
 from models import Base
+from db_engine import engine, SessionLocal
+from migrations import run_migrations
+from config import SLOTS_AUTOPLAY_MAX_SPINS
 import logging
 from contextlib import contextmanager
 import traceback
@@ -13,29 +16,44 @@ import traceback
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Создание движка базы данных
-try:
-    engine = create_engine('sqlite:///casino.db', echo=True)
-    logger.info("Движок базы данных успешно создан")
-except Exception as e:
-    logger.error(f"Ошибка при создании движка базы данных: {e}")
-    logger.error(traceback.format_exc())
-    raise
-
-# Создание фабрики сессий
-try:
-    SessionLocal = sessionmaker(bind=engine)
-    logger.info("Фабрика сессий успешно создана")
-except Exception as e:
-    logger.error(f"Ошибка при создании фабрики сессий: {e}")
-    logger.error(traceback.format_exc())
-    raise
+# Подписчики на изменения пользователей (кэши в памяти: таблица лидеров и т.п.)
+_user_listeners: List[Callable[[Dict], None]] = []
+
+def add_user_listener(listener: Callable[[Dict], None]) -> None:
+    """Подписаться на закоммиченные изменения пользователей.
+
+    Слушатель получает словарь с user_id и измененными полями
+    (username, balance, is_banned) и вызывается в потоке БД после коммита.
+    """
+    _user_listeners.append(listener)
+
+def _stage_user_change(session: Session, record: Dict) -> None:
+    """Запомнить изменение пользователя до коммита сессии"""
+    session.info.setdefault("user_changes", []).append(record)
+
+@event.listens_for(SessionLocal, "after_commit")
+def _dispatch_user_changes(session: Session) -> None:
+    changes = session.info.pop("user_changes", None)
+    if not changes:
+        return
+    for record in changes:
+        for listener in _user_listeners:
+            try:
+                listener(record)
+            except Exception as e:
+                logger.error(f"Ошибка в слушателе изменений пользователя: {e}")
+                logger.error(traceback.format_exc())
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_user_changes(session: Session) -> None:
+    session.info.pop("user_changes", None)
 
 def init_db():
     """Инициализация базы данных"""
     try:
-        # Создание всех таблиц
+        # Создание всех таблиц и применение новых миграций
         Base.metadata.create_all(engine)
+        run_migrations(engine)
         logger.info("База данных успешно инициализирована")
     except Exception as e:
         logger.error(f"Ошибка при инициализации базы данных: {e}")
@@ -58,6 +76,54 @@ def get_db():
         session.close()
         logger.info("Сессия базы данных закрыта")
 
+def _user_to_dict(user: User) -> Dict:
+    """Преобразовать пользователя в словарь, не привязанный к сессии"""
+    return {
+        "user_id": user.user_id,
+        "username": user.username,
+        "balance": user.balance,
+        "is_banned": user.is_banned
+    }
+
+def get_user(session: Session, user_id: int) -> Optional[Dict]:
+    """Получить данные пользователя"""
+    user = session.query(User).filter(User.user_id == user_id).first()
+    return _user_to_dict(user) if user else None
+
+def get_or_create_user(session: Session, user_id: int, username: str, initial_balance: int) -> Dict:
+    """Получить пользователя или создать нового"""
+    user = session.query(User).filter(User.user_id == user_id).first()
+    if not user:
+        user = User(user_id=user_id, username=username, balance=initial_balance, is_banned=0)
+        session.add(user)
+        _stage_user_change(session, _user_to_dict(user))
+        session.commit()
+        logger.info(f"Создан новый пользователь: {username} (ID: {user_id})")
+    return _user_to_dict(user)
+
+def get_all_users(session: Session) -> List[Dict]:
+    """Получить всех пользователей (для построения кэшей в памяти)"""
+    rows = session.query(User.user_id, User.username, User.balance, User.is_banned).all()
+    return [
+        {"user_id": user_id, "username": username, "balance": balance, "is_banned": is_banned}
+        for user_id, username, balance, is_banned in rows
+    ]
+
+def get_user_id_by_username(session: Session, username: str) -> Optional[int]:
+    """Найти ID пользователя по username"""
+    user = session.query(User).filter(User.username == username).first()
+    return user.user_id if user else None
+
+def set_user_banned(session: Session, username: str, banned: bool) -> bool:
+    """Забанить или разбанить пользователя"""
+    user = session.query(User).filter(User.username == username).first()
+    if not user:
+        return False
+    user.is_banned = 1 if banned else 0
+    _stage_user_change(session, {"user_id": user.user_id, "is_banned": user.is_banned})
+    session.commit()
+    return True
+
 def get_user_balance(session: Session, user_id: int) -> int:
     """Получить баланс пользователя"""
     try:
@@ -70,53 +136,368 @@ def get_user_balance(session: Session, user_id: int) -> int:
         logger.error(traceback.format_exc())
         raise
 
-def update_balance(session: Session, user_id: int, amount: int, 
-                  transaction_type: TransactionType, game_type: str = None) -> bool:
-    """Обновить баланс пользователя и создать транзакцию"""
-    try:
-        user = session.query(User).filter(User.user_id == user_id).first()
-        if not user:
-            logger.error(f"Пользователь {user_id} не найден")
-            return False
-
-        # Проверка на отрицательный баланс
-        if user.balance + amount < 0:
-            logger.error(f"Попытка установить отрицательный баланс для пользователя {user_id}")
-            return False
-
-        # Обновление баланса
-        user.balance += amount
-        user.last_active = datetime.utcnow()
-        logger.info(f"Обновлен баланс пользователя {user_id}: {user.balance}")
-
-        # Создание транзакции
-        transaction = Transaction(
+# Типы транзакций, которые считаются результатом игры
+GAME_RESULT_TYPES = (TransactionType.GAME_WIN, TransactionType.GAME_LOSS)
+
+def _record_game_stats(session: Session, user_id: int, game_type: str,
+                       amount: int, wager: int) -> None:
+    """Учесть результат игры в user_game_stats одним INSERT ... ON CONFLICT"""
+    _record_series_stats(session, user_id, game_type, [amount], wager)
+
+def _record_series_stats(session: Session, user_id: int, game_type: str,
+                         amounts: List[int], wagered: int) -> None:
+    """Учесть результаты нескольких игр игрока одним INSERT ... ON CONFLICT"""
+    dialect = postgresql if session.bind.dialect.name == "postgresql" else sqlite
+    wins = [amount for amount in amounts if amount > 0]
+    stmt = dialect.insert(UserGameStats).values(
+        user_id=user_id,
+        game_type=game_type,
+        games=len(amounts),
+        wins=len(wins),
+        losses=sum(amount < 0 for amount in amounts),
+        wagered=wagered,
+        won=sum(wins),
+        biggest_win=max(wins, default=0)
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserGameStats.user_id, UserGameStats.game_type],
+        set_={
+            "games": UserGameStats.games + stmt.excluded.games,
+            "wins": UserGameStats.wins + stmt.excluded.wins,
+            "losses": UserGameStats.losses + stmt.excluded.losses,
+            "wagered": UserGameStats.wagered + stmt.excluded.wagered,
+            "won": UserGameStats.won + stmt.excluded.won,
+            "biggest_win": case(
+                (stmt.excluded.biggest_win > UserGameStats.biggest_win, stmt.excluded.biggest_win),
+                else_=UserGameStats.biggest_win
+            )
+        }
+    )
+    session.execute(stmt)
+
+class Replayed(NamedTuple):
+    """Операция с этим idempotency_key уже проведена, повтор ничего не изменил.
+
+    balance - баланс игрока сейчас, result - проведенная сумма, sessions -
+    записанные операцией игровые сессии (session_id, players, outcome):
+    по ним обработчик повторяет исходный ответ, а не играет заново.
+    """
+    balance: Optional[int]
+    result: int
+    sessions: List[Dict]
+
+def _keyed(column, idempotency_key: str, series: bool):
+    """Условие на ключ операции; у серии (не длиннее автоигры) еще и ключи раундов key:1, key:2...
+
+    Ключи перечисляются явно: IN по уникальному индексу, а не LIKE по префиксу.
+    """
+    if not series:
+        return column == idempotency_key
+    return column.in_([idempotency_key] + [f"{idempotency_key}:{i}" for i in range(1, SLOTS_AUTOPLAY_MAX_SPINS)])
+
+def _settled_sessions(session: Session, idempotency_key: str, series: bool = False) -> List[Dict]:
+    """Игровые сессии, записанные операцией с этим ключом"""
+    games = session.query(GameSession).filter(
+        _keyed(GameSession.idempotency_key, idempotency_key, series)
+    ).order_by(GameSession.session_id).all()
+    return [
+        {"session_id": game.session_id, "players": game.players, "outcome": game.outcome}
+        for game in games
+    ]
+
+def _find_replay(session: Session, user_id: int, idempotency_key: str,
+                 session_key: Optional[str] = None, series: bool = False) -> Optional[Replayed]:
+    """Replayed, если операция с ключом уже проведена, иначе None.
+
+    Поиск по уникальному индексу видит и операции этой же пачки (autoflush).
+    session_key - ключ игровой сессии, если он не совпадает с ключом проводки.
+    """
+    amounts = session.query(Transaction.amount).filter(
+        _keyed(Transaction.idempotency_key, idempotency_key, series)
+    ).all()
+    if not amounts:
+        return None
+    logger.info(f"Операция {idempotency_key} уже проведена, повтор пропущен")
+    return Replayed(
+        balance=session.query(User.balance).filter(User.user_id == user_id).scalar(),
+        result=sum(amount for amount, in amounts),
+        sessions=_settled_sessions(session, session_key or idempotency_key, series)
+    )
+
+def apply_balance_change(session: Session, user_id: int, amount: int,
+                         transaction_type: TransactionType, game_type: str = None,
+                         wager: Optional[int] = None,
+                         idempotency_key: Optional[str] = None) -> Union[int, Replayed, None]:
+    """Изменить баланс одним условным UPDATE и добавить транзакцию без коммита.
+
+    Для результатов игр (wager - сумма ставки) в той же транзакции
+    обновляется user_game_stats. Возвращает новый баланс или None,
+    если пользователь не найден или баланс стал бы отрицательным.
+    Операция с уже проведенным idempotency_key не повторяется:
+    возвращается Replayed с проведенной суммой и сессией с тем же ключом.
+    """
+    if idempotency_key is not None:
+        replay = _find_replay(session, user_id, idempotency_key)
+        if replay is not None:
+            return replay
+
+    row = session.execute(
+        update(User)
+        .where(User.user_id == user_id, User.balance + amount >= 0)
+        .values(balance=User.balance + amount, last_active=datetime.utcnow())
+        .returning(User.balance, User.username)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if row is None:
+        return None
+    new_balance, username = row
+    _stage_user_change(session, {"user_id": user_id, "username": username, "balance": new_balance})
+
+    session.add(Transaction(
+        user_id=user_id,
+        amount=amount,
+        type=transaction_type,
+        game_type=game_type,
+        idempotency_key=idempotency_key
+    ))
+    if game_type and transaction_type in GAME_RESULT_TYPES:
+        _record_game_stats(session, user_id, game_type, amount,
+                           wager if wager is not None else abs(amount))
+    return new_balance
+
+def apply_game_series(session: Session, user_id: int, game_type: str, rounds: List[Dict],
+                      idempotency_key: Optional[str] = None) -> Union[int, Replayed, None]:
+    """Провести серию раундов одного игрока (автоигра) без коммита и вернуть новый баланс.
+
+    Баланс меняется на сумму результатов одним условным UPDATE: условие -
+    баланс не уходит в минус ни в одной точке серии. Транзакция и игровая
+    сессия пишутся на каждый раунд (rounds: result, wager, players, outcome),
+    статистика - одним обновлением. None - пользователь не найден или
+    баланса не хватает; повтор с проведенным idempotency_key не проводится
+    и возвращает Replayed с итогом и сессиями серии.
+    """
+    if idempotency_key is not None:
+        replay = _find_replay(session, user_id, idempotency_key, series=True)
+        if replay is not None:
+            return replay
+
+    total = lowest = 0
+    for played in rounds:
+        total += played["result"]
+        lowest = min(lowest, total)
+    row = session.execute(
+        update(User)
+        .where(User.user_id == user_id, User.balance + lowest >= 0)
+        .values(balance=User.balance + total, last_active=datetime.utcnow())
+        .returning(User.balance, User.username)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if row is None:
+        return None
+    new_balance, username = row
+    _stage_user_change(session, {"user_id": user_id, "username": username, "balance": new_balance})
+    if not rounds:
+        return new_balance
+
+    created_at = datetime.utcnow()
+    games = []
+    for i, played in enumerate(rounds):
+        # Первая проводка несет ключ серии: по нему повтор и распознается
+        key = idempotency_key if i == 0 or idempotency_key is None else f"{idempotency_key}:{i}"
+        session.add(Transaction(
             user_id=user_id,
-            amount=amount,
-            type=transaction_type,
-            game_type=game_type
+            amount=played["result"],
+            type=TransactionType.GAME_WIN if played["result"] > 0 else TransactionType.GAME_LOSS,
+            game_type=game_type,
+            idempotency_key=key,
+            created_at=created_at
+        ))
+        game = GameSession(game_type=game_type, players=played["players"], outcome=played.get("outcome"),
+                           idempotency_key=key, created_at=created_at)
+        game.participants = _build_participants(played["players"], created_at)
+        games.append(game)
+    session.add_all(games)
+    _record_series_stats(session, user_id, game_type, [played["result"] for played in rounds],
+                         sum(played["wager"] for played in rounds))
+    return new_balance
+
+def apply_game_round(session: Session, game_type: str, players: List[Dict], outcome: Optional[Dict] = None,
+                     idempotency_key: Optional[str] = None) -> Dict[int, Union[int, Replayed, None]]:
+    """Провести раунд многих игроков (общий стол) без коммита: {user_id: новый баланс или None}.
+
+    Каждому игроку (players: user_id, bet, result) - условный UPDATE и
+    транзакция, всем вместе - одна игровая сессия с ключом раунда. Игрок,
+    чей баланс не покрывает проигрыш, из раунда выпадает (None) и в сессию
+    не пишется. Ключ проводки игрока - idempotency_key:user_id. Повтор уже
+    проведенного раунда ничего не пишет: игрокам записанной сессии
+    возвращается Replayed с их результатом и исходом раунда.
+    """
+    if idempotency_key is not None:
+        games = _settled_sessions(session, idempotency_key)
+        if games:
+            logger.info(f"Раунд {idempotency_key} уже проведен, повтор пропущен")
+            stored = {int(player["user_id"]): player["result"] for player in games[0]["players"]}
+            current = dict(session.query(User.user_id, User.balance).filter(User.user_id.in_(stored)).all())
+            balances: Dict[int, Union[int, Replayed, None]] = {int(player["user_id"]): None for player in players}
+            for user_id, result in stored.items():
+                balances[user_id] = Replayed(current.get(user_id), result, games)
+            return balances
+
+    balances = {}
+    settled = []
+    for player in players:
+        user_id, result = int(player["user_id"]), player["result"]
+        balances[user_id] = apply_balance_change(
+            session, user_id, result,
+            TransactionType.GAME_WIN if result > 0 else TransactionType.GAME_LOSS,
+            game_type, player["bet"],
+            f"{idempotency_key}:{user_id}" if idempotency_key is not None else None
         )
-        session.add(transaction)
+        if isinstance(balances[user_id], int):
+            settled.append(player)
+    if settled:
+        add_game_session(session, game_type, settled, outcome, idempotency_key)
+    return balances
+
+def change_balance(session: Session, user_id: int, amount: int,
+                   transaction_type: TransactionType, game_type: str = None,
+                   wager: Optional[int] = None,
+                   idempotency_key: Optional[str] = None) -> Union[int, Replayed, None]:
+    """Обновить баланс и создать транзакцию в одной транзакции БД, вернуть новый баланс"""
+    try:
+        new_balance = apply_balance_change(session, user_id, amount, transaction_type, game_type,
+                                           wager, idempotency_key)
+        if isinstance(new_balance, Replayed):
+            return new_balance
+        if new_balance is None:
+            session.rollback()
+            logger.error(f"Баланс пользователя {user_id} не изменен: пользователь не найден "
+                         f"или баланс стал бы отрицательным ({amount})")
+            return None
         session.commit()
-        logger.info(f"Создана транзакция для пользователя {user_id}: {amount} монет")
-        return True
+        logger.info(f"Обновлен баланс пользователя {user_id}: {new_balance} ({amount:+} монет)")
+        return new_balance
     except Exception as e:
         logger.error(f"Ошибка при обновлении баланса пользователя {user_id}: {e}")
         logger.error(traceback.format_exc())
         session.rollback()
         raise
 
-def create_game_session(session: Session, game_type: str, players: List[Dict]) -> int:
-    """Создать новую игровую сессию"""
+def update_balance(session: Session, user_id: int, amount: int, 
+                  transaction_type: TransactionType, game_type: str = None,
+                  wager: Optional[int] = None,
+                  idempotency_key: Optional[str] = None) -> bool:
+    """Обновить баланс пользователя и создать транзакцию"""
+    return change_balance(session, user_id, amount, transaction_type, game_type,
+                          wager, idempotency_key) is not None
+
+def add_game_session(session: Session, game_type: str, players: List[Dict],
+                     outcome: Optional[Dict] = None, idempotency_key: Optional[str] = None) -> int:
+    """Добавить игровую сессию без коммита и вернуть ее ID.
+
+    Сессия с уже записанным idempotency_key второй раз не пишется:
+    возвращается ID записанной.
+    """
+    if idempotency_key is not None:
+        settled = session.query(GameSession.session_id).filter(
+            GameSession.idempotency_key == idempotency_key
+        ).scalar()
+        if settled is not None:
+            return settled
+    created_at = datetime.utcnow()
     game = GameSession(
         game_type=game_type,
         players=players,
-        created_at=datetime.utcnow()
+        outcome=outcome,
+        idempotency_key=idempotency_key,
+        created_at=created_at
     )
+    game.participants = _build_participants(players, created_at)
     session.add(game)
-    session.commit()
+    session.flush()
     return game.session_id
 
+def _build_participants(players: List[Dict], created_at: datetime) -> List[GameSessionPlayer]:
+    """Строки game_session_players для списка игроков сессии"""
+    participants = {}
+    for player in players or []:
+        if not isinstance(player, dict) or player.get("user_id") is None:
+            continue
+        participants.setdefault(int(player["user_id"]), GameSessionPlayer(
+            user_id=int(player["user_id"]),
+            bet=player.get("bet"),
+            result=player.get("result"),
+            created_at=created_at
+        ))
+    return list(participants.values())
+
+def backfill_game_session_players(session: Session, chunk_size: int = 1000) -> int:
+    """Заполнить game_session_players для старых сессий, у которых их еще нет.
+
+    Выполняется миграцией 1, когда более поздних столбцов game_sessions
+    (idempotency_key) еще нет: читаются только нужные столбцы, а не модель целиком.
+    """
+    has_participants = (
+        select(GameSessionPlayer.session_id)
+        .where(GameSessionPlayer.session_id == GameSession.session_id)
+        .exists()
+    )
+    total = 0
+    last_id = 0
+    while True:
+        games = session.execute(
+            select(GameSession.session_id, GameSession.players, GameSession.created_at)
+            .where(GameSession.session_id > last_id, ~has_participants)
+            .order_by(GameSession.session_id)
+            .limit(chunk_size)
+        ).all()
+        if not games:
+            break
+        for session_id, players, created_at in games:
+            participants = _build_participants(players, created_at)
+            for participant in participants:
+                participant.session_id = session_id
+            session.add_all(participants)
+            total += len(participants)
+        last_id = games[-1].session_id
+        session.commit()
+    if total:
+        logger.info(f"Перенесено {total} участников игровых сессий в game_session_players")
+    return total
+
+def create_game_session(session: Session, game_type: str, players: List[Dict]) -> int:
+    """Создать новую игровую сессию"""
+    session_id = add_game_session(session, game_type, players)
+    session.commit()
+    return session_id
+
+def apply_batch(session: Session, operations: List[Tuple[Callable, tuple]]) -> List:
+    """Выполнить пачку операций (функций без коммита) одним коммитом.
+
+    Если пачка падает целиком, операции повторяются по одной, чтобы ошибка
+    одной операции не отменяла остальные. Вместо результата упавшей
+    операции возвращается исключение.
+    """
+    try:
+        results = [func(session, *args) for func, args in operations]
+        session.commit()
+        return results
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Ошибка при записи пачки из {len(operations)} операций, повтор по одной: {e}")
+
+    results = []
+    for func, args in operations:
+        try:
+            results.append(func(session, *args))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Ошибка операции {func.__name__}{args}: {e}")
+            logger.error(traceback.format_exc())
+            results.append(e)
+    return results
+
 def update_game_session(session: Session, session_id: int, outcome: Dict) -> bool:
     """Обновить результат игровой сессии"""
     game = session.query(GameSession).filter(GameSession.session_id == session_id).first()
@@ -127,30 +508,113 @@ def update_game_session(session: Session, session_id: int, outcome: Dict) -> boo
     session.commit()
     return True
 
+def get_game_sessions(session: Session, since: datetime, until: Optional[datetime] = None) -> List[Dict]:
+    """Игровые сессии за период в порядке создания"""
+    query = session.query(GameSession).filter(GameSession.created_at >= since)
+    if until is not None:
+        query = query.filter(GameSession.created_at < until)
+    return [
+        {
+            "session_id": game.session_id,
+            "game_type": game.game_type,
+            "players": game.players,
+            "outcome": game.outcome,
+            "created_at": game.created_at
+        }
+        for game in query.order_by(GameSession.created_at, GameSession.session_id).all()
+    ]
+
+def get_game_result_totals(session: Session, since: datetime, until: datetime) -> Dict[Tuple[int, str], int]:
+    """Сумма игровых проводок журнала по игроку и игре за период"""
+    rows = session.query(
+        Transaction.user_id,
+        Transaction.game_type,
+        func.sum(Transaction.amount)
+    ).filter(
+        Transaction.game_type.isnot(None),
+        Transaction.type.in_(GAME_RESULT_TYPES),
+        Transaction.created_at >= since,
+        Transaction.created_at < until
+    ).group_by(Transaction.user_id, Transaction.game_type).all()
+    return {(user_id, game_type): total or 0 for user_id, game_type, total in rows}
+
 def get_user_stats(session: Session, user_id: int) -> Dict:
     """Получить статистику пользователя"""
     user = session.query(User).filter(User.user_id == user_id).first()
     if not user:
         return {}
 
-    # Получение статистики по играм
-    games_played = session.query(GameSession).filter(
-        GameSession.players.contains([{"user_id": user_id}])
-    ).count()
-
-    # Получение статистики по транзакциям
-    wins = session.query(Transaction).filter(
-        Transaction.user_id == user_id,
-        Transaction.type == TransactionType.GAME_WIN
-    ).count()
+    # Счетчики по играм читаются из user_game_stats по первичному ключу
+    rows = session.query(UserGameStats).filter(UserGameStats.user_id == user_id).all()
+    by_game = {
+        row.game_type: {
+            "games": row.games,
+            "wins": row.wins,
+            "losses": row.losses,
+            "wagered": row.wagered,
+            "won": row.won,
+            "biggest_win": row.biggest_win
+        }
+        for row in rows
+    }
 
     return {
         "balance": user.balance,
-        "games_played": games_played,
-        "wins": wins,
-        "registration_date": user.registration_date
+        "games_played": sum(stats["games"] for stats in by_game.values()),
+        "wins": sum(stats["wins"] for stats in by_game.values()),
+        "registration_date": user.registration_date,
+        "by_game": by_game
     }
 
+def rebuild_user_game_stats(session: Session) -> int:
+    """Пересчитать user_game_stats по журналу транзакций и участникам сессий"""
+    stats: Dict[Tuple[int, str], Dict] = {}
+
+    rows = session.query(
+        Transaction.user_id,
+        Transaction.game_type,
+        func.count(),
+        func.sum(case((Transaction.amount > 0, 1), else_=0)),
+        func.sum(case((Transaction.amount < 0, 1), else_=0)),
+        func.sum(case((Transaction.amount > 0, Transaction.amount), else_=0)),
+        func.max(Transaction.amount),
+        func.sum(case((Transaction.amount < 0, -Transaction.amount), else_=0))
+    ).filter(
+        Transaction.game_type.isnot(None),
+        Transaction.type.in_(GAME_RESULT_TYPES)
+    ).group_by(Transaction.user_id, Transaction.game_type).all()
+    for user_id, game_type, games, wins, losses, won, biggest, lost in rows:
+        stats[(user_id, game_type)] = {
+            "user_id": user_id,
+            "game_type": game_type,
+            "games": games,
+            "wins": wins or 0,
+            "losses": losses or 0,
+            "wagered": lost or 0,
+            "won": won or 0,
+            "biggest_win": max(biggest or 0, 0)
+        }
+
+    # Журнал не хранит ставки выигравших игр: сумма ставок берется из
+    # участников сессий, а без них - как сумма проигрышей
+    wagers = session.query(
+        GameSessionPlayer.user_id,
+        GameSession.game_type,
+        func.sum(GameSessionPlayer.bet)
+    ).join(GameSession).filter(
+        GameSessionPlayer.bet.isnot(None)
+    ).group_by(GameSessionPlayer.user_id, GameSession.game_type).all()
+    for user_id, game_type, wagered in wagers:
+        if (user_id, game_type) in stats and wagered:
+            stats[(user_id, game_type)]["wagered"] = wagered
+
+    session.execute(delete(UserGameStats))
+    if stats:
+        session.execute(UserGameStats.__table__.insert(), list(stats.values()))
+    session.commit()
+    logger.info(f"Статистика игроков пересчитана: {len(stats)} записей")
+    return len(stats)
+
 def get_leaderboard(session: Session, limit: int = 10) -> List[Dict]:
     """Получить таблицу лидеров"""
     top_users = session.query(User).order_by(User.balance.desc()).limit(limit).all()
@@ -166,8 +630,8 @@ def get_leaderboard(session: Session, limit: int = 10) -> List[Dict]:
 def check_rate_limit(session: Session, user_id: int) -> bool:
     """Проверить ограничение на количество игр в час"""
     hour_ago = datetime.utcnow() - timedelta(hours=1)
-    recent_games = session.query(GameSession).filter(
-        GameSession.players.contains([{"user_id": user_id}]),
-        GameSession.created_at >= hour_ago
+    recent_games = session.query(GameSessionPlayer).filter(
+        GameSessionPlayer.user_id == user_id,
+        GameSessionPlayer.created_at >= hour_ago
     ).count()
     return recent_games < 50  # MAX_GAMES_PER_HOUR 
\ No newline at end of file
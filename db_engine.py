@@ -0,0 +1,57 @@
+import logging
+import traceback
+from typing import Dict, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+from config import (DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+                    DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_ECHO, SQLITE_PRAGMAS)
+
+logger = logging.getLogger(__name__)
+
+def _is_memory_sqlite(url: str) -> bool:
+    return url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url
+
+def _apply_sqlite_pragmas(engine: Engine, pragmas: Dict) -> None:
+    """Выполнять PRAGMA на каждом новом соединении SQLite"""
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+def create_db_engine(url: str = DATABASE_URL, pragmas: Optional[Dict] = None,
+                     echo: bool = DB_ECHO) -> Engine:
+    """Создать движок БД с настроенным пулом (и PRAGMA для SQLite)"""
+    kwargs = {"echo": echo}
+    if not _is_memory_sqlite(url):
+        kwargs.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT
+        )
+    if not url.startswith("sqlite"):
+        # Сервер может закрыть простаивающее соединение: проверяем и периодически пересоздаем
+        kwargs.update(
+            pool_pre_ping=DB_POOL_PRE_PING,
+            pool_recycle=DB_POOL_RECYCLE
+        )
+    engine = create_engine(url, **kwargs)
+    if engine.dialect.name == "sqlite":
+        _apply_sqlite_pragmas(engine, SQLITE_PRAGMAS if pragmas is None else pragmas)
+    return engine
+
+# Общий движок и фабрика сессий для бота, веб-приложения и моделей
+try:
+    engine = create_db_engine()
+    SessionLocal = sessionmaker(bind=engine)
+    logger.info("Движок базы данных успешно создан")
+except Exception as e:
+    logger.error(f"Ошибка при создании движка базы данных: {e}")
+    logger.error(traceback.format_exc())
+    raise
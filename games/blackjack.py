@@ -1,38 +1,182 @@
-import random
+from array import array
 from typing import List, Dict, Tuple, Optional
-from config import BLACKJACK_MIN_BET
+from config import BLACKJACK_MIN_BET, BLACKJACK_DECKS, BLACKJACK_PENETRATION, BLACKJACK_DEALER_OPENING_RULE
+from rng import ServerSeed, replay_random
 
 # Карты
 SUITS = ['♠️', '♥️', '♣️', '♦️']
 RANKS = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A']
 
 class Card:
+    """Карта-синглтон: 52 экземпляра на весь процесс, код 0-51 (масть * 13 + ранг)"""
+    __slots__ = ('code', 'suit', 'rank', 'points', 'is_ace', 'label')
+
     def __init__(self, suit: str, rank: str):
         self.suit = suit
         self.rank = rank
+        self.code = SUITS.index(suit) * len(RANKS) + RANKS.index(rank)
+        self.is_ace = rank == 'A'
+        # Жесткие очки: туз считается за 1, мягкие +10 добавляет рука
+        self.points = 1 if self.is_ace else 10 if rank in ('J', 'Q', 'K') else int(rank)
+        self.label = f"{rank}{suit}"
+    
+    @classmethod
+    def from_code(cls, code: int) -> "Card":
+        return CARDS[code]
     
     def __str__(self) -> str:
-        return f"{self.rank}{self.suit}"
+        return self.label
+    
+    def __repr__(self) -> str:
+        return f"Card({self.label})"
     
     def value(self) -> int:
-        if self.rank in ['J', 'Q', 'K']:
-            return 10
-        elif self.rank == 'A':
-            return 11
-        return int(self.rank)
+        return 11 if self.is_ace else self.points
+
+# Все карты колоды по коду: колоды и руки хранят ссылки на них, новых объектов не создается
+CARDS = tuple(Card(suit, rank) for suit in SUITS for rank in RANKS)
+
+# Сколько карт каждого номинала (1 - туз, 10 - десятки и картинки) в одной колоде
+DECK_POINTS = tuple(sum(card.points == points for card in CARDS) for points in range(11))
+
+def _pair_score(first: int, second: int) -> int:
+    total = first + second
+    return total + 10 if 1 in (first, second) and total <= 11 else total
+
+# Стартовые пары дилера по номиналам, которые разрешает правило дома (счет меньше 16)
+DEALER_OPENING_PAIRS = tuple(
+    (first, second)
+    for first in range(1, 11)
+    for second in range(1, 11)
+    if _pair_score(first, second) < 16
+)
+
+class Shoe:
+    """Шуз из нескольких колод: массив кодов карт, раздача по индексу до подрезной карты.
+
+    Без внешнего генератора каждое перемешивание играется от нового зерна
+    сервера; зерно отыгранного шуза попадает в retired и раскрывается.
+    """
+    __slots__ = ('decks', 'penetration', 'codes', 'position', 'cut', 'counts',
+                 'rng', 'seed', 'retired', '_shared_rng')
 
-class Deck:
-    def __init__(self):
-        self.cards = [Card(suit, rank) for suit in SUITS for rank in RANKS]
-        random.shuffle(self.cards)
+    def __init__(self, decks: int = BLACKJACK_DECKS, penetration: float = BLACKJACK_PENETRATION, rng=None):
+        if decks < 1:
+            raise ValueError("В шузе должна быть хотя бы одна колода")
+        if not 0 < penetration <= 1:
+            raise ValueError("Проникновение должно быть в диапазоне (0, 1]")
+        self.decks = decks
+        self.penetration = penetration
+        self.codes = array('B', range(len(CARDS))) * decks
+        self.cut = int(len(self.codes) * penetration)
+        self._shared_rng = rng
+        self.rng = rng
+        self.seed: Optional[ServerSeed] = None
+        self.retired: List[Dict[str, str]] = []
+        self.shuffle()
+    
+    def shuffle(self):
+        """Перемешать весь шуз одной перестановкой и вернуться к его началу"""
+        if self._shared_rng is None:
+            if self.seed is not None:
+                self.retired.append(self.seed.reveal())
+            self.seed = ServerSeed()
+            self.rng = self.seed.random
+        self.rng.shuffle(self.codes)
+        self.position = 0
+        # Остаток шуза по номиналам, поддерживается при каждой раздаче
+        self.counts = [count * self.decks for count in DECK_POINTS]
+    
+    def needs_shuffle(self) -> bool:
+        """Подрезная карта вышла — перед следующим раундом шуз нужно перемешать"""
+        return self.position >= self.cut
+    
+    def begin_round(self):
+        """Вызывается перед раздачей: раунд всегда начинается до подрезной карты"""
+        if self.needs_shuffle():
+            self.shuffle()
+    
+    def remaining(self) -> int:
+        return len(self.codes) - self.position
     
     def draw(self) -> Card:
-        if not self.cards:
-            self.cards = [Card(suit, rank) for suit in SUITS for rank in RANKS]
-            random.shuffle(self.cards)
-        return self.cards.pop()
+        # Подрезная карта не прерывает раунд; перемешиваем посреди раунда, только если шуз кончился
+        if self.position >= len(self.codes):
+            self.shuffle()
+        card = CARDS[self.codes[self.position]]
+        self.position += 1
+        self.counts[card.points] -= 1
+        return card
+    
+    def draw_points(self, points: int) -> Card:
+        """Раздать случайную карту заданного номинала из остатка шуза"""
+        # Берем случайную позицию, а не ближайшую подходящую: иначе пропущенные
+        # карты другого номинала оказались бы следующими и исказили бы раздачу
+        codes = self.codes
+        while True:
+            index = self.rng.randrange(self.position, len(codes))
+            if CARDS[codes[index]].points == points:
+                break
+        codes[self.position], codes[index] = codes[index], codes[self.position]
+        return self.draw()
+    
+    def draw_pair(self, pairs: Tuple[Tuple[int, int], ...]) -> Tuple[Card, Card]:
+        """Раздать две карты из остатка шуза при условии, что их номиналы образуют одну из пар"""
+        counts = self.counts
+        weights = [counts[first] * (counts[second] - (first == second)) for first, second in pairs]
+        if not any(weights):
+            # В остатке нет подходящей пары — перемешиваем шуз, в полном она есть всегда
+            self.shuffle()
+            return self.draw_pair(pairs)
+        first, second = self.rng.choices(pairs, weights)[0]
+        return self.draw_points(first), self.draw_points(second)
+    
+    def snapshot(self) -> Dict:
+        """Нерозданный остаток шуза и позиция в потоке зерна: с них повторяется раунд"""
+        return {
+            "decks": self.decks,
+            "shoe": self.codes[self.position:].tobytes().hex(),
+            "offset": getattr(self.rng, "consumed", 0)
+        }
+    
+    @classmethod
+    def restore(cls, snapshot: Dict, rng) -> "Shoe":
+        """Шуз из snapshot() для повтора раунда: карты в том же порядке, генератор - переданный"""
+        shoe = cls.__new__(cls)
+        shoe.decks = snapshot["decks"]
+        shoe.penetration = 1.0
+        shoe.codes = array('B', bytes.fromhex(snapshot["shoe"]))
+        shoe.cut = len(shoe.codes)
+        shoe._shared_rng = shoe.rng = rng
+        shoe.seed = None
+        shoe.retired = []
+        shoe.position = 0
+        shoe.counts = [0] * len(DECK_POINTS)
+        for code in shoe.codes:
+            shoe.counts[CARDS[code].points] += 1
+        return shoe
+    
+    def fairness(self, reveal: bool = False) -> Dict:
+        """Запись для сессии: хэш текущего зерна и раскрытые зерна отыгранных шузов.
+
+        Текущее зерно раскрывается только при reveal (шуз больше не используется).
+        """
+        if self.seed is None:
+            return {}
+        record = self.seed.reveal() if reveal else self.seed.commit()
+        record["retired"], self.retired = self.retired, []
+        return record
+
+class Deck(Shoe):
+    """Одна колода, перемешивается только когда закончится"""
+    __slots__ = ()
+
+    def __init__(self, rng=None):
+        super().__init__(decks=1, penetration=1.0, rng=rng)
 
 class Player:
+    __slots__ = ('user_id', 'username', 'bet', 'hand', 'is_standing', 'is_doubled', 'hard_total', 'aces')
+
     def __init__(self, user_id: int, bet: int, username: str = ""):
         self.user_id = user_id
         self.username = username
@@ -40,30 +184,45 @@ class Player:
         self.hand: List[Card] = []
         self.is_standing = False
         self.is_doubled = False
+        self.hard_total = 0  # сумма очков, тузы по 1
+        self.aces = 0
     
     def add_card(self, card: Card):
         self.hand.append(card)
+        self.hard_total += card.points
+        self.aces += card.is_ace
+    
+    def clear_hand(self) -> List[Card]:
+        """Сбросить руку и вернуть ее карты"""
+        cards, self.hand = self.hand, []
+        self.hard_total = 0
+        self.aces = 0
+        return cards
     
     def get_score(self) -> int:
-        score = sum(card.value() for card in self.hand)
-        aces = sum(1 for card in self.hand if card.rank == 'A')
-        
-        # Корректировка для тузов
-        while score > 21 and aces > 0:
-            score -= 10
-            aces -= 1
-        
-        return score
+        # Один туз считается за 11, если это не дает перебора
+        if self.aces and self.hard_total <= 11:
+            return self.hard_total + 10
+        return self.hard_total
+    
+    def is_soft(self) -> bool:
+        return self.aces > 0 and self.hard_total <= 11
     
     def is_bust(self) -> bool:
-        return self.get_score() > 21
+        return self.hard_total > 21
     
     def has_blackjack(self) -> bool:
         return len(self.hand) == 2 and self.get_score() == 21
 
 class BlackjackGame:
-    def __init__(self, game_mode: str = "single", room_id: Optional[str] = None, chat_id: Optional[int] = None):
-        self.deck = Deck()
+    def __init__(self, game_mode: str = "single", room_id: Optional[str] = None, chat_id: Optional[int] = None,
+                 shoe: Optional[Shoe] = None):
+        # Шуз можно передать снаружи, чтобы все раунды за одним столом играли из него
+        self.own_shoe = shoe is None
+        self.shoe = shoe if shoe is not None else Shoe()
+        self.first_card = 0
+        self.start_state: Dict = {}  # шуз и ставки на начало раунда
+        self.actions: List[List] = []  # [user_id, действие] по порядку, для повтора
         self.players: Dict[int, Player] = {}
         self.dealer = Player(0, 0, "Дилер")
         self.game_mode = game_mode  # "single" или "multi"
@@ -104,25 +263,25 @@ class BlackjackGame:
         
         self.game_started = True
         self.waiting_for_players = False
+        self.shoe.begin_round()
+        self.first_card = self.shoe.position
+        self.start_state = self.shoe.snapshot()
+        self.start_state["bets"] = [[player.user_id, player.bet] for player in self.players.values()]
         
         # Раздача начальных карт игрокам
         for _ in range(2):
             for player in self.players.values():
-                player.add_card(self.deck.draw())
+                player.add_card(self.shoe.draw())
         
-        # Раздача карт дилеру с проверкой на высокие значения
-        while True:
-            # Очищаем руку дилера перед новой попыткой
-            self.dealer.hand = []
-            # Раздаем две карты дилеру
-            for _ in range(2):
-                self.dealer.add_card(self.deck.draw())
-            # Проверяем, что у дилера не слишком высокое значение
-            if self.dealer.get_score() < 16:
-                break
-            # Если значение высокое, возвращаем карты в колоду и перемешиваем
-            self.deck.cards.extend(self.dealer.hand)
-            random.shuffle(self.deck.cards)
+        # Раздача карт дилеру: по правилу дома стартовый счет дилера меньше 16,
+        # поэтому пара сразу выбирается из разрешенных, без пересдач
+        self.dealer.clear_hand()
+        if BLACKJACK_DEALER_OPENING_RULE:
+            cards = self.shoe.draw_pair(DEALER_OPENING_PAIRS)
+        else:
+            cards = (self.shoe.draw(), self.shoe.draw())
+        for card in cards:
+            self.dealer.add_card(card)
         
         return True, "Игра началась"
     
@@ -153,7 +312,8 @@ class BlackjackGame:
         if current_player.is_standing:
             return False, "Вы уже остановились"
         
-        current_player.add_card(self.deck.draw())
+        self.actions.append([user_id, "hit"])
+        current_player.add_card(self.shoe.draw())
         
         if current_player.is_bust():
             current_player.is_standing = True
@@ -171,6 +331,7 @@ class BlackjackGame:
         if not current_player or current_player.user_id != user_id:
             return False, "Сейчас не ваш ход"
         
+        self.actions.append([user_id, "stand"])
         current_player.is_standing = True
         self.next_player()
         return True, "Ход передан следующему игроку"
@@ -187,9 +348,10 @@ class BlackjackGame:
         if len(current_player.hand) != 2:
             return False, "Удвоение возможно только при двух картах"
         
+        self.actions.append([user_id, "double"])
         current_player.bet *= 2
         current_player.is_doubled = True
-        current_player.add_card(self.deck.draw())
+        current_player.add_card(self.shoe.draw())
         current_player.is_standing = True
         self.next_player()
         return True, f"Ставка удвоена. Новый счет: {current_player.get_score()}"
@@ -204,7 +366,7 @@ class BlackjackGame:
             return {}
         # Дилер берет карты, пока не достигнет 17
         while self.dealer.get_score() < 17:
-            self.dealer.add_card(self.deck.draw())
+            self.dealer.add_card(self.shoe.draw())
         dealer_score = self.dealer.get_score()
         results = {}
         for player in self.players.values():
@@ -225,6 +387,38 @@ class BlackjackGame:
                 results[player.user_id] = 0  # Ничья
         return results
     
+    def fairness(self) -> Dict:
+        """Проверочные данные раунда: зерно шуза, шуз и ставки на начало раунда, ходы игроков"""
+        # Свой шуз после раунда больше не нужен и раскрывается сразу, общий - при перемешивании
+        record = self.shoe.fairness(reveal=self.own_shoe)
+        if not record:
+            return {}
+        record.update(self.start_state)
+        record.update(
+            first_card=self.first_card,
+            draws=self.shoe.rng.consumed - self.start_state["offset"],
+            mode=self.game_mode,
+            room_id=self.room_id,
+            actions=self.actions
+        )
+        return record
+    
+    @classmethod
+    def replay(cls, fair: Dict, players: List[Dict]) -> Dict:
+        """Повторить раунд по записи fairness(): тот же шуз, те же ставки и ходы"""
+        rng = replay_random(fair["server_seed"], fair["offset"])
+        game = cls(game_mode=fair["mode"], room_id=fair["room_id"], shoe=Shoe.restore(fair, rng))
+        for user_id, bet in fair["bets"]:
+            game.add_player(user_id, bet)
+        game.start_game()
+        for user_id, action in fair["actions"]:
+            getattr(game, action)(user_id)
+        return {
+            "results": game.finish_game(),
+            "outcome": {"dealer_score": game.dealer.get_score()},
+            "draws": rng.consumed - fair["offset"]
+        }
+    
     def get_game_state(self) -> str:
         """Получить текущее состояние игры в виде строки"""
         state = []
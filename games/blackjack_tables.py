@@ -0,0 +1,218 @@
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config import BLACKJACK_DEALER_OPENING_RULE, BLACKJACK_TABLES_PATH
+from games.blackjack import DEALER_OPENING_PAIRS, Card, Player, Shoe
+
+# Итоги дилера: 17, 18, 19, 20, 21 и перебор (последний элемент)
+DEALER_TOTALS = (17, 18, 19, 20, 21)
+BUST = len(DEALER_TOTALS)
+
+ACTIONS = ("stand", "hit", "double")
+
+# Классы состава шуза: доля десяток в остатке с шагом TEN_STEP вокруг полной колоды (4/13)
+TEN_SHARE = 4 / 13
+TEN_STEP = 0.02
+TEN_CLASSES = 4  # классов по каждую сторону от нейтрального
+NEUTRAL_CLASS = TEN_CLASSES
+
+# Версия формата файла: при изменении расчета старый кэш пересчитывается
+TABLES_VERSION = 1
+
+Probabilities = Tuple[float, ...]  # индекс - номинал 1-10, нулевой элемент не используется
+
+def class_probabilities(composition_class: int) -> Probabilities:
+    """Вероятности номиналов следующей карты для класса состава (бесконечный шуз)"""
+    tens = TEN_SHARE + (composition_class - NEUTRAL_CLASS) * TEN_STEP
+    other = (1 - tens) / 9
+    return (0.0,) + (other,) * 9 + (tens,)
+
+def _score(hard: int, ace: bool) -> int:
+    return hard + 10 if ace and hard <= 11 else hard
+
+def _hole_probabilities(upcard: int, p: Probabilities, opening_rule: bool) -> Probabilities:
+    """Закрытая карта дилера при известной открытой с учетом правила стартовой пары"""
+    if not opening_rule:
+        return p
+    allowed = {second for first, second in DEALER_OPENING_PAIRS if first == upcard}
+    weights = [p[points] if points in allowed else 0.0 for points in range(11)]
+    total = sum(weights)
+    return tuple(weight / total for weight in weights)
+
+def dealer_outcomes(upcard: int, p: Probabilities, opening_rule: bool = BLACKJACK_DEALER_OPENING_RULE) -> Probabilities:
+    """Распределение итога дилера (DEALER_TOTALS + перебор) по правилам finish_game: берет до 17"""
+    memo: Dict[Tuple[int, bool], List[float]] = {}
+
+    def play(hard: int, ace: bool) -> List[float]:
+        if hard > 21:
+            result = [0.0] * (BUST + 1)
+            result[BUST] = 1.0
+            return result
+        score = _score(hard, ace)
+        if score >= 17:
+            result = [0.0] * (BUST + 1)
+            result[score - 17] = 1.0
+            return result
+        key = (hard, ace)
+        if key not in memo:
+            result = [0.0] * (BUST + 1)
+            for points in range(1, 11):
+                for i, chance in enumerate(play(hard + points, ace or points == 1)):
+                    result[i] += p[points] * chance
+            memo[key] = result
+        return memo[key]
+
+    hole = _hole_probabilities(upcard, p, opening_rule)
+    outcome = [0.0] * (BUST + 1)
+    for points in range(1, 11):
+        if hole[points]:
+            for i, chance in enumerate(play(upcard + points, upcard == 1 or points == 1)):
+                outcome[i] += hole[points] * chance
+    return tuple(outcome)
+
+def player_evs(dealer: Probabilities, p: Probabilities) -> List[List[Tuple[float, float, float]]]:
+    """EV стоп/карта/удвоение на единицу ставки для каждой руки [есть туз][жесткая сумма]
+
+    Правила finish_game: перебор игрока при переборе дилера - ничья,
+    удвоение - ровно одна карта за двойную ставку, сплита нет.
+    Блэкджек (+1.5) сюда не входит: его проверяет вызывающий код.
+    """
+    bust_ev = -(1 - dealer[BUST])
+
+    def stand_ev(score: int) -> float:
+        ev = dealer[BUST]
+        for total, chance in zip(DEALER_TOTALS, dealer):
+            ev += chance if score > total else -chance if score < total else 0.0
+        return ev
+
+    def after_card(hard: int, ace: bool) -> float:
+        return bust_ev if hard > 21 else stand_ev(_score(hard, ace))
+
+    table = [[(0.0, 0.0, 0.0)] * 22 for _ in range(2)]
+    best = [[bust_ev] * 32 for _ in range(2)]  # лучший EV руки без удвоения, суммы до 31
+    for hard in range(21, 1, -1):
+        for ace in (True, False):
+            stand = stand_ev(_score(hard, ace))
+            hit = sum(p[points] * best[ace or points == 1][hard + points] for points in range(1, 11))
+            double = 2 * sum(p[points] * after_card(hard + points, ace or points == 1) for points in range(1, 11))
+            table[ace][hard] = (stand, hit, double)
+            best[ace][hard] = max(stand, hit)
+    return table
+
+def _initial_ev(evs: Sequence, p: Probabilities, opening_rule: bool) -> float:
+    """Ожидаемый результат раунда на единицу ставки при игре по таблицам"""
+    upcards = [0.0] * 11
+    for points in range(1, 11):
+        hole = 1.0
+        if opening_rule:
+            hole = sum(p[second] for first, second in DEALER_OPENING_PAIRS if first == points)
+        upcards[points] = p[points] * hole
+    norm = sum(upcards)
+    ev = 0.0
+    for upcard in range(1, 11):
+        hands = 0.0
+        for first in range(1, 11):
+            for second in range(1, 11):
+                hard, ace = first + second, 1 in (first, second)
+                if ace and hard == 11:
+                    value = 1.5
+                else:
+                    value = max(evs[upcard][ace][hard])
+                hands += p[first] * p[second] * value
+        ev += upcards[upcard] / norm * hands
+    return ev
+
+def compute_tables(opening_rule: bool = BLACKJACK_DEALER_OPENING_RULE) -> Dict:
+    """Полный расчет таблиц для всех классов состава и открытых карт дилера"""
+    dealer, evs, rtp = [], [], []
+    for composition_class in range(2 * TEN_CLASSES + 1):
+        p = class_probabilities(composition_class)
+        by_upcard = [(0.0,) * (BUST + 1)] + [dealer_outcomes(upcard, p, opening_rule) for upcard in range(1, 11)]
+        ev_by_upcard = [None] + [player_evs(outcome, p) for outcome in by_upcard[1:]]
+        dealer.append(by_upcard)
+        evs.append(ev_by_upcard)
+        rtp.append(1 + _initial_ev(ev_by_upcard, p, opening_rule))
+    return {"rules": _rules_key(opening_rule), "dealer": dealer, "evs": evs, "rtp": rtp}
+
+def _rules_key(opening_rule: bool) -> Dict:
+    return {"version": TABLES_VERSION, "opening_rule": opening_rule,
+            "ten_step": TEN_STEP, "ten_classes": TEN_CLASSES}
+
+class BlackjackTables:
+    """Готовые таблицы 21: распределение итога дилера и EV действий игрока.
+
+    Считаются один раз и сохраняются в BLACKJACK_TABLES_PATH; при старте
+    файл читается, а если правила поменялись - пересчитывается. Все запросы
+    (подсказка в боте, автоигра в симуляции, точный RTP) - чтение по индексу.
+    Шуз сводится к классу состава по доле десяток в остатке.
+    """
+
+    def __init__(self, data: Dict):
+        self.rules = data["rules"]
+        self.dealer: List[List[Tuple[float, ...]]] = [[tuple(row) for row in rows] for rows in data["dealer"]]
+        self.evs = [
+            [None] + [[[tuple(action) for action in row] for row in by_ace] for by_ace in rows[1:]]
+            for rows in data["evs"]
+        ]
+        self.rtp: List[float] = list(data["rtp"])
+
+    @classmethod
+    def load(cls, path: str = BLACKJACK_TABLES_PATH,
+             opening_rule: bool = BLACKJACK_DEALER_OPENING_RULE) -> "BlackjackTables":
+        """Прочитать таблицы с диска или посчитать и сохранить"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("rules") == _rules_key(opening_rule):
+                return cls(data)
+        except (OSError, ValueError):
+            pass
+        data = compute_tables(opening_rule)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass  # без записи на диск таблицы просто посчитаются при следующем запуске
+        return cls(data)
+
+    @staticmethod
+    def composition_class(shoe: Shoe, hidden: Sequence[Card] = ()) -> int:
+        """Класс состава остатка шуза; hidden - розданные, но не открытые карты (закрытая карта дилера)"""
+        tens = shoe.counts[10] + sum(card.points == 10 for card in hidden)
+        remaining = shoe.remaining() + len(hidden)
+        if not remaining:
+            return NEUTRAL_CLASS
+        offset = round((tens / remaining - TEN_SHARE) / TEN_STEP)
+        return NEUTRAL_CLASS + max(-TEN_CLASSES, min(TEN_CLASSES, offset))
+
+    def dealer_outcomes(self, upcard: Card, composition_class: int = NEUTRAL_CLASS) -> Tuple[float, ...]:
+        return self.dealer[composition_class][upcard.points]
+
+    def action_evs(self, player: Player, upcard: Card,
+                   composition_class: int = NEUTRAL_CLASS) -> Dict[str, float]:
+        """EV доступных игроку действий (удвоение - только на двух картах)"""
+        evs = self.evs[composition_class][upcard.points][player.aces > 0][min(player.hard_total, 21)]
+        available = ACTIONS if len(player.hand) == 2 else ACTIONS[:2]
+        return {action: ev for action, ev in zip(available, evs)}
+
+    def best_action(self, player: Player, upcard: Card,
+                    composition_class: int = NEUTRAL_CLASS) -> str:
+        if player.has_blackjack() or player.is_bust():
+            return "stand"
+        evs = self.action_evs(player, upcard, composition_class)
+        return max(evs, key=evs.get)
+
+_tables: Optional[BlackjackTables] = None
+_lock = threading.Lock()
+
+def get_tables() -> BlackjackTables:
+    """Таблицы процесса: загружаются при первом обращении"""
+    global _tables
+    with _lock:
+        if _tables is None:
+            _tables = BlackjackTables.load()
+        return _tables
@@ -1,6 +1,7 @@
-import random
+import time
 from typing import List, Dict, Tuple, Optional
-from config import ROULETTE_MIN_BET, ROULETTE_MULTIPLIERS
+from config import ROULETTE_MIN_BET, ROULETTE_MULTIPLIERS, ROULETTE_BET_TIMEOUT, ROULETTE_TABLE_MAX_PLAYERS
+from rng import ServerSeed, replay_random
 
 # Номера рулетки
 NUMBERS = list(range(37))  # 0-36
@@ -23,59 +24,172 @@ COLUMNS = {
     'third': list(range(3, 37, 3))
 }
 
+# Порядок чисел на колесе (для ставки на соседей)
+WHEEL_ORDER = [0, 32, 15, 19, 4, 21, 2, 25, 17, 34, 6, 27, 13, 36, 11, 30, 8, 23, 10, 5,
+               24, 16, 33, 1, 20, 14, 31, 9, 22, 18, 29, 7, 28, 12, 35, 3, 26]
+NEIGHBOURS = 2  # соседей с каждой стороны
+
+# Внутренние ставки: значение - покрытые числа через дефис ("17-20", "0-1-2-3")
+INSIDE_BETS = ('split', 'street', 'corner', 'six_line')
+
+# Быстрые ставки (кнопки бота): название -> (тип, значение)
+QUICK_BETS = {
+    "red": ("color", "red"),
+    "black": ("color", "black"),
+    "zero": ("number", "0"),
+    "even": ("even_odd", "even"),
+    "odd": ("even_odd", "odd")
+}
+
+def _payout_multiplier(bet_type: str) -> int:
+    """Чистый выигрыш на единицу ставки для типа ставки (у соседей - на единицу части ставки)"""
+    if bet_type == 'color':
+        return ROULETTE_MULTIPLIERS['red_black']
+    return ROULETTE_MULTIPLIERS[bet_type]
+
+def _join(numbers: List[int]) -> str:
+    return "-".join(str(number) for number in sorted(numbers))
+
+def normalize_value(bet_type: str, value) -> Optional[str]:
+    """Значение ставки в виде ключа таблицы (None - значение не разобрать)"""
+    try:
+        if bet_type in ('number', 'neighbours'):
+            return str(int(value))
+        if bet_type in INSIDE_BETS:
+            return _join([int(part) for part in str(value).split('-')])
+    except (TypeError, ValueError):
+        return None
+    return str(value)
+
+def _coverage() -> Dict[Tuple[str, str], List[int]]:
+    """Числа, на которых выигрывает каждая возможная ставка (зеро - только у ставок, где оно есть)"""
+    rows = [[n, n + 1, n + 2] for n in range(1, 37, 3)]  # ряды стола, по три числа
+    splits = [[0, 1], [0, 2], [0, 3]]
+    for n in range(1, 37):
+        if n % 3:
+            splits.append([n, n + 1])
+        if n <= 33:
+            splits.append([n, n + 3])
+    inside = {
+        'split': splits,
+        'street': [[0, 1, 2], [0, 2, 3]] + rows,
+        'corner': [[0, 1, 2, 3]] + [[n, n + 1, n + 3, n + 4] for n in range(1, 33) if n % 3],
+        'six_line': [rows[i] + rows[i + 1] for i in range(len(rows) - 1)]
+    }
+
+    coverage = {('number', str(n)): [n] for n in NUMBERS}
+    for bet_type, sets in inside.items():
+        coverage.update(((bet_type, _join(numbers)), numbers) for numbers in sets)
+    for n in NUMBERS:
+        i = WHEEL_ORDER.index(n)
+        coverage[('neighbours', str(n))] = [WHEEL_ORDER[(i + k) % len(WHEEL_ORDER)]
+                                             for k in range(-NEIGHBOURS, NEIGHBOURS + 1)]
+    coverage[('color', 'red')] = RED_NUMBERS
+    coverage[('color', 'black')] = BLACK_NUMBERS
+    coverage[('even_odd', 'even')] = [n for n in NUMBERS if n and n % 2 == 0]
+    coverage[('even_odd', 'odd')] = [n for n in NUMBERS if n % 2 == 1]
+    coverage[('high_low', 'low')] = list(range(1, 19))
+    coverage[('high_low', 'high')] = list(range(19, 37))
+    coverage.update((('dozen', value), numbers) for value, numbers in DOZENS.items())
+    coverage.update((('column', value), numbers) for value, numbers in COLUMNS.items())
+    return coverage
+
+def _build_bet_table() -> Dict[Tuple[str, str], Tuple[int, int, int]]:
+    table = {}
+    for key, numbers in _coverage().items():
+        mask = 0
+        for number in numbers:
+            mask |= 1 << number
+        # Соседи - это ставки на каждое покрытое число: ставка делится на части
+        units = len(numbers) if key[0] == 'neighbours' else 1
+        table[key] = (mask, _payout_multiplier(key[0]), units)
+    return table
+
+# Все ставки европейского стола: (тип, значение) -> (маска покрытых чисел, бит n - число n;
+# множитель; на сколько равных частей делится ставка). Проверка и расчет любой ставки -
+# одно чтение словаря и проверка бита
+BET_TABLE = _build_bet_table()
+
+# Значения ставок каждого типа в порядке стола (для кнопок бота)
+def _bet_options() -> Dict[str, List[str]]:
+    options: Dict[str, List[str]] = {}
+    for bet_type, value in BET_TABLE:
+        options.setdefault(bet_type, []).append(value)
+    return options
+
+BET_OPTIONS = _bet_options()
+
+def compile_bet(bet_type: str, value: str) -> Tuple[int, int, int]:
+    """Маска покрытых чисел, множитель выигрыша и число частей ставки"""
+    return BET_TABLE[(bet_type, normalize_value(bet_type, value))]
+
+def number_color(number: int) -> str:
+    return 'red' if number in RED_NUMBERS else 'black' if number in BLACK_NUMBERS else 'green'
+
 class Bet:
+    __slots__ = ('bet_type', 'value', 'amount', 'mask', 'multiplier', 'units')
+
     def __init__(self, bet_type: str, value: str, amount: int):
         self.bet_type = bet_type
         self.value = value
         self.amount = amount
+        self.mask: Optional[int] = None
+        self.multiplier: Optional[int] = None
+        self.units = 1
+
+    def compile(self) -> None:
+        """Посчитать маску и множитель один раз (ставка должна быть валидной)"""
+        self.mask, self.multiplier, self.units = compile_bet(self.bet_type, self.value)
+
+    def net_result(self, number: int) -> int:
+        """Чистый результат ставки при выпавшем числе.
+
+        Ставка из нескольких частей выигрывает одной частью, остальные проигрывают.
+        """
+        if self.mask is None:
+            self.compile()
+        if self.mask >> number & 1:
+            return self.amount // self.units * (self.multiplier + 1) - self.amount
+        return -self.amount
 
     def is_valid(self) -> bool:
-        """Проверить валидность ставки"""
+        """Проверить валидность ставки (ставка на соседей делится на части без остатка)"""
         if self.amount < ROULETTE_MIN_BET:
             return False
-        
-        if self.bet_type == 'number':
-            try:
-                number = int(self.value)
-                return 0 <= number <= 36
-            except ValueError:
-                return False
-        
-        elif self.bet_type == 'color':
-            return self.value in ['red', 'black']
-        
-        elif self.bet_type == 'even_odd':
-            return self.value in ['even', 'odd']
-        
-        elif self.bet_type == 'dozen':
-            return self.value in ['first', 'second', 'third']
-        
-        elif self.bet_type == 'column':
-            return self.value in ['first', 'second', 'third']
-        
-        return False
+        entry = BET_TABLE.get((self.bet_type, normalize_value(self.bet_type, self.value)))
+        return entry is not None and self.amount % entry[2] == 0
 
 class RouletteGame:
-    def __init__(self, game_mode: str = "single", room_id: Optional[str] = None, chat_id: Optional[int] = None):
+    def __init__(self, game_mode: str = "single", room_id: Optional[str] = None, chat_id: Optional[int] = None,
+                 rng=None):
         self.game_mode = game_mode  # "single" или "multi"
         self.players: Dict[int, List[Bet]] = {}  # user_id -> list of bets
+        self.payouts: Dict[int, List[int]] = {}  # user_id -> чистый результат всех ставок для каждого числа
         self.game_started = False
         self.waiting_for_players = True
         self.room_id = room_id
         self.chat_id = chat_id
         self.current_number = None
         self.betting_time = True
+        # Зерно вращения: хэш известен до ставок, само зерно раскрывается после
+        self.seed = ServerSeed() if rng is None else None
+        self.rng = rng if rng is not None else self.seed.random
+        self.quick_bet_type: Optional[str] = None  # ставка play(), нужна для повтора
         
         if game_mode == "single":
             self.max_players = 1
             self.min_players = 1
+        elif game_mode == "table":
+            # Общий стол: игроки подходят во время окна ставок, вращение - по таймеру
+            self.max_players = ROULETTE_TABLE_MAX_PLAYERS
+            self.min_players = 1
         else:
             self.max_players = int(room_id.split('_')[2]) if room_id else 6
             self.min_players = self.max_players
     
     def add_player(self, user_id: int, bet: int, username: str = "") -> Tuple[bool, str]:
-        """Добавить игрока в игру"""
-        if self.game_started:
+        """Добавить игрока в игру (за общий стол - пока идет окно ставок)"""
+        if self.game_started and not (self.game_mode == "table" and self.betting_time):
             return False, "Игра уже началась"
         if len(self.players) >= self.max_players:
             return False, f"Максимальное количество игроков: {self.max_players}"
@@ -83,6 +197,7 @@ class RouletteGame:
             return False, "Вы уже в игре"
         
         self.players[user_id] = []
+        self.payouts[user_id] = [0] * len(NUMBERS)
         return True, "Игрок добавлен"
     
     def start_game(self) -> Tuple[bool, str]:
@@ -108,6 +223,11 @@ class RouletteGame:
         if not bet.is_valid():
             return False, "Неверная ставка"
         
+        # Ставка сразу раскладывается по всем 37 исходам: расчет вращения - одно чтение на игрока
+        bet.compile()
+        payouts = self.payouts[user_id]
+        for number in NUMBERS:
+            payouts[number] += bet.net_result(number)
         self.players[user_id].append(bet)
         return True, f"Ставка принята: {bet.bet_type} {bet.value} на {bet.amount}"
     
@@ -116,49 +236,76 @@ class RouletteGame:
         if not self.game_started:
             return {}
         self.betting_time = False
-        self.current_number = random.choice(NUMBERS)
-        results = {}
-        for user_id, bets in self.players.items():
-            total_win = 0
-            for bet in bets:
-                if self._is_winning_bet(bet):
-                    if bet.bet_type == 'color':
-                        multiplier = ROULETTE_MULTIPLIERS.get('color', 2)
-                    else:
-                        multiplier = ROULETTE_MULTIPLIERS[bet.bet_type]
-                    total_win += bet.amount * multiplier
-                else:
-                    total_win -= bet.amount
-            results[user_id] = total_win
-        return results
+        self.current_number = self.rng.choice(NUMBERS)
+        return self.settle(self.current_number)
+    
+    def settle(self, number: int) -> Dict[int, int]:
+        """Чистый результат каждого игрока при выпавшем числе"""
+        return {user_id: payouts[number] for user_id, payouts in self.payouts.items()}
+    
+    def session_players(self, results: Dict[int, int]) -> List[Dict]:
+        """Игроки раунда для проводки и сессии: ставки сохраняются, чтобы раунд можно было повторить"""
+        return [{
+            "user_id": user_id,
+            "bet": sum(bet.amount for bet in self.players[user_id]),
+            "result": result,
+            "bets": [[bet.bet_type, bet.value, bet.amount] for bet in self.players[user_id]]
+        } for user_id, result in results.items()]
+    
+    def fairness(self) -> Dict:
+        """Зерно вращения для записи в сессию: раскрывается только после вращения"""
+        if not self.seed:
+            return {}
+        if self.current_number is None:
+            return self.seed.commit()
+        record = {**self.seed.reveal(), "offset": 0, "draws": self.rng.consumed}
+        if self.quick_bet_type is not None:
+            record["bet_type"] = self.quick_bet_type
+        return record
+    
+    @classmethod
+    def replay(cls, fair: Dict, players: List[Dict]) -> Dict:
+        """Повторить раунд по записи fairness() и игрокам сессии.
+
+        Быстрая игра (play) записана с bet_type, раунд общего стола - со
+        ставками каждого игрока (bets: [тип, значение, сумма]).
+        """
+        rng = replay_random(fair["server_seed"], fair.get("offset", 0))
+        if "bet_type" in fair:
+            result = cls(rng=rng).play(fair["bet_type"])
+            results = {player["user_id"]: result["prize"] if result["win"] else -result["bet"] for player in players}
+            number = result["number"]
+        else:
+            game = cls(game_mode="table", rng=rng)
+            for player in players:
+                game.add_player(player["user_id"], player["bet"])
+            game.start_game()
+            for player in players:
+                for bet_type, value, amount in player["bets"]:
+                    ok, message = game.place_bet(player["user_id"], Bet(bet_type, value, amount))
+                    if not ok:
+                        raise ValueError(message)
+            results = game.spin()
+            number = game.current_number
+        return {
+            "results": results,
+            "outcome": {"number": number},
+            "draws": rng.consumed - fair.get("offset", 0)
+        }
+    
+    def get_multiplier(self, bet: Bet) -> float:
+        """Чистый выигрыш на единицу ставки при выигрыше"""
+        if bet.mask is None:
+            bet.compile()
+        return (bet.multiplier + 1) / bet.units - 1
     
     def _is_winning_bet(self, bet: Bet) -> bool:
         """Проверить, выиграла ли ставка"""
-        if self.current_number == 0:
-            return bet.bet_type == 'number' and int(bet.value) == 0
-        
-        if bet.bet_type == 'number':
-            return int(bet.value) == self.current_number
-        
-        elif bet.bet_type == 'color':
-            if bet.value == 'red':
-                return self.current_number in RED_NUMBERS
-            else:  # black
-                return self.current_number in BLACK_NUMBERS
-        
-        elif bet.bet_type == 'even_odd':
-            if bet.value == 'even':
-                return self.current_number is not None and self.current_number % 2 == 0 and self.current_number != 0
-            else:  # odd
-                return self.current_number is not None and self.current_number % 2 == 1 and self.current_number != 0
-        
-        elif bet.bet_type == 'dozen':
-            return self.current_number in DOZENS[bet.value]
-        
-        elif bet.bet_type == 'column':
-            return self.current_number in COLUMNS[bet.value]
-        
-        return False
+        if self.current_number is None:
+            return False
+        if bet.mask is None:
+            bet.compile()
+        return bool(bet.mask >> self.current_number & 1)
     
     def get_game_state(self) -> str:
         """Получить текущее состояние игры в виде строки"""
@@ -187,35 +334,107 @@ class RouletteGame:
     
     def play(self, bet_type: str) -> Dict:
         """Быстрая игра в рулетку"""
+        self.quick_bet_type = bet_type
         # Определяем ставку
         bet_amount = ROULETTE_MIN_BET
-        bet = None
-        if bet_type == "red":
-            bet = Bet("color", "red", bet_amount)
-        elif bet_type == "black":
-            bet = Bet("color", "black", bet_amount)
-        elif bet_type == "zero":
-            bet = Bet("number", "0", bet_amount)
-        elif bet_type == "even":
-            bet = Bet("even_odd", "even", bet_amount)
-        elif bet_type == "odd":
-            bet = Bet("even_odd", "odd", bet_amount)
-        if not bet:
+        if bet_type not in QUICK_BETS:
             return {"win": False, "error": "Неверный тип ставки"}
+        bet = Bet(*QUICK_BETS[bet_type], bet_amount)
         # Крутим рулетку
-        self.current_number = random.choice(NUMBERS)
+        self.current_number = self.rng.choice(NUMBERS)
         color = "🔴" if self.current_number in RED_NUMBERS else "⚫" if self.current_number in BLACK_NUMBERS else "🟢"
         # Проверяем выигрыш
+        bet.compile()
         win = self._is_winning_bet(bet)
-        if bet.bet_type == 'color':
-            multiplier = ROULETTE_MULTIPLIERS.get('color', 2)
-        else:
-            multiplier = ROULETTE_MULTIPLIERS[bet.bet_type]
-        prize = bet_amount * multiplier if win else 0
+        prize = bet.net_result(self.current_number) if win else 0
         return {
             "win": win,
             "number": self.current_number,
             "color": color,
             "bet": bet_amount,
             "prize": prize
-        } 
\ No newline at end of file
+        } 
+
+class RouletteTable:
+    """Общий стол рулетки: раунды с окном ставок для любого числа игроков.
+
+    Первая ставка открывает раунд (RouletteGame в режиме "table"), через
+    betting_time вызывающий код закрывает его: одно вращение, результаты
+    всех игроков читаются из заранее разложенных выплат. Запись в БД и
+    уведомления - забота вызывающего кода (бот планирует закрытие в JobQueue).
+    Раунд, который не удалось провести, аннулируется: его ставки хранятся
+    в voided, и игрок может поставить их заново.
+    """
+
+    def __init__(self, table_id: str, title: str = "", betting_time: float = ROULETTE_BET_TIMEOUT):
+        self.table_id = table_id
+        self.title = title or table_id
+        self.betting_time = betting_time
+        self.round: Optional[RouletteGame] = None
+        self.closes_at: Optional[float] = None
+        self.chats: Dict[int, int] = {}  # user_id -> чат для результата раунда
+        self.rounds_played = 0
+        self.voided: Dict[int, List[Bet]] = {}  # user_id -> ставки аннулированного раунда
+
+    def seconds_left(self) -> float:
+        """Сколько осталось до вращения (0, если раунд не открыт)"""
+        if self.closes_at is None:
+            return 0.0
+        return max(0.0, self.closes_at - time.monotonic())
+
+    def place_bet(self, user_id: int, bet: Bet, balance: int, chat_id: Optional[int] = None) -> Tuple[bool, str, bool]:
+        """Принять ставку в текущий раунд. Возвращает (принята, сообщение, открыт ли этой ставкой новый раунд).
+
+        Сумма ставок игрока в раунде не может превышать его баланс: списание
+        одно, при закрытии раунда.
+        """
+        if not bet.is_valid():
+            return False, "Неверная ставка", False
+        game = self.round or RouletteGame(game_mode="table")
+        staked = sum(placed.amount for placed in game.players.get(user_id, []))
+        if staked + bet.amount > balance:
+            return False, "Недостаточно монет для этой ставки", False
+        if user_id not in game.players:
+            ok, message = game.add_player(user_id, bet.amount)
+            if not ok:
+                return False, message, False
+        opened = self.round is None
+        if opened:
+            game.start_game()
+            self.round = game
+            self.closes_at = time.monotonic() + self.betting_time
+        ok, message = game.place_bet(user_id, bet)
+        if chat_id is not None:
+            self.chats[user_id] = chat_id
+        return ok, message, opened
+
+    def close_round(self) -> Tuple[Optional[RouletteGame], Dict[int, int], Dict[int, int]]:
+        """Закрыть раунд и крутить: (игра, {user_id: чистый результат}, {user_id: чат})"""
+        game, chats = self.round, self.chats
+        self.round, self.closes_at, self.chats = None, None, {}
+        if game is None:
+            return None, {}, {}
+        self.rounds_played += 1
+        return game, game.spin(), chats
+
+    def void_round(self, game: RouletteGame) -> None:
+        """Аннулировать закрытый раунд, который не удалось провести: ставки сохраняются для повтора"""
+        for user_id, bets in game.players.items():
+            self.voided.setdefault(user_id, []).extend(bets)
+
+    def retry_voided(self, user_id: int, balance: int, chat_id: Optional[int] = None) -> Tuple[bool, str, bool]:
+        """Поставить ставки аннулированного раунда в текущий раунд (как place_bet).
+
+        Не принятые ставки остаются в voided.
+        """
+        bets = self.voided.pop(user_id, [])
+        if not bets:
+            return False, "Нет ставок для повтора", False
+        opened = False
+        for i, bet in enumerate(bets):
+            ok, message, opened_now = self.place_bet(user_id, Bet(bet.bet_type, bet.value, bet.amount), balance, chat_id)
+            opened = opened or opened_now
+            if not ok:
+                self.voided[user_id] = bets[i:]
+                return i > 0, message, opened
+        return True, f"Ставок повторено: {len(bets)}", opened
@@ -1,19 +1,145 @@
-import random
-from typing import List, Dict, Tuple, Optional
-from config import SLOTS_MIN_BET, SLOTS_MULTIPLIER
+from itertools import product
+from typing import List, Dict, Tuple, Optional, Sequence
+from config import (SLOTS_MIN_BET, SLOTS_MULTIPLIER, MAX_BET, SLOTS_REEL_WEIGHTS, SLOTS_PAYTABLE, SLOTS_PAYLINES,
+                    SLOTS_AUTOPLAY_MAX_SPINS)
+from rng import AliasTable, ServerSeed, replay_random
 
 # Символы слотов
 SYMBOLS = ['🍒', '🍋', '🍊', '🍇', '💎', '7️⃣']
+SYMBOL_INDEX = {symbol: i for i, symbol in enumerate(SYMBOLS)}
+
+# Сетка: три барабана по три строки, ячейка барабана reel в строке row - grid[reel * GRID_ROWS + row]
+GRID_ROWS = 3
+
+Line = Tuple[str, str, str]
+
+def _rule_matches(rule: Dict, line: Line) -> bool:
+    counts = {symbol: line.count(symbol) for symbol in line}
+    if rule["match"] == "three":
+        needed = 3
+    elif rule["match"] == "two":
+        needed = 2
+    else:
+        raise ValueError(f"Неизвестное правило выплаты: {rule['match']}")
+    if "symbol" in rule:
+        return counts.get(rule["symbol"]) == needed
+    return needed in counts.values()
+
+def compile_paytable(paytable: List[Dict], symbols: List[str] = SYMBOLS) -> Dict[Line, int]:
+    """Множитель для каждой возможной линии (первое подходящее правило; линии без выигрыша не хранятся)"""
+    payouts = {}
+    for line in product(symbols, repeat=3):
+        for rule in paytable:
+            if _rule_matches(rule, line):
+                if rule["multiplier"]:
+                    payouts[line] = rule["multiplier"]
+                break
+    return payouts
+
+def build_reels(weights: List[Dict[str, int]], symbols: List[str] = SYMBOLS) -> List[AliasTable]:
+    """Таблицы алиасов барабанов по весам символов"""
+    if len(weights) != 3:
+        raise ValueError("Нужны веса для трех барабанов")
+    return [AliasTable(symbols, [reel.get(symbol, 0) for symbol in symbols]) for reel in weights]
+
+# Считаются один раз при загрузке: вращение - выборки из алиасов и одно чтение словаря
+LINE_PAYOUTS = compile_paytable(SLOTS_PAYTABLE)
+REELS = build_reels(SLOTS_REEL_WEIGHTS)
+
+class Paylines:
+    """Линии выплат над сеткой барабанов.
+
+    Каждая линия заранее сведена к трем индексам ячеек сетки, а таблица
+    выплат - к списку множителей по коду линии a * n² + b * n + c (n - число
+    символов). Оценка линии - три чтения сетки и одно чтение списка;
+    evaluate_batch делает то же для массива сеток одной операцией numpy.
+    """
+
+    def __init__(self, patterns: Dict[str, Sequence[int]], payouts: Dict[Line, int] = LINE_PAYOUTS):
+        for name, rows in patterns.items():
+            if len(rows) != 3 or any(row not in range(GRID_ROWS) for row in rows):
+                raise ValueError(f"Линия {name}: нужна строка 0-{GRID_ROWS - 1} для каждого из трех барабанов")
+        n = len(SYMBOLS)
+        self.names = tuple(patterns)
+        self.rows = tuple(tuple(rows) for rows in patterns.values())
+        self.indices = tuple(tuple(reel * GRID_ROWS + row for reel, row in enumerate(rows)) for rows in self.rows)
+        self.multipliers = [0] * n ** 3
+        for line, multiplier in payouts.items():
+            a, b, c = (SYMBOL_INDEX[symbol] for symbol in line)
+            self.multipliers[(a * n + b) * n + c] = multiplier
+        self._arrays = None
+
+    def select(self, names: Sequence[str]) -> Tuple[int, ...]:
+        """Номера линий по названиям (для ставки игрока)"""
+        if not names or len(set(names)) != len(names):
+            raise ValueError("Нужна хотя бы одна линия, без повторов")
+        unknown = [name for name in names if name not in self.names]
+        if unknown:
+            raise ValueError(f"Неизвестные линии: {', '.join(unknown)}")
+        return tuple(self.names.index(name) for name in names)
+
+    def evaluate(self, grid: Sequence[int], lines: Sequence[int]) -> List[int]:
+        """Множители выбранных линий одной сетки (коды символов)"""
+        n = len(SYMBOLS)
+        multipliers = self.multipliers
+        result = []
+        for line in lines:
+            a, b, c = self.indices[line]
+            result.append(multipliers[(grid[a] * n + grid[b]) * n + grid[c]])
+        return result
+
+    def evaluate_batch(self, grids, lines: Optional[Sequence[int]] = None):
+        """Множители линий для массива сеток формы (N, 3 * GRID_ROWS): результат (N, число линий)"""
+        import numpy as np  # нужен только пакетной оценке (симуляции), бот обходится без него
+
+        if self._arrays is None:
+            self._arrays = (np.array(self.indices, dtype=np.intp), np.array(self.multipliers))
+        indices, multipliers = self._arrays
+        if lines is not None:
+            indices = indices[list(lines)]
+        n = len(SYMBOLS)
+        cells = np.asarray(grids, dtype=np.intp)[:, indices]  # (N, линии, 3)
+        return multipliers[(cells[..., 0] * n + cells[..., 1]) * n + cells[..., 2]]
+
+PAYLINES = Paylines(SLOTS_PAYLINES)
+
+# Результат игрока по списанной ставке и выигрышу: бот и автоигра списывают
+# ставку и начисляют выигрыш, одиночное вращение веб-приложения при выигрыше
+# начисляет его, не списывая ставку
+SETTLEMENTS = {
+    "bot": lambda stake, win: win - stake,
+    "web": lambda stake, win: win if win > 0 else -stake,
+}
+
+def line_probability(line: Line) -> float:
+    """Вероятность линии: строки барабанов выпадают независимо по их весам"""
+    probability = 1.0
+    for reel, symbol in zip(REELS, line):
+        probability *= reel.probability(symbol)
+    return probability
+
+def expected_multiplier() -> float:
+    """Средний множитель линии (RTP бота: ставка списывается, выигрыш = ставка * множитель)"""
+    return sum(multiplier * line_probability(line) for line, multiplier in LINE_PAYOUTS.items())
 
 class SlotsGame:
-    def __init__(self, game_mode: str = "single", room_id: Optional[str] = None, chat_id: Optional[int] = None):
+    def __init__(self, game_mode: str = "single", room_id: Optional[str] = None, chat_id: Optional[int] = None,
+                 rng=None):
         self.game_mode = game_mode  # "single" или "multi"
         self.players: Dict[int, int] = {}  # user_id -> bet
+        # Многолинейный режим: user_id -> номера линий PAYLINES, ставка игрока - на каждую линию
+        self.lines: Dict[int, Tuple[int, ...]] = {}
+        self.line_wins: Dict[int, Dict[str, int]] = {}  # user_id -> {линия: множитель} выигравших линий
         self.game_started = False
         self.waiting_for_players = True
         self.room_id = room_id
         self.chat_id = chat_id
         self.reels: List[List[str]] = [[], [], []]
+        self.grid: List[int] = []  # коды символов сетки, см. GRID_ROWS
+        # Без внешнего генератора каждый раунд играется от своего зерна сервера
+        self._shared_rng = rng
+        self.seed: Optional[ServerSeed] = None
+        self.rng = rng
         
         if game_mode == "single":
             self.max_players = 1
@@ -22,8 +148,9 @@ class SlotsGame:
             self.max_players = int(room_id.split('_')[2]) if room_id else 6
             self.min_players = self.max_players
     
-    def add_player(self, user_id: int, bet: int, username: str = "") -> Tuple[bool, str]:
-        """Добавить игрока в игру"""
+    def add_player(self, user_id: int, bet: int, username: str = "",
+                   lines: Optional[Sequence[str]] = None) -> Tuple[bool, str]:
+        """Добавить игрока в игру; lines - названия линий SLOTS_PAYLINES (ставка bet на каждую)"""
         if self.game_started:
             return False, "Игра уже началась"
         if bet < SLOTS_MIN_BET:
@@ -32,10 +159,19 @@ class SlotsGame:
             return False, f"Максимальное количество игроков: {self.max_players}"
         if user_id in self.players:
             return False, "Вы уже в игре"
+        if lines is not None:
+            try:
+                self.lines[user_id] = PAYLINES.select(lines)
+            except ValueError as e:
+                return False, str(e)
         
         self.players[user_id] = bet
         return True, "Игрок добавлен"
     
+    def stake(self, user_id: int) -> int:
+        """Сколько списать с игрока: ставка на линию, умноженная на число линий"""
+        return self.players[user_id] * len(self.lines.get(user_id, (None,)))
+    
     def start_game(self) -> Tuple[bool, str]:
         """Начать игру"""
         if len(self.players) < self.min_players:
@@ -44,42 +180,76 @@ class SlotsGame:
         self.game_started = True
         self.waiting_for_players = False
         
-        # Генерируем случайные символы для каждого барабана
-        for i in range(3):
-            self.reels[i] = [random.choice(SYMBOLS) for _ in range(3)]
+        if self._shared_rng is None:
+            self.seed = ServerSeed()
+            self.rng = self.seed.random
+        
+        # Генерируем случайные символы для каждого барабана по его весам
+        for i, reel in enumerate(REELS):
+            self.reels[i] = [reel.sample(self.rng) for _ in range(GRID_ROWS)]
+        self.grid = [SYMBOL_INDEX[symbol] for reel in self.reels for symbol in reel]
         
         return True, "Игра началась"
     
     def get_win_amount(self, symbols: List[str]) -> int:
-        """Рассчитать выигрыш"""
-        # Проверяем выигрышные комбинации
-        if all(s == '7️⃣' for s in symbols):
-            return 10  # Джекпот
-        elif all(s == '💎' for s in symbols):
-            return 5   # Большой выигрыш
-        elif all(s == symbols[0] for s in symbols):
-            return 3   # Обычный выигрыш
-        elif len(set(symbols)) == 2:
-            return 2   # Маленький выигрыш
-        return 0      # Проигрыш
+        """Рассчитать выигрыш (множитель линии по таблице выплат)"""
+        return LINE_PAYOUTS.get(tuple(symbols), 0)
     
     def spin(self) -> Dict[int, Tuple[List[str], int]]:
         """Крутить слоты и определить выигрыши"""
         results = {}
         
         for user_id, bet in self.players.items():
+            lines = self.lines.get(user_id)
+            if lines is not None:
+                # Многолинейная ставка: показываем лучшую линию, выигрыш - по всем
+                multipliers = PAYLINES.evaluate(self.grid, lines)
+                best = max(range(len(lines)), key=multipliers.__getitem__)
+                symbols = [reel[row] for reel, row in zip(self.reels, PAYLINES.rows[lines[best]])]
+                self.line_wins[user_id] = {
+                    PAYLINES.names[line]: multiplier for line, multiplier in zip(lines, multipliers) if multiplier
+                }
+                results[user_id] = (symbols, bet * sum(multipliers))
+                continue
+            
             # Выбираем случайную линию из среднего барабана
-            line_index = random.randint(0, 2)
+            line_index = self.rng.randint(0, 2)
             symbols = [reel[line_index] for reel in self.reels]
             
             # Рассчитываем выигрыш
-            multiplier = self.get_win_amount(symbols)
+            multiplier = LINE_PAYOUTS.get(tuple(symbols), 0)
             win_amount = bet * multiplier
             
             results[user_id] = (symbols, win_amount)
         
         return results
     
+    def fairness(self) -> Dict:
+        """Зерно раунда и число выданных им байтов для записи в сессию (после вращения его можно раскрыть)"""
+        if not self.seed:
+            return {}
+        return {**self.seed.reveal(), "offset": 0, "draws": self.rng.consumed}
+    
+    @classmethod
+    def replay(cls, fair: Dict, players: List[Dict]) -> Dict:
+        """Повторить раунд по записи fairness() и игрокам сессии.
+
+        Результат игрока - как в боте: выигрыш минус списанная ставка.
+        """
+        rng = replay_random(fair["server_seed"], fair.get("offset", 0))
+        settle = SETTLEMENTS[fair.get("settlement", "bot")]
+        game = cls(rng=rng)
+        game.max_players = game.min_players = len(players)
+        for player in players:
+            game.add_player(player["user_id"], player["bet"], lines=player.get("lines"))
+        game.start_game()
+        spins = game.spin()
+        return {
+            "results": {user_id: settle(game.stake(user_id), win) for user_id, (_, win) in spins.items()},
+            "outcome": {"symbols": next(iter(spins.values()))[0]},
+            "draws": rng.consumed - fair.get("offset", 0)
+        }
+    
     def get_game_state(self) -> str:
         """Получить текущее состояние игры в виде строки"""
         state = []
@@ -92,6 +262,106 @@ class SlotsGame:
         
         # Добавляем ставки игроков
         for user_id, bet in self.players.items():
-            state.append(f"\nИгрок {user_id}: Ставка {bet}")
+            if user_id in self.lines:
+                state.append(f"\nИгрок {user_id}: Ставка {bet} x {len(self.lines[user_id])} линий")
+            else:
+                state.append(f"\nИгрок {user_id}: Ставка {bet}")
         
-        return "\n".join(state) 
\ No newline at end of file
+        return "\n".join(state) 
+
+def spin(bet: int) -> Tuple[List[str], int, bool, Dict]:
+    """Одиночное вращение для веб-интерфейса: (комбинация, выигрыш, успех, запись fairness).
+
+    Веб списывает ставку только при проигрыше, поэтому запись помечена settlement "web".
+    """
+    if bet < SLOTS_MIN_BET or bet > MAX_BET:
+        return [], 0, False, {}
+    game = SlotsGame()
+    game.add_player(0, bet)
+    game.start_game()
+    symbols, win_amount = game.spin()[0]
+    return symbols, win_amount, True, {**game.fairness(), "settlement": "web"}
+
+def autoplay(user_id: int, bet: int, spins: int, balance: int,
+             stop_on_win: Optional[int] = None, stop_below: Optional[int] = None,
+             lines: Optional[Sequence[str]] = None) -> Dict:
+    """Серия вращений одного игрока за один запрос (без записи в БД).
+
+    Вращения идут от одного зерна сервера подряд, у каждого в записи свое
+    смещение потока, поэтому любое из них повторяется как обычная сессия.
+    Серия останавливается после spins вращений, на выигрыше не меньше
+    stop_on_win, когда баланс опускается ниже stop_below или перестает
+    покрывать ставку. Результат вращения - выигрыш минус ставка, как в боте,
+    в том числе для веб-приложения. Раунды готовы для LedgerWriter.settle_series.
+    """
+    if not 1 <= spins <= SLOTS_AUTOPLAY_MAX_SPINS:
+        raise ValueError(f"Число вращений: от 1 до {SLOTS_AUTOPLAY_MAX_SPINS}")
+    if bet < SLOTS_MIN_BET or bet > MAX_BET:
+        raise ValueError(f"Ставка: от {SLOTS_MIN_BET} до {MAX_BET}")
+    settle = SETTLEMENTS["bot"]
+    seed = ServerSeed()
+    stream = seed.random
+    rounds = []
+    stopped = "spins"
+    for _ in range(spins):
+        game = SlotsGame(rng=stream)
+        ok, message = game.add_player(user_id, bet, lines=lines)
+        if not ok:
+            raise ValueError(message)
+        stake = game.stake(user_id)
+        if balance < stake:
+            stopped = "balance"
+            break
+        offset = stream.consumed
+        game.start_game()
+        symbols, win = game.spin()[user_id]
+        result = settle(stake, win)
+        balance += result
+        player = {"user_id": user_id, "bet": bet, "result": result}
+        if lines is not None:
+            player["lines"] = list(lines)
+        fair = {"commitment": seed.commitment, "offset": offset, "draws": stream.consumed - offset}
+        rounds.append({
+            "result": result, "wager": stake, "win": win, "players": [player],
+            "outcome": {"symbols": symbols, "fair": fair}
+        })
+        if stop_on_win is not None and win >= stop_on_win:
+            stopped = "win"
+            break
+        if stop_below is not None and balance < stop_below:
+            stopped = "balance"
+            break
+    # Серия сыграна целиком до записи: зерно раскрывается сразу
+    for played in rounds:
+        played["outcome"]["fair"].update(seed.reveal())
+    if rounds:
+        # Причина остановки пишется в последнюю сессию: по ней повтор запроса восстанавливает итог
+        rounds[-1]["outcome"]["stopped"] = stopped
+    return {"rounds": rounds, "stopped": stopped, "balance": balance}
+
+def settled_series(sessions: List[Dict]) -> Dict:
+    """Серия автоигры, восстановленная по ее записанным сессиям (для ответа на повтор запроса)"""
+    rounds = []
+    for game in sessions:
+        player = game["players"][0]
+        stake = player["bet"] * len(player.get("lines") or (None,))
+        rounds.append({
+            "result": player["result"], "wager": stake, "win": player["result"] + stake,
+            "players": game["players"], "outcome": game["outcome"]
+        })
+    stopped = rounds[-1]["outcome"].get("stopped", "spins") if rounds else "spins"
+    return {"rounds": rounds, "stopped": stopped}
+
+def autoplay_summary(series: Dict) -> Dict:
+    """Краткий итог серии для ответа игроку"""
+    rounds = series["rounds"]
+    return {
+        "spins": len(rounds),
+        "wins": sum(played["win"] > 0 for played in rounds),
+        "wagered": sum(played["wager"] for played in rounds),
+        "won": sum(played["win"] for played in rounds),
+        "net": sum(played["result"] for played in rounds),
+        "biggest_win": max((played["win"] for played in rounds), default=0),
+        "last_symbols": rounds[-1]["outcome"]["symbols"] if rounds else [],
+        "stopped": series["stopped"]
+    }
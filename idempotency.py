@@ -0,0 +1,76 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from config import IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL
+
+class RecentKeys:
+    """Ограниченный набор недавних ключей идемпотентности с результатами.
+
+    Повторный запрос с тем же ключом получает результат первого (или ждет
+    его, если первый еще выполняется), не выполняя операцию снова. Ключи
+    хранятся не дольше ttl и не больше max_size; после вытеснения или
+    перезапуска повторную проводку отсекает уникальный
+    Transaction.idempotency_key в БД.
+    """
+
+    def __init__(self, max_size: int = IDEMPOTENCY_CACHE_SIZE, ttl: float = IDEMPOTENCY_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._keys: "OrderedDict[str, Tuple[float, Optional[asyncio.Future]]]" = OrderedDict()
+
+    def _lookup(self, key: str, now: float) -> Optional[Tuple[float, Optional[asyncio.Future]]]:
+        entry = self._keys.get(key)
+        if entry is not None and entry[0] <= now:
+            del self._keys[key]
+            return None
+        return entry
+
+    def _store(self, key: str, future: Optional[asyncio.Future], now: float) -> None:
+        self._keys[key] = (now + self.ttl, future)
+        while len(self._keys) > self.max_size:
+            self._keys.popitem(last=False)
+
+    def seen(self, key: str, now: Optional[float] = None) -> bool:
+        """Запомнить ключ. True, если он уже встречался"""
+        if now is None:
+            now = time.monotonic()
+        if self._lookup(key, now) is not None:
+            return True
+        self._store(key, None, now)
+        return False
+
+    async def run(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполнить func() один раз для ключа, повторам вернуть тот же результат"""
+        now = time.monotonic()
+        entry = self._lookup(key, now)
+        if entry is not None and entry[1] is not None:
+            return await asyncio.shield(entry[1])
+
+        future = asyncio.get_running_loop().create_future()
+        self._store(key, future, now)
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            self._keys.pop(key, None)
+            future.cancel()
+            raise
+        except Exception as e:
+            # Неудачную попытку можно повторить с тем же ключом
+            self._keys.pop(key, None)
+            future.set_exception(e)
+            # Помечаем исключение полученным: его уже получил вызывающий
+            future.exception()
+            raise
+        future.set_result(result)
+        return result
+
+    def discard(self, key: str) -> None:
+        """Забыть ключ, чтобы следующий запрос с ним выполнился заново"""
+        self._keys.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+recent_keys = RecentKeys()
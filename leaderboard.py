@@ -0,0 +1,103 @@
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+import database
+from config import LEADERBOARD_SIZE
+
+class Leaderboard:
+    """Таблица лидеров в памяти.
+
+    Балансы всех пользователей хранятся в отсортированном списке и
+    обновляются после каждого закоммиченного изменения баланса, поэтому
+    показ таблицы и поиск места игрока не обращаются к БД. Готовый текст
+    кэшируется до следующего изменения (по номеру версии).
+    """
+
+    def __init__(self, size: int = LEADERBOARD_SIZE):
+        self.size = size
+        self.version = 0
+        self._watched = size  # самый длинный показанный список: изменения ниже него текст не меняют
+        self._lock = threading.Lock()
+        self._balances: Dict[int, int] = {}
+        self._usernames: Dict[int, str] = {}
+        self._order: List[Tuple[int, int]] = []  # (-balance, user_id) по возрастанию
+        self._rendered: Dict[int, Tuple[int, str]] = {}  # limit -> (version, text)
+
+    def load(self, users: List[Dict]) -> None:
+        """Перестроить таблицу по списку пользователей из БД"""
+        with self._lock:
+            self._balances = {user["user_id"]: user["balance"] for user in users}
+            self._usernames = {user["user_id"]: user["username"] for user in users}
+            self._order = sorted((-balance, user_id) for user_id, balance in self._balances.items())
+            self.version += 1
+
+    def rebuild(self, session: Session) -> None:
+        """Загрузить всех пользователей из БД"""
+        self.load(database.get_all_users(session))
+
+    def update(self, record: Dict) -> None:
+        """Учесть изменение пользователя (слушатель database.add_user_listener)"""
+        user_id = record["user_id"]
+        with self._lock:
+            old_balance = self._balances.get(user_id)
+            old_index = None
+            if old_balance is not None:
+                old_index = bisect_left(self._order, (-old_balance, user_id))
+
+            username = record.get("username")
+            if username is not None and username != self._usernames.get(user_id):
+                self._usernames[user_id] = username
+                if old_index is not None and old_index < self._watched:
+                    self.version += 1
+
+            balance = record.get("balance")
+            if balance is None or balance == old_balance:
+                return
+            if old_index is not None:
+                del self._order[old_index]
+            insort(self._order, (-balance, user_id))
+            self._balances[user_id] = balance
+            new_index = bisect_left(self._order, (-balance, user_id))
+            # Текст меняется, только если изменение затронуло верх таблицы
+            if new_index < self._watched or (old_index is not None and old_index < self._watched):
+                self.version += 1
+
+    def top(self, limit: Optional[int] = None) -> List[Dict]:
+        """Первые limit игроков"""
+        limit = limit or self.size
+        with self._lock:
+            return [
+                {"user_id": user_id, "username": self._usernames.get(user_id), "balance": -neg_balance}
+                for neg_balance, user_id in self._order[:limit]
+            ]
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """Место игрока в таблице (с 1) или None, если игрок неизвестен"""
+        with self._lock:
+            balance = self._balances.get(user_id)
+            if balance is None:
+                return None
+            return bisect_left(self._order, (-balance, user_id)) + 1
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def render(self, limit: Optional[int] = None) -> str:
+        """Текст таблицы лидеров, собранный один раз на версию"""
+        limit = limit or self.size
+        self._watched = max(self._watched, limit)
+        cached = self._rendered.get(limit)
+        if cached and cached[0] == self.version:
+            return cached[1]
+        version = self.version
+        text = "🏆 Таблица лидеров:\n\n"
+        for i, user in enumerate(self.top(limit), 1):
+            text += f"{i}. {user['username']}: {user['balance']} монет\n"
+        self._rendered[limit] = (version, text)
+        return text
+
+leaderboard = Leaderboard()
+database.add_user_listener(leaderboard.update)
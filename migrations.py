@@ -0,0 +1,100 @@
+import logging
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from models import Base
+
+logger = logging.getLogger(__name__)
+
+# Таблица примененных миграций живет отдельно от моделей: create_all ее не трогает
+_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', _metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+# (версия, описание, функция(connection)) в порядке применения
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = []
+
+def migration(version: int, description: str):
+    """Зарегистрировать функцию миграции с номером версии"""
+    def register(func: Callable[[Connection], None]) -> Callable[[Connection], None]:
+        if any(existing == version for existing, _, _ in MIGRATIONS):
+            raise ValueError(f"Миграция {version} уже зарегистрирована")
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return func
+    return register
+
+def create_index(connection: Connection, name: str) -> None:
+    """Создать индекс, описанный в models.py, если его еще нет"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name == name:
+                index.create(connection, checkfirst=True)
+                return
+    raise KeyError(f"Индекс {name} не описан в моделях")
+
+def add_column(connection: Connection, table_name: str, column_name: str) -> None:
+    """Добавить в существующую таблицу столбец, описанный в models.py, если его еще нет"""
+    existing = {column["name"] for column in inspect(connection).get_columns(table_name)}
+    if column_name in existing:
+        return
+    column = Base.metadata.tables[table_name].c[column_name]
+    column_type = column.type.compile(dialect=connection.dialect)
+    connection.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}")
+
+def get_schema_version(connection: Connection) -> int:
+    """Последняя примененная миграция (0, если миграций не было)"""
+    schema_migrations.create(connection, checkfirst=True)
+    versions = connection.execute(select(schema_migrations.c.version)).scalars().all()
+    return max(versions, default=0)
+
+def run_migrations(engine: Engine) -> int:
+    """Применить все новые миграции, каждую в своей транзакции. Возвращает число примененных"""
+    with engine.begin() as connection:
+        current = get_schema_version(connection)
+    applied = 0
+    for version, description, func in MIGRATIONS:
+        if version <= current:
+            continue
+        with engine.begin() as connection:
+            func(connection)
+            connection.execute(schema_migrations.insert().values(
+                version=version,
+                description=description,
+                applied_at=datetime.utcnow()
+            ))
+        logger.info(f"Применена миграция {version}: {description}")
+        applied += 1
+    return applied
+
+@migration(1, "game_session_players: индекс и перенос участников старых сессий")
+def _game_session_players(connection: Connection) -> None:
+    import database
+
+    create_index(connection, 'ix_game_session_players_user_created')
+    with Session(bind=connection) as session:
+        database.backfill_game_session_players(session)
+
+@migration(2, "Индексы для горячих запросов: баланс, транзакции игрока, сессии по дате")
+def _hot_query_indexes(connection: Connection) -> None:
+    create_index(connection, 'ix_users_balance')
+    create_index(connection, 'ix_transactions_user_type')
+    create_index(connection, 'ix_game_sessions_created_at')
+
+@migration(3, "Ключ идемпотентности транзакций с уникальным индексом")
+def _transaction_idempotency_key(connection: Connection) -> None:
+    add_column(connection, 'transactions', 'idempotency_key')
+    create_index(connection, 'ux_transactions_idempotency_key')
+
+@migration(4, "Ключ идемпотентности игровых сессий с уникальным индексом")
+def _game_session_idempotency_key(connection: Connection) -> None:
+    add_column(connection, 'game_sessions', 'idempotency_key')
+    create_index(connection, 'ux_game_sessions_idempotency_key')
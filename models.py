@@ -1,14 +1,18 @@
-from sqlalchemy import create_engine, Column, Integer, String, BigInteger, DateTime, ForeignKey, Enum, JSON
+from sqlalchemy import create_engine, Column, Integer, String, BigInteger, DateTime, ForeignKey, Enum, JSON, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from datetime import datetime
 import enum
 from enum import Enum
 from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum as SQLEnum
+from sqlalchemy.dialects.postgresql import JSONB
 from typing import List, Optional
 
 Base = declarative_base()
 
+# JSON в SQLite, JSONB в PostgreSQL (бинарное хранение, без повторного разбора)
+JSONType = JSON().with_variant(JSONB(), "postgresql")
+
 class TransactionType(Enum):
     DEPOSIT = "deposit"
     WITHDRAWAL = "withdrawal"
@@ -29,6 +33,11 @@ class User(Base):
 
     transactions: Mapped[List["Transaction"]] = relationship("Transaction", back_populates="user")
 
+    __table_args__ = (
+        # Таблица лидеров: ORDER BY balance DESC LIMIT n без сортировки всей таблицы
+        Index('ix_users_balance', 'balance'),
+    )
+
 class Transaction(Base):
     __tablename__ = 'transactions'
 
@@ -37,20 +46,68 @@ class Transaction(Base):
     amount: Mapped[int] = mapped_column(Integer, nullable=False)
     type: Mapped[TransactionType] = mapped_column(SQLEnum(TransactionType), nullable=False)
     game_type: Mapped[Optional[str]] = mapped_column(String(20))
+    idempotency_key: Mapped[Optional[str]] = mapped_column(String(128))  # tg:<callback>:<user>, web:<user>:<request>
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
     user: Mapped["User"] = relationship("User", back_populates="transactions")
 
+    __table_args__ = (
+        # История и итоги игрока по типу операции
+        Index('ix_transactions_user_type', 'user_id', 'type'),
+        # Одна операция проводится один раз; NULL (операции без ключа) не ограничены
+        Index('ux_transactions_idempotency_key', 'idempotency_key', unique=True),
+    )
+
 class GameSession(Base):
     __tablename__ = 'game_sessions'
 
     session_id: Mapped[int] = mapped_column(Integer, primary_key=True)
     game_type: Mapped[str] = mapped_column(String(20), nullable=False)
-    players: Mapped[dict] = mapped_column(JSON, nullable=False)  # [{user_id, bet, result}]
-    outcome: Mapped[Optional[dict]] = mapped_column(JSON)  # {winner_id, prize}
+    players: Mapped[dict] = mapped_column(JSONType, nullable=False)  # [{user_id, bet, result}]
+    outcome: Mapped[Optional[dict]] = mapped_column(JSONType)  # {winner_id, prize}
+    idempotency_key: Mapped[Optional[str]] = mapped_column(String(128))  # ключ проводки раунда
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
+    participants: Mapped[List["GameSessionPlayer"]] = relationship("GameSessionPlayer", back_populates="game_session")
+
+    __table_args__ = (
+        # Выборки сессий за период
+        Index('ix_game_sessions_created_at', 'created_at'),
+        # Раунд записывается один раз; по ключу повтор находит исходный исход
+        Index('ux_game_sessions_idempotency_key', 'idempotency_key', unique=True),
+    )
+
+class GameSessionPlayer(Base):
+    """Участник игровой сессии (нормализованная копия GameSession.players)"""
+    __tablename__ = 'game_session_players'
+
+    session_id: Mapped[int] = mapped_column(Integer, ForeignKey('game_sessions.session_id'), primary_key=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    bet: Mapped[Optional[int]] = mapped_column(Integer)
+    result: Mapped[Optional[int]] = mapped_column(Integer)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+    game_session: Mapped["GameSession"] = relationship("GameSession", back_populates="participants")
+
+    __table_args__ = (
+        # Статистика и лимиты игрока читаются диапазоном по этому индексу
+        Index('ix_game_session_players_user_created', 'user_id', 'created_at'),
+    )
+
+class UserGameStats(Base):
+    """Накопительная статистика игрока по типу игры (обновляется вместе с балансом)"""
+    __tablename__ = 'user_game_stats'
+
+    user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('users.user_id'), primary_key=True)
+    game_type: Mapped[str] = mapped_column(String(20), primary_key=True)
+    games: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    wins: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    losses: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    wagered: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    won: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    biggest_win: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
 # Создание таблиц
 def init_db():
-    engine = create_engine('sqlite:///casino.db')
-    Base.metadata.create_all(engine) 
\ No newline at end of file
+    from db_engine import engine
+    Base.metadata.create_all(engine) 
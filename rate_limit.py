@@ -0,0 +1,68 @@
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from config import MAX_GAMES_PER_HOUR, MIN_TIME_BETWEEN_BETS
+
+class RateLimiter:
+    """Ограничение частоты ставок в памяти процесса.
+
+    Для каждого пользователя хранится кольцевой буфер времен последних
+    ставок (не больше max_events), поэтому проверка не обращается к БД.
+    Пользователи без ставок дольше окна периодически удаляются.
+    """
+
+    def __init__(self, max_events: int = MAX_GAMES_PER_HOUR, window: float = 3600,
+                 min_interval: float = MIN_TIME_BETWEEN_BETS, evict_interval: float = 300):
+        self.max_events = max_events
+        self.window = window
+        self.min_interval = min_interval
+        self.evict_interval = evict_interval
+        self._events: Dict[int, Deque[float]] = {}
+        self._last_evict = time.monotonic()
+
+    def check(self, user_id: int, now: Optional[float] = None, games: int = 1) -> Tuple[bool, float]:
+        """Зарегистрировать ставку на games игр (автоигра - несколько за один запрос).
+
+        Возвращает (разрешено, через сколько секунд можно повторить).
+        """
+        if now is None:
+            now = time.monotonic()
+        if now - self._last_evict >= self.evict_interval:
+            self.evict_idle(now)
+
+        events = self._events.get(user_id)
+        if events is None:
+            events = self._events[user_id] = deque(maxlen=self.max_events)
+
+        if events:
+            since_last = now - events[-1]
+            if since_last < self.min_interval:
+                return False, self.min_interval - since_last
+        if games > self.max_events:
+            return False, self.window
+        # Сколько старых ставок должно выйти из окна, чтобы поместились новые
+        overflow = len(events) + games - self.max_events
+        if overflow > 0:
+            since_oldest = now - events[overflow - 1]
+            if since_oldest < self.window:
+                return False, self.window - since_oldest
+
+        events.extend([now] * games)
+        return True, 0.0
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Удалить пользователей, у которых все ставки вышли за окно"""
+        if now is None:
+            now = time.monotonic()
+        idle = [user_id for user_id, events in self._events.items()
+                if not events or now - events[-1] >= self.window]
+        for user_id in idle:
+            del self._events[user_id]
+        self._last_evict = now
+        return len(idle)
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+rate_limiter = RateLimiter()
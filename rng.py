@@ -0,0 +1,222 @@
+import abc
+import hashlib
+import hmac
+import os
+import struct
+import threading
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Dict, List, MutableSequence, Optional, Sequence, TypeVar
+
+from config import RNG_BUFFER_SIZE
+
+T = TypeVar("T")
+
+SEED_BYTES = 32
+WORD = 1 << 32
+
+class BufferedRandom(abc.ABC):
+    """Генератор поверх буфера байтов с интерфейсом random.Random для игр.
+
+    Байты берутся кусками по buffer_size из _refill(), поэтому одна
+    случайная величина не стоит отдельного системного вызова. Целые в
+    диапазоне выбираются отбраковкой (без смещения по модулю), перемешивание -
+    Фишер-Йетс на них же. Игры принимают любой объект с этим интерфейсом,
+    в том числе random.Random для воспроизводимых симуляций. Источник байтов
+    задает подкласс.
+    """
+
+    def __init__(self, buffer_size: int = RNG_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.consumed = 0  # байтов потока выдано: по нему повтор раунда сверяется до байта
+        self._buffer = b""
+        self._offset = 0
+
+    @abc.abstractmethod
+    def _refill(self) -> bytes:
+        """Следующий кусок потока (обычно buffer_size байтов)"""
+
+    def token_bytes(self, n: int) -> bytes:
+        """Следующие n байтов потока"""
+        self.consumed += n
+        end = self._offset + n
+        if end <= len(self._buffer):
+            chunk = self._buffer[self._offset:end]
+            self._offset = end
+            return chunk
+        parts = [self._buffer[self._offset:]]
+        needed = n - len(parts[0])
+        while needed > 0:
+            self._buffer = self._refill()
+            self._offset = min(needed, len(self._buffer))
+            parts.append(self._buffer[:self._offset])
+            needed -= self._offset
+        return b"".join(parts)
+
+    def getrandbits(self, k: int) -> int:
+        nbytes = (k + 7) // 8
+        return int.from_bytes(self.token_bytes(nbytes), "big") >> (nbytes * 8 - k)
+
+    def randbelow(self, n: int) -> int:
+        """Равномерное целое в [0, n): лишние значения отбрасываются, а не сворачиваются по модулю"""
+        if n <= 0:
+            raise ValueError("Верхняя граница должна быть положительной")
+        k = n.bit_length()
+        value = self.getrandbits(k)
+        while value >= n:
+            value = self.getrandbits(k)
+        return value
+
+    def randrange(self, start: int, stop: Optional[int] = None) -> int:
+        if stop is None:
+            start, stop = 0, start
+        return start + self.randbelow(stop - start)
+
+    def randint(self, a: int, b: int) -> int:
+        return a + self.randbelow(b - a + 1)
+
+    def random(self) -> float:
+        return self.getrandbits(53) / (1 << 53)
+
+    def choice(self, seq: Sequence[T]) -> T:
+        return seq[self.randbelow(len(seq))]
+
+    def choices(self, population: Sequence[T], weights: Optional[Sequence[float]] = None, k: int = 1) -> List[T]:
+        if weights is None:
+            return [self.choice(population) for _ in range(k)]
+        cumulative = list(accumulate(weights))
+        total = cumulative[-1]
+        if all(isinstance(weight, int) for weight in weights):
+            # Целые веса выбираются точно, без округления float
+            return [population[bisect_right(cumulative, self.randbelow(total))] for _ in range(k)]
+        return [population[bisect_right(cumulative, self.random() * total)] for _ in range(k)]
+
+    def shuffle(self, x: MutableSequence) -> None:
+        """Фишер-Йетс: 32-битные слова для всех шагов читаются из буфера одним куском"""
+        n = len(x)
+        if n < 2:
+            return
+        words = struct.unpack(f"<{n - 1}I", self.token_bytes(4 * (n - 1)))
+        for i, word in zip(range(n - 1, 0, -1), words):
+            bound = i + 1
+            # Слова из неполного последнего периода отбрасываются: остаток по модулю без смещения
+            limit = WORD - WORD % bound
+            while word >= limit:
+                word = self.getrandbits(32)
+            j = word % bound
+            x[i], x[j] = x[j], x[i]
+
+class AliasTable:
+    """Выбор по целым весам за O(1) методом алиасов (Уокер, Воуз).
+
+    Столбец i выбирается равномерно, затем с вероятностью threshold[i] / total
+    остается i, иначе берется alias[i]. Все в целых числах, поэтому
+    вероятности точно равны weight / total. Полные столбцы второго числа не
+    тратят: при равных весах выбор совпадает с rng.choice.
+    """
+    __slots__ = ("items", "weights", "total", "threshold", "alias")
+
+    def __init__(self, items: Sequence[T], weights: Sequence[int]):
+        if not items or len(items) != len(weights):
+            raise ValueError("Нужен непустой список и вес для каждого элемента")
+        if any(not isinstance(weight, int) or weight < 0 for weight in weights) or not any(weights):
+            raise ValueError("Веса должны быть неотрицательными целыми, хотя бы один - больше нуля")
+        n = len(items)
+        total = sum(weights)
+        scaled = [weight * n for weight in weights]  # в долях total на столбец
+        self.items = tuple(items)
+        self.weights = tuple(weights)
+        self.total = total
+        self.threshold = [total] * n
+        self.alias = list(range(n))
+        small = [i for i, value in enumerate(scaled) if value < total]
+        large = [i for i, value in enumerate(scaled) if value >= total]
+        while small and large:
+            low, high = small.pop(), large.pop()
+            self.threshold[low] = scaled[low]
+            self.alias[low] = high
+            scaled[high] -= total - scaled[low]
+            (small if scaled[high] < total else large).append(high)
+
+    def probability(self, item: T) -> float:
+        return sum(weight for candidate, weight in zip(self.items, self.weights) if candidate == item) / self.total
+
+    def sample(self, rng) -> T:
+        i = rng.randrange(len(self.items))
+        threshold = self.threshold[i]
+        if threshold == self.total or rng.randrange(self.total) < threshold:
+            return self.items[i]
+        return self.items[self.alias[i]]
+
+class SystemRandomBuffer(BufferedRandom):
+    """Криптостойкий источник: буфер заполняется из os.urandom"""
+
+    def __init__(self, buffer_size: int = RNG_BUFFER_SIZE):
+        super().__init__(buffer_size)
+        self._lock = threading.Lock()
+
+    def _refill(self) -> bytes:
+        return os.urandom(self.buffer_size)
+
+    def token_bytes(self, n: int) -> bytes:
+        with self._lock:
+            return super().token_bytes(n)
+
+class SeededRandom(BufferedRandom):
+    """Детерминированный поток HMAC-SHA256(seed, номер блока): по раскрытому зерну любой может его повторить"""
+
+    def __init__(self, seed: bytes, buffer_size: int = 1024):
+        super().__init__(buffer_size)
+        self.seed = seed
+        self._counter = 0
+
+    def _refill(self) -> bytes:
+        blocks = []
+        for _ in range(max(1, self.buffer_size // hashlib.sha256().digest_size)):
+            blocks.append(hmac.new(self.seed, self._counter.to_bytes(8, "big"), hashlib.sha256).digest())
+            self._counter += 1
+        return b"".join(blocks)
+
+    def skip(self, n: int) -> None:
+        """Перемотать поток на n байтов вперед (повтор раунда с середины шуза)"""
+        while n > 0:
+            step = min(n, self.buffer_size)
+            self.token_bytes(step)
+            n -= step
+
+def commitment(seed: bytes) -> str:
+    return hashlib.sha256(seed).hexdigest()
+
+def verify(server_seed: str, expected_commitment: str) -> bool:
+    """Проверить, что раскрытое зерно (hex) совпадает с опубликованным до игры хэшем"""
+    return hmac.compare_digest(commitment(bytes.fromhex(server_seed)), expected_commitment)
+
+class ServerSeed:
+    """Зерно сервера для доказуемо честной игры.
+
+    Хэш (commitment) известен до игры и сохраняется в сессии, сам исход
+    берется из SeededRandom(seed). После игры зерно раскрывается, и по нему
+    можно проверить и хэш, и все выпавшие значения.
+    """
+
+    def __init__(self, seed: Optional[bytes] = None):
+        self.seed = seed if seed is not None else rng.token_bytes(SEED_BYTES)
+        self.commitment = commitment(self.seed)
+        self.random = SeededRandom(self.seed)
+
+    def commit(self) -> Dict[str, str]:
+        """Запись для сессии, пока зерно еще используется"""
+        return {"commitment": self.commitment}
+
+    def reveal(self) -> Dict[str, str]:
+        """Запись для сессии после игры: хэш и само зерно"""
+        return {"commitment": self.commitment, "server_seed": self.seed.hex()}
+
+def replay_random(server_seed: str, offset: int = 0) -> SeededRandom:
+    """Поток раскрытого зерна (hex), перемотанный к началу раунда"""
+    stream = SeededRandom(bytes.fromhex(server_seed))
+    stream.skip(offset)
+    return stream
+
+# Общий источник процесса: зерна сессий и все, что не требует раскрытия
+rng = SystemRandomBuffer()
@@ -17,6 +17,31 @@ async function updateBalance() {
     }
 }
 
+// POST-запрос ставки с повторами: один request_id на все попытки,
+// поэтому сервер проведет ставку один раз и вернет тот же результат
+async function postBet(path, payload, attempts = 3) {
+    const body = JSON.stringify({ ...payload, request_id: crypto.randomUUID() });
+    for (let attempt = 1; ; attempt++) {
+        try {
+            const response = await fetch(`${API_URL}/${path}`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body
+            });
+            if (response.status < 500 || attempt >= attempts) {
+                return response;
+            }
+        } catch (error) {
+            if (attempt >= attempts) {
+                throw error;
+            }
+        }
+        await new Promise(resolve => setTimeout(resolve, 300 * attempt));
+    }
+}
+
 // Инициализация игры
 function initGame() {
     const gameContainer = document.getElementById('game-container');
@@ -52,9 +77,55 @@ function initSlots(container) {
             <input type="number" id="bet" min="5" value="5" step="5">
             <button onclick="spinSlots()">Крутить</button>
         </div>
+        <div class="controls autoplay">
+            <input type="number" id="spins" min="1" max="50" value="10">
+            <input type="number" id="stop-on-win" min="0" placeholder="Стоп при выигрыше от">
+            <input type="number" id="stop-below" min="0" placeholder="Стоп при балансе ниже">
+            <button onclick="autoplaySlots()">Автоигра</button>
+        </div>
     `;
 }
 
+function optionalNumber(id) {
+    const value = document.getElementById(id).value;
+    return value === '' ? null : parseInt(value);
+}
+
+// Автоигра: все вращения считаются на сервере за один запрос
+async function autoplaySlots() {
+    const button = document.querySelector('.autoplay button');
+    button.disabled = true;
+    
+    try {
+        const response = await postBet('slots/autoplay', {
+            user_id: userId,
+            bet: parseInt(document.getElementById('bet').value),
+            spins: parseInt(document.getElementById('spins').value),
+            stop_on_win: optionalNumber('stop-on-win'),
+            stop_below: optionalNumber('stop-below')
+        });
+        
+        const data = await response.json();
+        
+        if (data.error) {
+            alert(data.error);
+            return;
+        }
+        
+        const slots = document.querySelectorAll('.slot');
+        slots.forEach((slot, index) => {
+            slot.textContent = data.last_symbols[index];
+        });
+        updateBalance();
+        alert(`Вращений: ${data.spins}, выигрышных: ${data.wins}\n` +
+              `Лучший выигрыш: ${data.biggest_win}\nИтог: ${data.net > 0 ? '+' : ''}${data.net}`);
+    } catch (error) {
+        console.error('Ошибка автоигры в слоты:', error);
+    } finally {
+        button.disabled = false;
+    }
+}
+
 // Функция для кручения слотов
 async function spinSlots() {
     const bet = document.getElementById('bet').value;
@@ -62,15 +133,9 @@ async function spinSlots() {
     button.disabled = true;
     
     try {
-        const response = await fetch(`${API_URL}/slots`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                user_id: userId,
-                bet: parseInt(bet)
-            })
+        const response = await postBet('slots', {
+            user_id: userId,
+            bet: parseInt(bet)
         });
         
         const data = await response.json();
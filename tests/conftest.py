@@ -0,0 +1,37 @@
+"""Общие фикстуры: каждый тест слоя БД идет на пустой базе каждого бэкенда.
+
+SQLite (временный файл) проверяется всегда. PostgreSQL - если задана
+переменная окружения TEST_POSTGRES_URL с пустой базой, например
+postgresql+psycopg2://casino@localhost/casino_test; иначе эти тесты пропускаются.
+После теста все таблицы удаляются.
+"""
+import logging
+import os
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from tools.scratch_db import scratch_engine
+
+POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+@pytest.fixture(params=[
+    pytest.param(None, id="sqlite"),
+    pytest.param(POSTGRES_URL, id="postgresql",
+                 marks=pytest.mark.skipif(not POSTGRES_URL, reason="TEST_POSTGRES_URL не задана")),
+])
+def engine(request):
+    """Движок пустой базы со всеми миграциями"""
+    with scratch_engine(request.param) as engine:
+        yield engine
+
+@pytest.fixture
+def Session(engine):
+    return sessionmaker(bind=engine)
+
+@pytest.fixture(autouse=True)
+def quiet_refusals():
+    # Отказы в списании и падения пачек ожидаемы и пишутся в лог как ошибки
+    logging.disable(logging.ERROR)
+    yield
+    logging.disable(logging.NOTSET)
@@ -0,0 +1,91 @@
+import pytest
+
+import database
+from models import GameSession, Transaction, TransactionType
+
+@pytest.fixture
+def player(Session):
+    with Session() as session:
+        database.get_or_create_user(session, 1, "player", 100)
+    return 1
+
+def _fail(session, *args):
+    raise RuntimeError("сбой операции")
+
+def test_debit_never_goes_negative(Session, player):
+    with Session() as session:
+        assert database.change_balance(session, player, -60, TransactionType.GAME_LOSS, "slots", 60) == 40
+        assert database.change_balance(session, player, -60, TransactionType.GAME_LOSS, "slots", 60) is None
+        assert database.get_user_balance(session, player) == 40
+        assert session.query(Transaction).count() == 1
+
+def test_repeated_key_is_replayed(Session, player):
+    with Session() as session:
+        first = database.apply_balance_change(session, player, 10, TransactionType.GAME_WIN, "slots", 5, "op:1")
+        session.commit()
+        # Повтор с тем же ключом не проводится, даже если сумма другая
+        again = database.apply_balance_change(session, player, 99, TransactionType.GAME_WIN, "slots", 5, "op:1")
+        session.commit()
+        assert first == 110
+        assert again == database.Replayed(110, 10, [])
+        assert database.get_user_balance(session, player) == 110
+        assert session.query(Transaction).count() == 1
+
+def test_replay_returns_keyed_session(Session, player):
+    with Session() as session:
+        players = [{"user_id": player, "bet": 5, "result": -5}]
+        database.apply_balance_change(session, player, -5, TransactionType.GAME_LOSS, "slots", 5, "op:2")
+        session_id = database.add_game_session(session, "slots", players, {"symbols": ["🍋"] * 3}, "op:2")
+        session.commit()
+        again = database.apply_balance_change(session, player, -5, TransactionType.GAME_LOSS, "slots", 5, "op:2")
+        assert again.result == -5
+        assert again.sessions == [{"session_id": session_id, "players": players,
+                                   "outcome": {"symbols": ["🍋"] * 3}}]
+
+def test_repeated_round_is_replayed(Session, player):
+    with Session() as session:
+        database.get_or_create_user(session, 2, "other", 100)
+        players = [{"user_id": player, "bet": 10, "result": 10}, {"user_id": 2, "bet": 10, "result": -10}]
+        assert database.apply_game_round(session, "roulette", players, {"number": 7}, "round:1") == {1: 110, 2: 90}
+        session.commit()
+        again = database.apply_game_round(session, "roulette", players, {"number": 8}, "round:1")
+        session.commit()
+        assert again[1].result == 10 and again[2].result == -10
+        assert again[1].sessions[0]["outcome"] == {"number": 7}
+        assert session.query(GameSession).count() == 1
+        assert database.get_user_balance(session, 2) == 90
+
+def test_batch_commits_once(Session, player):
+    with Session() as session:
+        results = database.apply_batch(session, [
+            (database.apply_balance_change, (player, 5, TransactionType.GAME_WIN, "slots", 5)),
+            (database.apply_balance_change, (player, -500, TransactionType.GAME_LOSS, "slots", 500)),
+            (database.add_game_session, ("slots", [{"user_id": player, "bet": 5, "result": 10}],
+                                         {"symbols": ["🍒"] * 3})),
+        ])
+        assert results[:2] == [105, None]
+        game = session.get(GameSession, results[2])
+        assert game.outcome == {"symbols": ["🍒"] * 3}
+        assert [p.user_id for p in game.participants] == [player]
+
+def test_batch_falls_back_to_single_operations(Session, player):
+    with Session() as session:
+        results = database.apply_batch(session, [
+            (database.apply_balance_change, (player, 5, TransactionType.GAME_WIN, "slots", 5, "batch:1")),
+            (_fail, ()),
+            (database.apply_balance_change, (player, -20, TransactionType.GAME_LOSS, "slots", 20, "batch:2")),
+        ])
+        assert results[0] == 105 and results[2] == 85
+        assert isinstance(results[1], RuntimeError)
+        # Откаченная пачка не проводит операции дважды
+        assert database.get_user_balance(session, player) == 85
+        assert session.query(Transaction).count() == 2
+
+def test_batch_replays_repeated_key(Session, player):
+    with Session() as session:
+        results = database.apply_batch(session, [
+            (database.apply_balance_change, (player, -5, TransactionType.GAME_LOSS, "slots", 5, "batch:3")),
+            (database.apply_balance_change, (player, -5, TransactionType.GAME_LOSS, "slots", 5, "batch:3")),
+        ])
+        assert results[0] == 95
+        assert results[1] == database.Replayed(95, -5, [])
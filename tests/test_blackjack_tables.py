@@ -0,0 +1,18 @@
+import math
+
+from games.blackjack_tables import NEUTRAL_CLASS, get_tables
+from tools.simulate_rtp import _blackjack_chunk, summarize
+
+ROUNDS = 20_000
+
+def test_table_play_matches_neutral_rtp():
+    # Шуз перемешивается перед каждым раундом: состав нейтральный, как в расчете таблиц
+    returns, _ = _blackjack_chunk((ROUNDS, None, 20_161, True))
+    rounds, rtp, std, _ = summarize(returns)
+    # 99.7% доверительный интервал; округление выплаты за блэкджек (~0.15%) много меньше его
+    assert abs(rtp - get_tables().rtp[NEUTRAL_CLASS]) < 3 * std / math.sqrt(rounds)
+
+def test_shared_shoe_drifts_to_tens():
+    # Стартовые пары дилера забирают мелкие карты: в общем шузе десяток у игрока больше 4/13
+    _, first_cards = _blackjack_chunk((ROUNDS, None, 20_161, False))
+    assert first_cards[10] / sum(first_cards.values()) > 4 / 13
@@ -0,0 +1,108 @@
+import os
+import shutil
+from datetime import datetime
+
+from sqlalchemy import (JSON, BigInteger, Column, DateTime, Enum, ForeignKey, Integer, MetaData, String,
+                        Table, inspect, select, text)
+from sqlalchemy.orm import sessionmaker
+
+import database
+from db_engine import create_db_engine
+from migrations import MIGRATIONS, run_migrations, schema_migrations
+from models import Base, GameSessionPlayer, TransactionType, User
+
+REPO_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "casino.db")
+
+def _versions(engine):
+    with engine.connect() as connection:
+        return connection.execute(select(schema_migrations.c.version).order_by(schema_migrations.c.version)).scalars().all()
+
+def _indexes(engine, table):
+    return {index["name"] for index in inspect(engine).get_indexes(table)}
+
+def test_all_migrations_applied(engine):
+    assert _versions(engine) == [version for version, _, _ in MIGRATIONS]
+    assert "idempotency_key" in {column["name"] for column in inspect(engine).get_columns("transactions")}
+    assert "ux_transactions_idempotency_key" in _indexes(engine, "transactions")
+    assert "ux_game_sessions_idempotency_key" in _indexes(engine, "game_sessions")
+    assert "ix_game_session_players_user_created" in _indexes(engine, "game_session_players")
+
+def test_rerun_applies_nothing(engine):
+    assert run_migrations(engine) == 0
+    assert _versions(engine) == [version for version, _, _ in MIGRATIONS]
+
+def _baseline_schema() -> MetaData:
+    """Схема базы до миграций (models.py исходной версии)"""
+    metadata = MetaData()
+    Table("users", metadata,
+          Column("user_id", BigInteger, primary_key=True, autoincrement=False),
+          Column("username", String(32), unique=True),
+          Column("balance", Integer),
+          Column("registration_date", DateTime),
+          Column("last_active", DateTime),
+          Column("is_banned", Integer))
+    Table("transactions", metadata,
+          Column("transaction_id", Integer, primary_key=True),
+          Column("user_id", BigInteger, ForeignKey("users.user_id")),
+          Column("amount", Integer, nullable=False),
+          Column("type", Enum(TransactionType), nullable=False),
+          Column("game_type", String(20)),
+          Column("created_at", DateTime))
+    Table("game_sessions", metadata,
+          Column("session_id", Integer, primary_key=True),
+          Column("game_type", String(20), nullable=False),
+          Column("players", JSON, nullable=False),
+          Column("outcome", JSON),
+          Column("created_at", DateTime))
+    return metadata
+
+def _init_db(engine):
+    # То же, что database.init_db, на заданном движке
+    Base.metadata.create_all(engine)
+    return run_migrations(engine)
+
+def test_migrations_upgrade_baseline_schema(engine):
+    Base.metadata.drop_all(engine)
+    schema_migrations.drop(engine)
+    baseline = _baseline_schema()
+    baseline.create_all(engine)
+    now = datetime.utcnow()
+    with engine.begin() as connection:
+        connection.execute(baseline.tables["users"].insert(), [
+            {"user_id": 1, "username": "old", "balance": 70, "registration_date": now,
+             "last_active": now, "is_banned": 0}])
+        connection.execute(baseline.tables["transactions"].insert(), [
+            {"user_id": 1, "amount": 20, "type": TransactionType.GAME_WIN, "game_type": "slots", "created_at": now}])
+        connection.execute(baseline.tables["game_sessions"].insert(), [
+            {"game_type": "slots", "players": [{"user_id": 1, "bet": 10, "result": 20}], "created_at": now}])
+
+    assert _init_db(engine) == len(MIGRATIONS)
+    assert _versions(engine) == [version for version, _, _ in MIGRATIONS]
+    assert "ux_game_sessions_idempotency_key" in _indexes(engine, "game_sessions")
+    with sessionmaker(bind=engine)() as session:
+        # Старые сессии перенесены в game_session_players, новые проводки пишутся с ключами
+        assert [(p.user_id, p.bet, p.result) for p in session.query(GameSessionPlayer)] == [(1, 10, 20)]
+        assert database.apply_game_round(session, "slots", [{"user_id": 1, "bet": 10, "result": -10}],
+                                         None, "round:1") == {1: 60}
+        session.commit()
+
+def test_migrations_upgrade_tracked_database(tmp_path):
+    # Копия casino.db из репозитория: база, с которой бот стартует после обновления
+    path = tmp_path / "casino.db"
+    shutil.copy(REPO_DB, path)
+    engine = create_db_engine(f"sqlite:///{path}")
+    try:
+        with engine.connect() as connection:
+            users = connection.execute(text("SELECT user_id, balance FROM users ORDER BY user_id")).all()
+        assert _init_db(engine) == len(MIGRATIONS)
+        assert _init_db(engine) == 0
+        with sessionmaker(bind=engine)() as session:
+            assert [(user.user_id, user.balance) for user in session.query(User).order_by(User.user_id)] == users
+    finally:
+        engine.dispose()
+
+def test_migrations_tolerate_existing_objects(engine):
+    # Схема из create_all уже содержит индексы и столбцы: повторный прогон их пропускает
+    with engine.begin() as connection:
+        connection.execute(schema_migrations.delete())
+    assert run_migrations(engine) == len(MIGRATIONS)
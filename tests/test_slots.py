@@ -0,0 +1,28 @@
+import database
+from games.slots import SlotsGame, autoplay, autoplay_summary, settled_series
+
+def test_autoplay_charges_every_stake():
+    series = autoplay(1, 10, 50, 10 ** 6)
+    assert len(series["rounds"]) == 50
+    for played in series["rounds"]:
+        assert played["result"] == played["win"] - played["wager"]
+    summary = autoplay_summary(series)
+    assert summary["net"] == summary["won"] - summary["wagered"]
+
+def test_autoplay_rounds_replay():
+    for played in autoplay(1, 10, 20, 10 ** 6)["rounds"]:
+        fair = played["outcome"]["fair"]
+        assert "settlement" not in fair
+        replayed = SlotsGame.replay(fair, played["players"])
+        assert replayed["results"] == {1: played["result"]}
+        assert replayed["outcome"]["symbols"] == played["outcome"]["symbols"]
+
+def test_replayed_series_keeps_summary(Session):
+    series = autoplay(1, 10, 30, 10 ** 6, stop_on_win=100)
+    with Session() as session:
+        database.get_or_create_user(session, 1, "player", 10 ** 6)
+        balance = database.apply_game_series(session, 1, "slots", series["rounds"], "auto:1")
+        session.commit()
+        again = database.apply_game_series(session, 1, "slots", series["rounds"], "auto:1")
+    assert again.balance == balance and again.result == autoplay_summary(series)["net"]
+    assert autoplay_summary(settled_series(again.sessions)) == autoplay_summary(series)
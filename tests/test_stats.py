@@ -0,0 +1,59 @@
+import database
+from models import UserGameStats
+
+def _play(session):
+    for user_id in (1, 2):
+        database.get_or_create_user(session, user_id, f"player{user_id}", 1000)
+    database.apply_game_round(session, "roulette", [
+        {"user_id": 1, "bet": 10, "result": 350},
+        {"user_id": 2, "bet": 20, "result": -20},
+    ], {"number": 7}, "round:1")
+    database.apply_game_round(session, "roulette", [{"user_id": 1, "bet": 30, "result": -30}],
+                              {"number": 0}, "round:2")
+    database.apply_game_series(session, 2, "slots", [
+        {"result": result, "wager": 10, "players": [{"user_id": 2, "bet": 10, "result": result}]}
+        for result in (-10, 40, -10)
+    ], "series:1")
+    session.commit()
+
+def _rows(session):
+    return {
+        (row.user_id, row.game_type): (row.games, row.wins, row.losses, row.wagered, row.won, row.biggest_win)
+        for row in session.query(UserGameStats).all()
+    }
+
+def test_stats_follow_results(Session):
+    with Session() as session:
+        _play(session)
+        stats = database.get_user_stats(session, 1)
+        assert stats["games_played"] == 2 and stats["wins"] == 1
+        assert stats["by_game"]["roulette"] == {"games": 2, "wins": 1, "losses": 1, "wagered": 40,
+                                                "won": 350, "biggest_win": 350}
+        assert database.get_user_stats(session, 2)["by_game"]["slots"] == {
+            "games": 3, "wins": 1, "losses": 2, "wagered": 30, "won": 40, "biggest_win": 40}
+
+def test_replay_does_not_count_twice(Session):
+    with Session() as session:
+        _play(session)
+        before = _rows(session)
+        database.apply_game_round(session, "roulette", [{"user_id": 1, "bet": 30, "result": -30}],
+                                  {"number": 0}, "round:2")
+        database.apply_game_series(session, 2, "slots", [
+            {"result": -10, "wager": 10, "players": [{"user_id": 2, "bet": 10, "result": -10}]}
+        ], "series:1")
+        session.commit()
+        assert _rows(session) == before
+
+def test_rebuild_matches_incremental(Session):
+    with Session() as session:
+        _play(session)
+        incremental = _rows(session)
+        assert database.rebuild_user_game_stats(session) == len(incremental)
+        assert _rows(session) == incremental
+
+def test_leaderboard_and_rate_limit(Session):
+    with Session() as session:
+        _play(session)
+        top = database.get_leaderboard(session, 2)
+        assert [row["user_id"] for row in top] == [1, 2]
+        assert database.check_rate_limit(session, 2)
@@ -0,0 +1,94 @@
+"""Сравнение скорости записи в SQLite: журнал по умолчанию и WAL с PRAGMA.
+
+Запускает два процесса (как бот и веб-приложение), которые одновременно
+меняют балансы в одном файле БД через database.change_balance, и
+печатает число операций в секунду и число ошибок блокировки.
+
+Запуск из корня проекта:
+    python -m tools.bench_db_writes --ops 2000 --writers 2
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from config import SQLITE_PRAGMAS
+from db_engine import create_db_engine
+from models import Base, TransactionType, User
+
+# Режимы сравнения: имя -> PRAGMA для соединений
+MODES = {
+    "default": {},
+    "wal": SQLITE_PRAGMAS
+}
+
+USERS = 100
+
+def _writer(url: str, pragmas: dict, ops: int, offset: int, start_event, results) -> None:
+    import database
+
+    # Измеряем запись в БД, а не вывод логов
+    logging.disable(logging.INFO)
+    engine = create_db_engine(url, pragmas=pragmas)
+    Session = sessionmaker(bind=engine)
+    errors = 0
+    start_event.wait()
+    started = time.perf_counter()
+    for i in range(ops):
+        with Session() as session:
+            try:
+                database.change_balance(session, (offset + i) % USERS, 1 if i % 2 else -1,
+                                        TransactionType.GAME_LOSS, "slots", 1)
+            except OperationalError:
+                errors += 1
+    results.put((time.perf_counter() - started, errors))
+    engine.dispose()
+
+def run_mode(name: str, ops: int, writers: int) -> None:
+    pragmas = MODES[name]
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = create_db_engine(url, pragmas=pragmas)
+        Base.metadata.create_all(engine)
+        with sessionmaker(bind=engine)() as session:
+            session.add_all(User(user_id=i, username=f"user{i}", balance=1000) for i in range(USERS))
+            session.commit()
+        engine.dispose()
+
+        start_event = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=_writer, args=(url, pragmas, ops, n * 7, start_event, results))
+            for n in range(writers)
+        ]
+        for process in processes:
+            process.start()
+        started = time.perf_counter()
+        start_event.set()
+        stats = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+    total = ops * writers
+    errors = sum(err for _, err in stats)
+    print(f"{name:>8}: {total} записей за {elapsed:.2f} с, "
+          f"{(total - errors) / elapsed:.0f} записей/с, ошибок блокировки: {errors}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=2000, help="операций на процесс")
+    parser.add_argument("--writers", type=int, default=2, help="число процессов-писателей")
+    parser.add_argument("--mode", choices=sorted(MODES), action="append",
+                        help="режим (по умолчанию все)")
+    args = parser.parse_args()
+    for name in args.mode or MODES:
+        run_mode(name, args.ops, args.writers)
+
+if __name__ == '__main__':
+    main()
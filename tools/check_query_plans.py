@@ -0,0 +1,171 @@
+"""Проверка планов запросов database.py: ни один горячий запрос не должен читать таблицу целиком.
+
+Создает пустую базу со схемой и всеми миграциями, вызывает функции
+database.py, перехватывает выполненные SQL-запросы и прогоняет их через
+EXPLAIN. Полный проход по таблице (SCAN без индекса в SQLite, Seq Scan в
+PostgreSQL) или сортировка во временном B-дереве считаются ошибкой, и скрипт
+завершается с кодом 1. Функции, которые читают все строки намеренно
+(пересчеты и выгрузки), перечислены в FULL_SCAN_ALLOWED.
+
+Новая функция в database.py должна попасть в один из списков ниже,
+иначе проверка тоже не пройдет.
+
+Запуск из корня проекта (по умолчанию временная SQLite-база):
+    python -m tools.check_query_plans
+    python -m tools.check_query_plans --url postgresql+psycopg2://casino@localhost/casino_check
+"""
+import argparse
+import inspect
+import logging
+import re
+import sys
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import sessionmaker
+
+import database
+from models import TransactionType
+from tools.scratch_db import scratch_engine
+
+USER_ID = 1
+
+# Функция -> вызов с тестовыми аргументами
+HOT_QUERIES: Dict[str, Callable] = {
+    "get_user": lambda s: database.get_user(s, USER_ID),
+    "get_or_create_user": lambda s: database.get_or_create_user(s, USER_ID, "user1", 50),
+    "get_user_id_by_username": lambda s: database.get_user_id_by_username(s, "user1"),
+    "set_user_banned": lambda s: database.set_user_banned(s, "user1", False),
+    "get_user_balance": lambda s: database.get_user_balance(s, USER_ID),
+    "apply_balance_change": lambda s: database.apply_balance_change(
+        s, USER_ID, -1, TransactionType.GAME_LOSS, "slots", 1),
+    "change_balance": lambda s: database.change_balance(
+        s, USER_ID, 2, TransactionType.GAME_WIN, "slots", 1, "plan-check"),
+    "update_balance": lambda s: database.update_balance(s, USER_ID, 1, TransactionType.BONUS),
+    "apply_game_series": lambda s: database.apply_game_series(
+        s, USER_ID, "slots", [{"result": 1, "wager": 1, "players": [{"user_id": USER_ID, "bet": 1, "result": 1}]}],
+        "plan-series"),
+    "apply_game_round": lambda s: database.apply_game_round(
+        s, "roulette", [{"user_id": USER_ID, "bet": 1, "result": -1}], {"number": 0}, "plan-round"),
+    "add_game_session": lambda s: database.add_game_session(
+        s, "slots", [{"user_id": USER_ID, "bet": 1, "result": 2}], None, "plan-session"),
+    "create_game_session": lambda s: database.create_game_session(
+        s, "slots", [{"user_id": USER_ID, "bet": 1, "result": 2}]),
+    "update_game_session": lambda s: database.update_game_session(s, 1, {"winner_id": USER_ID}),
+    "get_user_stats": lambda s: database.get_user_stats(s, USER_ID),
+    "get_leaderboard": lambda s: database.get_leaderboard(s, 10),
+    "check_rate_limit": lambda s: database.check_rate_limit(s, USER_ID),
+    "get_game_sessions": lambda s: database.get_game_sessions(s, datetime.utcnow() - timedelta(days=1)),
+}
+
+# Читают все строки намеренно: загрузка кэша при старте, пересчеты и сверка за день
+FULL_SCAN_ALLOWED = {
+    "get_all_users",
+    "backfill_game_session_players",
+    "rebuild_user_game_stats",
+    "get_game_result_totals",
+}
+
+# Не выполняют своих запросов (служебные функции и обертки)
+NOT_QUERIES = {
+    "add_user_listener",
+    "init_db",
+    "get_db",
+    "apply_batch",
+}
+
+# SQLite: проход по таблице без индекса и сортировка во временном B-дереве
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+TEMP_SORT = "USE TEMP B-TREE"
+# PostgreSQL: при enable_seqscan=off Seq Scan остается только там, где индекса нет
+SEQ_SCAN = "Seq Scan"
+
+def _public_functions() -> List[str]:
+    return sorted(
+        name for name, value in vars(database).items()
+        if inspect.isfunction(value) and value.__module__ == database.__name__ and not name.startswith("_")
+    )
+
+def _plan_problems(connection, statement: str, parameters) -> List[str]:
+    if connection.dialect.name == "postgresql":
+        rows = connection.exec_driver_sql(f"EXPLAIN {statement}", parameters).fetchall()
+        return [row[0].strip() for row in rows if SEQ_SCAN in row[0]]
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+    problems = []
+    for row in rows:
+        detail = row[-1]
+        if FULL_SCAN.match(detail) or TEMP_SORT in detail:
+            problems.append(detail)
+    return problems
+
+def check(url: Optional[str] = None) -> List[Tuple[str, str, List[str]]]:
+    """Вернуть список (функция, запрос, проблемы плана)"""
+    with scratch_engine(url) as engine:
+        return _check(engine)
+
+def _check(engine) -> List[Tuple[str, str, List[str]]]:
+    Session = sessionmaker(bind=engine)
+
+    with Session() as session:
+        # Немного строк, чтобы планировщик не считал таблицы пустыми
+        for user_id in range(1, 51):
+            database.get_or_create_user(session, user_id, f"user{user_id}", 50)
+        for _ in range(20):
+            database.create_game_session(session, "slots", [{"user_id": USER_ID, "bet": 1, "result": 0}])
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+    is_postgres = engine.dialect.name == "postgresql"
+
+    captured: List[Tuple[str, object]] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    results = []
+    try:
+        for name, call in HOT_QUERIES.items():
+            captured.clear()
+            with Session() as session:
+                call(session)
+            statements = list(captured)
+            with engine.connect() as connection:
+                if is_postgres:
+                    connection.exec_driver_sql("SET enable_seqscan = off")
+                for statement, parameters in statements:
+                    results.append((name, statement, _plan_problems(connection, statement, parameters)))
+                connection.rollback()
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    return results
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="пустая база для проверки (по умолчанию временная SQLite)")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    failed = False
+
+    unclassified = [
+        name for name in _public_functions()
+        if name not in HOT_QUERIES and name not in FULL_SCAN_ALLOWED and name not in NOT_QUERIES
+    ]
+    for name in unclassified:
+        print(f"НЕ ПРОВЕРЕНО: database.{name} не добавлена в tools/check_query_plans.py")
+        failed = True
+
+    results = check(args.url)
+    for name, statement, problems in results:
+        if problems:
+            failed = True
+            print(f"ПОЛНЫЙ ПРОХОД: database.{name}: {'; '.join(problems)}")
+            print(f"    {' '.join(statement.split())}")
+        else:
+            print(f"ok: database.{name}")
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,18 @@
+"""Пересчет таблицы user_game_stats по существующим данным.
+
+Запуск из корня проекта:
+    python -m tools.rebuild_stats
+"""
+import logging
+
+from database import get_db, init_db, rebuild_user_game_stats
+
+def main() -> None:
+    init_db()
+    with get_db() as session:
+        count = rebuild_user_game_stats(session)
+    print(f"Пересчитано записей статистики: {count}")
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
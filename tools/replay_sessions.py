@@ -0,0 +1,145 @@
+"""Повтор игровых сессий по записанным зернам и сверка выплат с журналом.
+
+Каждая сессия с outcome["fair"] (rng.py) повторяется заново: игра
+создается с потоком раскрытого зерна, перемотанным к началу раунда, и
+получает те же ставки и ходы. Совпасть должны результаты игроков,
+исход (символы, число, счет дилера) и число байтов, выданных потоком.
+Зерно общего шуза 21 раскрывается в одной из следующих сессий (retired),
+до этого раунд помечается как ожидающий.
+
+Затем суммы повторенных результатов по игроку и игре сравниваются с
+игровыми проводками журнала транзакций за тот же день. Расхождение
+бывает и без ошибки: например, игры без записанной сессии.
+
+Запуск из корня проекта:
+    python -m tools.replay_sessions --date 2026-10-16
+    python -m tools.replay_sessions --date 2026-10-16 --workers 8 --verbose
+"""
+import argparse
+import logging
+import os
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Tuple
+
+from database import get_db, get_game_result_totals, get_game_sessions, init_db
+from games.blackjack import BlackjackGame
+from games.roulette import RouletteGame
+from games.slots import SlotsGame
+
+GAMES = {
+    "slots": SlotsGame,
+    "roulette": RouletteGame,
+    "blackjack": BlackjackGame
+}
+
+CHUNK_SESSIONS = 500
+
+# (session_id, статус, описание, {user_id: результат})
+Replayed = Tuple[int, str, str, Dict[int, int]]
+
+def revealed_seeds(sessions: Iterable[Dict]) -> Dict[str, str]:
+    """Хэш -> раскрытое зерно по всем сессиям (свои зерна и отыгранные шузы)"""
+    seeds = {}
+    for game in sessions:
+        fair = (game["outcome"] or {}).get("fair") or {}
+        for record in [fair] + fair.get("retired", []):
+            if record.get("server_seed"):
+                seeds[record["commitment"]] = record["server_seed"]
+    return seeds
+
+def replay_session(game: Dict, seeds: Dict[str, str]) -> Replayed:
+    """Повторить одну сессию и сравнить с записью"""
+    session_id = game["session_id"]
+    fair = (game["outcome"] or {}).get("fair")
+    engine = GAMES.get(game["game_type"])
+    if not fair or engine is None:
+        return session_id, "skipped", "нет записи зерна", {}
+    seed = fair.get("server_seed") or seeds.get(fair.get("commitment"))
+    if seed is None:
+        return session_id, "pending", "зерно еще не раскрыто", {}
+    try:
+        replayed = engine.replay({**fair, "server_seed": seed}, game["players"])
+    except (KeyError, TypeError, ValueError) as e:
+        if "server_seed" not in fair:
+            # Общий шуз: нужное раунду зерно (в том числе отыгранное, retired) еще не раскрыто
+            return session_id, "pending", f"зерно общего шуза еще не раскрыто: {e!r}", {}
+        return session_id, "mismatch", f"запись не повторяется: {e!r}", {}
+
+    problems = []
+    recorded = {int(player["user_id"]): player.get("result") for player in game["players"]}
+    results = {int(user_id): result for user_id, result in replayed["results"].items()}
+    if results != recorded:
+        problems.append(f"результаты {results} != {recorded}")
+    for key, value in replayed["outcome"].items():
+        if key in game["outcome"] and game["outcome"][key] != value:
+            problems.append(f"{key}: {value!r} != {game['outcome'][key]!r}")
+    if "draws" in fair and replayed["draws"] != fair["draws"]:
+        problems.append(f"байтов потока {replayed['draws']} != {fair['draws']}")
+    if problems:
+        return session_id, "mismatch", "; ".join(problems), results
+    return session_id, "ok", "", results
+
+def _replay_chunk(args: Tuple[List[Dict], Dict[str, str]]) -> List[Replayed]:
+    games, seeds = args
+    return [replay_session(game, seeds) for game in games]
+
+def _chunks(items: List, size: int) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--date", type=lambda value: datetime.strptime(value, "%Y-%m-%d"),
+                        default=datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1),
+                        help="день (UTC) в формате ГГГГ-ММ-ДД, по умолчанию вчера")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="процессов в пуле")
+    parser.add_argument("--verbose", action="store_true", help="печатать каждое расхождение")
+    args = parser.parse_args()
+
+    since, until = args.date, args.date + timedelta(days=1)
+    init_db()
+    with get_db() as session:
+        # Зерна общих шузов раскрываются позже: читаем и сессии после этого дня
+        sessions = get_game_sessions(session, since)
+        ledger_totals = get_game_result_totals(session, since, until)
+    day = [game for game in sessions if game["created_at"] < until]
+    seeds = revealed_seeds(sessions)
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        tasks = [(chunk, seeds) for chunk in _chunks(day, CHUNK_SESSIONS)]
+        replayed = [item for chunk in pool.map(_replay_chunk, tasks) for item in chunk]
+
+    statuses = Counter(status for _, status, _, _ in replayed)
+    game_types = {game["session_id"]: game["game_type"] for game in day}
+    totals: Dict[Tuple[int, str], int] = defaultdict(int)
+    for session_id, status, details, results in replayed:
+        if status == "mismatch" and args.verbose:
+            print(f"сессия {session_id} ({game_types[session_id]}): {details}")
+        for user_id, result in results.items():
+            totals[(user_id, game_types[session_id])] += result
+
+    print(f"\nСессий за {since:%Y-%m-%d}: {len(day)}, повторено за {time.perf_counter() - started:.1f} с")
+    for status in ("ok", "mismatch", "pending", "skipped"):
+        print(f"  {status:<9} {statuses[status]:>8}")
+
+    # Сверка с журналом только по играм, где повторены все сессии
+    replayable = {game_types[session_id] for session_id, status, _, _ in replayed if status == "ok"}
+    incomplete = {game_types[session_id] for session_id, status, _, _ in replayed if status != "ok"}
+    checked = replayable - incomplete
+    differences = [
+        (key, totals.get(key, 0), ledger_totals.get(key, 0))
+        for key in sorted(set(totals) | set(ledger_totals), key=lambda item: (item[1], item[0]))
+        if key[1] in checked and totals.get(key, 0) != ledger_totals.get(key, 0)
+    ]
+    print(f"\nСверка с журналом ({', '.join(sorted(checked)) or 'нет полностью повторенных игр'}): "
+          f"расхождений {len(differences)}")
+    for (user_id, game_type), replayed_total, ledger_total in differences:
+        print(f"  {game_type:<10} игрок {user_id}: повтор {replayed_total:+}, журнал {ledger_total:+}")
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,36 @@
+"""Временная база для служебных скриптов: схема, миграции, удаление после работы."""
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+
+from db_engine import create_db_engine
+from migrations import run_migrations, schema_migrations
+from models import Base
+
+@contextmanager
+def scratch_engine(url: Optional[str] = None) -> Iterator[Engine]:
+    """Движок пустой базы со всеми миграциями.
+
+    Без url создается файл SQLite во временном каталоге. Переданная база
+    (например, PostgreSQL) должна быть пустой: после работы все таблицы
+    удаляются.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        url = url or f"sqlite:///{os.path.join(tmp, 'scratch.db')}"
+        engine = create_db_engine(url)
+        try:
+            if inspect(engine).get_table_names():
+                raise RuntimeError(f"База {engine.url!r} не пустая, нужна отдельная база для проверок")
+            Base.metadata.create_all(engine)
+            run_migrations(engine)
+            try:
+                yield engine
+            finally:
+                Base.metadata.drop_all(engine)
+                schema_migrations.drop(engine, checkfirst=True)
+        finally:
+            engine.dispose()
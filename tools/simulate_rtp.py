@@ -0,0 +1,298 @@
+"""Монте-Карло оценка RTP (возврата игроку) крутилки, рулетки и 21.
+
+Крутилка и рулетка моделируются векторно в NumPy: исходы раунда (номера
+символов на барабанах, выпавшее число) генерируются массивами, считаются
+через np.bincount, а выплаты берутся из таблиц, построенных по самим
+игровым классам (SlotsGame.get_win_amount и веса барабанов,
+RouletteGame._is_winning_bet и get_multiplier). Поэтому сотни миллионов
+раундов занимают секунды, и при изменении правил, весов или множителей в
+config.py таблицы пересчитываются сами.
+Для этих игр рядом печатается точный RTP, посчитанный перебором исходов.
+Ставка крутилки на все линии SLOTS_PAYLINES моделируется сетками барабанов,
+которые оцениваются пачкой через Paylines.evaluate_batch.
+
+21 моделируется настоящим BlackjackGame (стартовая пара дилера берется из разрешенных правилом дома) и
+простой стратегией игрока «брать, пока меньше N», а также автоигрой по
+таблицам EV (games.blackjack_tables) с учетом состава шуза. Точный RTP
+таблиц - RTP нейтрального (полного) шуза; с ним сверяется автоигра, для
+которой шуз перемешивается перед каждым раундом (разница - только
+округление выплаты за блэкджек: игра платит int(ставка * 1.5), таблицы -
+ровно 1.5). За живым столом шуз общий на много раундов, и RTP выше:
+стартовые пары дилера по правилу дома в сумме меньше 16, поэтому
+выбирают из шуза мелкие карты, и остаток смещается к десяткам и тузам.
+Это смещение печатается по частотам первой карты игрока. Возврат раунда
+считается на исходную ставку, удвоение - это возврат до двух ставок.
+
+Для каждой ставки печатаются RTP, стандартное отклонение результата на
+единицу ставки, частота выигрыша (чистый результат > 0) и полуширина 95%
+доверительного интервала RTP. Пачки раундов считаются в пуле процессов.
+
+Запуск из корня проекта:
+    python -m tools.simulate_rtp
+    python -m tools.simulate_rtp --game slots --rounds 500000000
+    python -m tools.simulate_rtp --game blackjack --blackjack-rounds 1000000 --stand-on 15 --stand-on 17
+"""
+import argparse
+import math
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from config import BLACKJACK_MIN_BET
+from games.blackjack import DECK_POINTS, BlackjackGame, Shoe
+from games.blackjack_tables import NEUTRAL_CLASS, get_tables
+from games.roulette import BET_OPTIONS, INSIDE_BETS, NUMBERS, Bet, RouletteGame
+from games.slots import GRID_ROWS, PAYLINES, REELS, SYMBOLS, SlotsGame
+
+CHUNK_ROUNDS = 5_000_000      # раундов крутилки/рулетки на одну задачу пула
+SLOTS_LINES_CHUNK_ROUNDS = 500_000  # сеток крутилки на задачу: оценка всех линий держит (N, линии, 3) в памяти
+BLACKJACK_CHUNK_ROUNDS = 20_000
+
+# Исход раунда -> возврат на единицу ставки (ставка + чистый результат)
+Returns = Dict[float, int]
+
+# Крутилка
+
+def slots_multipliers() -> np.ndarray:
+    """Множитель SlotsGame.get_win_amount для каждой из len(SYMBOLS)**3 комбинаций"""
+    game = SlotsGame()
+    n = len(SYMBOLS)
+    return np.array([
+        game.get_win_amount([SYMBOLS[a], SYMBOLS[b], SYMBOLS[c]])
+        for a in range(n) for b in range(n) for c in range(n)
+    ])
+
+# Возврат по множителю для двух способов расчета:
+# бот и автоигра списывают ставку и начисляют выигрыш (win = bet * multiplier),
+# одиночное вращение веб-приложения при выигрыше начисляет win, не списывая ставку
+SLOTS_SETTLEMENTS = {
+    "бот и автоигра": lambda multiplier: multiplier,
+    "веб, одно вращение": lambda multiplier: np.where(multiplier > 0, multiplier + 1, 0),
+}
+
+def reel_probabilities() -> List[np.ndarray]:
+    """Вероятности символов каждого барабана по весам из config.SLOTS_REEL_WEIGHTS"""
+    return [np.array(reel.weights) / reel.total for reel in REELS]
+
+def slots_probabilities() -> np.ndarray:
+    """Вероятность каждой из len(SYMBOLS)**3 комбинаций (порядок как в slots_multipliers)"""
+    first, second, third = reel_probabilities()
+    return np.einsum("a,b,c->abc", first, second, third).ravel()
+
+def _slots_chunk(args: Tuple[int, np.random.SeedSequence]) -> np.ndarray:
+    rounds, seed = args
+    rng = np.random.default_rng(seed)
+    n = len(SYMBOLS)
+    # Каждый барабан независимо и по своим весам, как в SlotsGame.spin
+    codes = np.zeros(rounds, dtype=np.int64)
+    for probabilities in reel_probabilities():
+        codes = codes * n + rng.choice(n, size=rounds, p=probabilities)
+    return np.bincount(codes, minlength=n ** 3)
+
+def _slots_lines_chunk(args: Tuple[int, np.random.SeedSequence]) -> np.ndarray:
+    rounds, seed = args
+    rng = np.random.default_rng(seed)
+    n = len(SYMBOLS)
+    # Сетка как SlotsGame.grid: ячейки барабана подряд, каждая по весам своего барабана
+    grids = np.column_stack([
+        rng.choice(n, size=rounds, p=probabilities)
+        for probabilities in reel_probabilities() for _ in range(GRID_ROWS)
+    ])
+    totals = PAYLINES.evaluate_batch(grids).sum(axis=1)
+    return np.bincount(totals, minlength=max(PAYLINES.multipliers) * len(PAYLINES.names) + 1)
+
+# Рулетка
+
+# Ставки, у которых все значения покрывают одинаковое число номеров: печатается первое
+SAME_COVERAGE_BETS = ('number', 'neighbours') + INSIDE_BETS
+
+def roulette_bets() -> List[Bet]:
+    """Ставки на единицу из таблицы ставок: внешние все, остальные - по одной на тип"""
+    bets = []
+    for bet_type, values in BET_OPTIONS.items():
+        if bet_type in SAME_COVERAGE_BETS:
+            values = values[:1]
+        bets += [Bet(bet_type, value, 1) for value in values]
+    return bets
+
+def roulette_returns(bet: Bet) -> np.ndarray:
+    """Возврат ставки для каждого выпавшего числа по правилам RouletteGame"""
+    game = RouletteGame()
+    returns = np.zeros(len(NUMBERS))
+    for number in NUMBERS:
+        game.current_number = number
+        if game._is_winning_bet(bet):
+            returns[number] = 1 + game.get_multiplier(bet)
+    return returns
+
+def _roulette_chunk(args: Tuple[int, np.random.SeedSequence]) -> np.ndarray:
+    rounds, seed = args
+    rng = np.random.default_rng(seed)
+    return np.bincount(rng.integers(0, len(NUMBERS), size=rounds), minlength=len(NUMBERS))
+
+# 21
+
+def _blackjack_chunk(args: Tuple[int, Optional[int], int, bool]) -> Tuple[Returns, Counter]:
+    """Возвраты раундов и номиналы первой карты игрока.
+
+    stand_on = None - играть по таблицам EV. fresh - перемешивать шуз перед
+    каждым раундом (нейтральный шуз таблиц), иначе, как за живым столом,
+    один шуз на все раунды.
+    """
+    rounds, stand_on, seed, fresh = args
+    returns: Returns = Counter()
+    first_cards: Counter = Counter()
+    tables = get_tables() if stand_on is None else None
+    # Генератор с зерном вместо зерен сервера, чтобы прогон с --seed повторялся
+    shoe = Shoe(rng=random.Random(seed))
+    for _ in range(rounds):
+        if fresh:
+            shoe.shuffle()
+        game = BlackjackGame(shoe=shoe)
+        game.add_player(1, BLACKJACK_MIN_BET)
+        game.start_game()
+        player = game.players[1]
+        # После удвоения player.bet - уже удвоенная ставка: возврат считаем на исходную
+        stake = player.bet
+        if tables is not None:
+            upcard = game.dealer.hand[0]
+            composition = tables.composition_class(shoe, game.dealer.hand[1:])
+        while not player.is_standing:
+            if tables is not None:
+                getattr(game, tables.best_action(player, upcard, composition))(1)
+            elif player.get_score() < stand_on:
+                game.hit(1)
+            else:
+                game.stand(1)
+        result = game.finish_game()[1]
+        returns[1 + result / stake] += 1
+        first_cards[player.hand[0].points] += 1
+    return returns, first_cards
+
+# Статистика
+
+def summarize(returns: Returns) -> Tuple[int, float, float, float]:
+    """(раунды, RTP, стандартное отклонение, частота выигрыша) по распределению возвратов"""
+    rounds = sum(returns.values())
+    mean = sum(value * count for value, count in returns.items()) / rounds
+    variance = sum((value - mean) ** 2 * count for value, count in returns.items()) / rounds
+    hits = sum(count for value, count in returns.items() if value > 1) / rounds
+    return rounds, mean, math.sqrt(variance), hits
+
+def _distribution(values: np.ndarray, counts: np.ndarray) -> Returns:
+    returns: Returns = Counter()
+    for value, count in zip(values.tolist(), counts.tolist()):
+        returns[float(value)] += int(count)
+    return returns
+
+def _row(name: str, returns: Returns, exact: Optional[float] = None) -> str:
+    rounds, rtp, std, hits = summarize(returns)
+    ci = 1.96 * std / math.sqrt(rounds)
+    exact_text = f"{exact:8.2%}" if exact is not None else f"{'—':>8}"
+    return (f"{name:<24} {rounds:>13,} {rtp:8.2%} ±{ci:7.3%} {exact_text} "
+            f"{std:7.3f} {hits:7.2%}")
+
+HEADER = (f"{'ставка':<24} {'раундов':>13} {'RTP':>8} {'95% ДИ':>9} {'точно':>8} "
+          f"{'σ':>7} {'выигр.':>7}")
+
+def _chunks(total: int, size: int) -> Iterable[int]:
+    while total > 0:
+        yield min(size, total)
+        total -= size
+
+def _pool_counts(pool: ProcessPoolExecutor, worker, rounds: int, seed: np.random.SeedSequence,
+                 chunk_rounds: int = CHUNK_ROUNDS) -> np.ndarray:
+    sizes = list(_chunks(rounds, chunk_rounds))
+    tasks = zip(sizes, seed.spawn(len(sizes)))
+    return sum(pool.map(worker, tasks))
+
+def simulate_slots(pool: ProcessPoolExecutor, rounds: int, seed: np.random.SeedSequence) -> None:
+    multipliers = slots_multipliers()
+    probabilities = slots_probabilities()
+    line_seed, lines_seed = seed.spawn(2)
+    counts = _pool_counts(pool, _slots_chunk, rounds, line_seed)
+    print("\n🎰 Крутилка (ставка списывается по-разному в боте и веб-приложении)")
+    print(HEADER)
+    for name, settle in SLOTS_SETTLEMENTS.items():
+        returns = settle(multipliers)
+        print(_row(name, _distribution(returns, counts), float(returns @ probabilities)))
+
+    # Все линии сразу: ставка на каждую, возврат - сумма множителей на число линий.
+    # Строки барабана независимы, поэтому точный RTP тот же, что у одной линии, меняется разброс
+    lines = len(PAYLINES.names)
+    totals = _pool_counts(pool, _slots_lines_chunk, rounds, lines_seed, SLOTS_LINES_CHUNK_ROUNDS)
+    print(_row(f"бот, все {lines} линий", _distribution(np.arange(len(totals)) / lines, totals),
+               float(multipliers @ probabilities)))
+
+def simulate_roulette(pool: ProcessPoolExecutor, rounds: int, seed: np.random.SeedSequence) -> None:
+    counts = _pool_counts(pool, _roulette_chunk, rounds, seed)
+    print("\n🎲 Рулетка (все ставки на одних и тех же вращениях)")
+    print(HEADER)
+    for bet in roulette_bets():
+        returns = roulette_returns(bet)
+        name = f"{bet.bet_type} (любое)" if bet.bet_type in SAME_COVERAGE_BETS else f"{bet.bet_type} {bet.value}"
+        print(_row(name, _distribution(returns, counts), float(returns.mean())))
+
+def simulate_blackjack(pool: ProcessPoolExecutor, rounds: int, stand_on: List[int], seed: int) -> None:
+    print(f"\n🃏 21 (игрок берет карту, пока счет меньше N, или играет по таблицам; ставка {BLACKJACK_MIN_BET})")
+    print(HEADER)
+    # Таблицы считаются здесь один раз, процессы пула читают их с диска
+    tables = get_tables()
+    runs = [(f"стоп на {threshold}", threshold, False) for threshold in stand_on]
+    runs += [("по таблицам EV", None, False), ("таблицы, новый шуз", None, True)]
+    shared_first_cards: Counter = Counter()
+    for name, threshold, fresh in runs:
+        sizes = list(_chunks(rounds, BLACKJACK_CHUNK_ROUNDS))
+        salt = threshold if threshold is not None else -1 - fresh
+        tasks = [(size, threshold, seed * 1_000_003 + salt * 10_007 + i, fresh) for i, size in enumerate(sizes)]
+        returns: Returns = Counter()
+        first_cards: Counter = Counter()
+        for chunk, cards in pool.map(_blackjack_chunk, tasks):
+            returns.update(chunk)
+            first_cards.update(cards)
+        if not fresh:
+            shared_first_cards.update(first_cards)
+        # Точный RTP таблиц - для нейтрального шуза: с ним сравнивается прогон с новым шузом на раунд
+        print(_row(name, returns, tables.rtp[NEUTRAL_CLASS] if fresh else None))
+    dealt = sum(shared_first_cards.values())
+    print(f"Точный RTP таблиц - для нейтрального шуза ({tables.rtp[NEUTRAL_CLASS]:.2%}). В общем шузе стартовые пары "
+          f"дилера выбирают мелкие карты, первая карта игрока: туз {shared_first_cards[1] / dealt:.1%} "
+          f"(в полном шузе {DECK_POINTS[1] / sum(DECK_POINTS):.1%}), десятка {shared_first_cards[10] / dealt:.1%} "
+          f"({DECK_POINTS[10] / sum(DECK_POINTS):.1%})")
+    blackjack_pays = int(BLACKJACK_MIN_BET * 1.5)
+    if blackjack_pays != BLACKJACK_MIN_BET * 1.5:
+        print(f"Игра платит блэкджек int(ставка * 1.5) = {blackjack_pays} ({blackjack_pays / BLACKJACK_MIN_BET:.3f} ставки), "
+              f"а точный RTP таблиц считает ровно 1.5 ставки")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--game", choices=("slots", "roulette", "blackjack"), action="append",
+                        help="игра (по умолчанию все)")
+    parser.add_argument("--rounds", type=int, default=100_000_000, help="раундов крутилки и рулетки")
+    parser.add_argument("--blackjack-rounds", type=int, default=200_000, help="раундов 21 на стратегию")
+    parser.add_argument("--stand-on", type=int, action="append", help="порог остановки игрока в 21 (по умолчанию 17)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="процессов в пуле")
+    parser.add_argument("--seed", type=int, default=None, help="зерно для воспроизводимого прогона")
+    args = parser.parse_args()
+
+    games = args.game or ["slots", "roulette", "blackjack"]
+    seed = np.random.SeedSequence(args.seed)
+    slots_seed, roulette_seed = seed.spawn(2)
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        if "slots" in games:
+            simulate_slots(pool, args.rounds, slots_seed)
+        if "roulette" in games:
+            simulate_roulette(pool, args.rounds, roulette_seed)
+        if "blackjack" in games:
+            simulate_blackjack(pool, args.blackjack_rounds, args.stand_on or [17], seed.entropy % 2 ** 32)
+    print(f"\nГотово за {time.perf_counter() - started:.1f} с, процессов: {args.workers}, "
+          f"зерно: {seed.entropy}")
+
+if __name__ == '__main__':
+    main()
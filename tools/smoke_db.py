@@ -0,0 +1,131 @@
+"""Один и тот же набор проверок слоя БД на нескольких бэкендах (SQLite и PostgreSQL).
+
+Для каждой базы создается схема с миграциями, затем проверяются:
+конкурентные списания без ухода в минус (UPDATE ... RETURNING), пакетная
+запись журнала, участники и JSON игровых сессий, накопительная
+статистика, таблица лидеров, лимит игр и ключи идемпотентности (повтор
+возвращает проведенный итог и сессию, а не играет заново). После проверки таблицы удаляются,
+поэтому передавайте только пустую базу.
+
+Запуск из корня проекта:
+    python -m tools.smoke_db
+    python -m tools.smoke_db --url sqlite:////tmp/casino_test.db --url postgresql+psycopg2://casino@localhost/casino_test
+
+Базы можно задать и переменной окружения TEST_DATABASE_URLS (через пробел).
+SQLite в памяти (sqlite://) не подходит: у каждого потока своя база.
+Без аргументов проверяется временная SQLite-база.
+"""
+import argparse
+import logging
+import os
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+import database
+from models import GameSession, TransactionType
+from tools.scratch_db import scratch_engine
+
+def _check(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+def check_concurrent_debits(Session: Callable) -> None:
+    with Session() as session:
+        database.get_or_create_user(session, 1, "smoke1", 100)
+
+    def debit(_):
+        with Session() as session:
+            return database.change_balance(session, 1, -7, TransactionType.GAME_LOSS, "slots", 7)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(debit, range(40)))
+    succeeded = [balance for balance in results if balance is not None]
+    _check(len(succeeded) == 100 // 7, f"успешных списаний {len(succeeded)}, ожидалось {100 // 7}")
+    with Session() as session:
+        _check(database.get_user_balance(session, 1) == 100 % 7, "итоговый баланс не совпадает")
+
+def check_batch(Session: Callable) -> None:
+    with Session() as session:
+        database.get_or_create_user(session, 2, "smoke2", 10)
+        results = database.apply_batch(session, [
+            (database.apply_balance_change, (2, 5, TransactionType.GAME_WIN, "slots", 5)),
+            (database.apply_balance_change, (2, -100, TransactionType.GAME_LOSS, "slots", 100)),
+            (database.add_game_session, ("slots", [{"user_id": 2, "bet": 5, "result": 10}],
+                                         {"symbols": ["🍒", "🍒", "🍒"]})),
+        ])
+        _check(results[0] == 15 and results[1] is None, f"результаты пачки {results[:2]}")
+        game = session.get(GameSession, results[2])
+        _check(game.outcome == {"symbols": ["🍒", "🍒", "🍒"]}, "JSON исхода не сохранился")
+        _check([p.user_id for p in game.participants] == [2], "участники сессии не записаны")
+
+def check_stats_and_leaderboard(Session: Callable) -> None:
+    with Session() as session:
+        stats = database.get_user_stats(session, 2)
+        slots = stats["by_game"]["slots"]
+        _check(slots["wins"] == 1 and slots["won"] == 5 and slots["wagered"] == 5,
+               f"статистика slots {slots}")
+        top = database.get_leaderboard(session, 1)
+        _check(top and top[0]["user_id"] == 2, f"лидер {top}")
+        _check(database.check_rate_limit(session, 2), "лимит игр сработал слишком рано")
+
+def check_idempotency(Session: Callable) -> None:
+    with Session() as session:
+        database.get_or_create_user(session, 3, "smoke3", 50)
+        first = database.change_balance(session, 3, 10, TransactionType.GAME_WIN, "slots", 5, "smoke:1")
+        again = database.change_balance(session, 3, 10, TransactionType.GAME_WIN, "slots", 5, "smoke:1")
+        _check(first == 60 and again == database.Replayed(60, 10, []),
+               f"повтор провел операцию еще раз: {first}, {again}")
+        results = database.apply_batch(session, [
+            (database.apply_balance_change, (3, -5, TransactionType.GAME_LOSS, "slots", 5, "smoke:2")),
+            (database.apply_balance_change, (3, -5, TransactionType.GAME_LOSS, "slots", 5, "smoke:2")),
+            (database.add_game_session, ("slots", [{"user_id": 3, "bet": 5, "result": -5}], None, "smoke:2")),
+            (database.add_game_session, ("slots", [{"user_id": 3, "bet": 5, "result": -5}], None, "smoke:2")),
+        ])
+        _check(results[0] == 55 and results[1].balance == 55 and results[2] == results[3],
+               f"повтор в пачке: {results}")
+        round_players = [{"user_id": 3, "bet": 5, "result": 5}]
+        first = database.apply_game_round(session, "roulette", round_players, {"number": 7}, "smoke:3")
+        again = database.apply_game_round(session, "roulette", [{**round_players[0], "result": -5}],
+                                          {"number": 8}, "smoke:3")
+        session.commit()
+        _check(first == {3: 60} and again[3].result == 5 and again[3].sessions[0]["outcome"] == {"number": 7},
+               f"повтор раунда: {first}, {again}")
+
+CHECKS = [check_concurrent_debits, check_batch, check_stats_and_leaderboard, check_idempotency]
+
+def run(url: Optional[str]) -> bool:
+    with scratch_engine(url) as engine:
+        name = f"{engine.dialect.name} ({engine.url.render_as_string(hide_password=True)})"
+        return _run_checks(name, engine)
+
+def _run_checks(name: str, engine: Engine) -> bool:
+    Session = sessionmaker(bind=engine)
+    ok = True
+    for check in CHECKS:
+        try:
+            check(Session)
+            print(f"ok: {name}: {check.__name__}")
+        except Exception:
+            ok = False
+            print(f"ОШИБКА: {name}: {check.__name__}")
+            traceback.print_exc()
+    return ok
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", action="append", help="пустая база для проверки (можно несколько)")
+    args = parser.parse_args()
+    # Отказы в списании ожидаемы и пишутся в лог как ошибки
+    logging.disable(logging.ERROR)
+
+    urls: List[Optional[str]] = args.url or os.getenv("TEST_DATABASE_URLS", "").split() or [None]
+    results = [run(url) for url in urls]
+    return 0 if all(results) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import database
+from config import USER_CACHE_SIZE, USER_CACHE_TTL
+
+USER_FIELDS = ("user_id", "username", "balance", "is_banned")
+
+class UserCache:
+    """Кэш записей пользователей (баланс, бан) с вытеснением LRU и TTL.
+
+    Заполняется при /start и при промахах, а после каждого коммита
+    изменения пользователя обновляется синхронно (слушатель
+    database.add_user_listener), поэтому нажатия кнопок обычно не
+    обращаются к БД. TTL ограничивает устаревание из-за записей других
+    процессов; списания все равно проверяются в БД атомарно.
+    """
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._records: "OrderedDict[int, Tuple[float, Dict]]" = OrderedDict()  # user_id -> (истекает, запись)
+
+    def get(self, user_id: int, now: Optional[float] = None) -> Optional[Dict]:
+        """Копия записи пользователя или None (промах или запись устарела)"""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            entry = self._records.get(user_id)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._records[user_id]
+                self.misses += 1
+                return None
+            self._records.move_to_end(user_id)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, record: Dict, now: Optional[float] = None) -> None:
+        """Сохранить полную запись пользователя"""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            self._store(record["user_id"], {field: record[field] for field in USER_FIELDS}, now)
+
+    def update(self, record: Dict) -> None:
+        """Учесть закоммиченное изменение (слушатель database.add_user_listener)"""
+        user_id = record["user_id"]
+        now = time.monotonic()
+        with self._lock:
+            entry = self._records.get(user_id)
+            if entry is not None and entry[0] > now:
+                merged = dict(entry[1])
+                merged.update((field, record[field]) for field in USER_FIELDS if field in record)
+                self._store(user_id, merged, now)
+            elif all(field in record for field in USER_FIELDS):
+                self._store(user_id, {field: record[field] for field in USER_FIELDS}, now)
+            elif entry is not None:
+                # Частичное изменение устаревшей записи: дочитаем из БД при следующем запросе
+                del self._records[user_id]
+
+    def invalidate(self, user_id: int) -> None:
+        """Удалить запись пользователя из кэша"""
+        with self._lock:
+            self._records.pop(user_id, None)
+
+    def _store(self, user_id: int, record: Dict, now: float) -> None:
+        self._records[user_id] = (now + self.ttl, record)
+        self._records.move_to_end(user_id)
+        while len(self._records) > self.max_size:
+            self._records.popitem(last=False)
+
+    def stats(self) -> Dict:
+        """Размер кэша и счетчики попаданий"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._records),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+user_cache = UserCache()
+database.add_user_listener(user_cache.update)
@@ -1,14 +1,14 @@
 from aiohttp import web
 import ssl
 import logging
-from games.slots import spin
+from games.slots import spin, autoplay, autoplay_summary, settled_series
 from games.blackjack import BlackjackGame
-from games.roulette import RouletteGame, Bet
-from database import update_balance, create_game_session, update_game_session, get_user_balance
-from models import TransactionType
-from sqlalchemy.orm import Session
-from sqlalchemy import create_engine
-from config import DATABASE_URL
+from games.roulette import RouletteGame, Bet, number_color
+import async_database as db
+from ledger import ledger
+from rate_limit import rate_limiter
+from idempotency import recent_keys
+from database import Replayed
 import json
 import os
 from aiohttp_cors import setup as cors_setup, ResourceOptions, CorsViewMixin
@@ -17,13 +17,73 @@ from aiohttp_cors import setup as cors_setup, ResourceOptions, CorsViewMixin
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Инициализация базы данных
-engine = create_engine(DATABASE_URL)
-
 # Активные игры
 active_blackjack_games = {}
 active_roulette_games = {}
 
+# Маршруты и действия, с которых начинается ставка
+BET_ROUTES = {
+    '/api/slots': None,
+    '/api/slots/autoplay': None,
+    '/api/blackjack': {'create', 'join'},
+    '/api/roulette': {'spin'}
+}
+
+# Ответы, после которых запрос не выполнен и его можно повторить с тем же request_id:
+# лимит частоты (429), таймауты и ошибки сервера (>= 500). Остальные 4xx - отказ по
+# правилам игры, он сохраняется как и успешный ответ
+RETRYABLE_STATUSES = {408, 425, 429}
+
+@web.middleware
+async def idempotency_middleware(request, handler):
+    """Повтор запроса с тем же request_id получает сохраненный ответ, игра не повторяется"""
+    if request.method != 'POST':
+        return await handler(request)
+    try:
+        data = await request.json()
+        key = f"web:{int(data['user_id'])}:{data['request_id']}"
+    except Exception:
+        # Без request_id запрос обрабатывается как раньше
+        return await handler(request)
+    request['idempotency_key'] = key
+
+    async def respond():
+        response = await handler(request)
+        return response.status, response.body, response.content_type
+
+    status, body, content_type = await recent_keys.run(f"{request.path}:{key}", respond)
+    if status >= 500 or status in RETRYABLE_STATUSES:
+        # Невыполненный запрос клиент может повторить с тем же ключом
+        recent_keys.discard(f"{request.path}:{key}")
+    return web.Response(body=body, status=status, content_type=content_type)
+
+def settlement_key(request, user_id: int):
+    """Ключ идемпотентности проводки для игрока (None, если клиент не прислал request_id)"""
+    key = request.get('idempotency_key')
+    return f"{key}:{user_id}" if key else None
+
+@web.middleware
+async def rate_limit_middleware(request, handler):
+    """Ограничение частоты ставок до обработчиков игр"""
+    if request.method == 'POST' and request.path in BET_ROUTES:
+        try:
+            data = await request.json()
+            user_id = int(data['user_id'])
+            # Автоигра - несколько ставок за один запрос
+            games = int(data.get('spins', 1))
+        except Exception:
+            # Некорректный запрос отклонит сам обработчик
+            return await handler(request)
+        actions = BET_ROUTES[request.path]
+        if actions is None or data.get('action') in actions:
+            allowed, retry_after = rate_limiter.check(user_id, games=games)
+            if not allowed:
+                return web.json_response({
+                    'error': 'Too many requests',
+                    'retry_after': round(retry_after, 1)
+                }, status=429)
+    return await handler(request)
+
 async def handle_index(request):
     """Обработчик главной страницы"""
     game_type = request.query.get('game', '')
@@ -47,11 +107,10 @@ async def handle_balance(request):
     """Обработчик запроса баланса"""
     try:
         user_id = int(request.query['user_id'])
-        with Session(engine) as session:
-            balance = get_user_balance(session, user_id)
-            return web.json_response({
-                'balance': balance
-            })
+        balance = await db.get_user_balance(user_id)
+        return web.json_response({
+            'balance': balance
+        })
     except Exception as e:
         logger.error(f"Ошибка при получении баланса: {e}")
         return web.json_response({
@@ -66,31 +125,43 @@ async def handle_slots(request):
         bet = int(data['bet'])
         
         # Крутим слоты
-        combination, win, success = spin(bet)
+        combination, win, success, fair = spin(bet)
         
         if not success:
             return web.json_response({
                 'error': 'Invalid bet'
             }, status=400)
         
-        # Обновляем баланс
-        with Session(engine) as session:
-            if win > 0:
-                update_balance(session, user_id, win, TransactionType.GAME_WIN, 'slots')
-            else:
-                update_balance(session, user_id, -bet, TransactionType.GAME_LOSS, 'slots')
-            
-            # Создаем запись об игре
-            game_id = create_game_session(session, 'slots', [{
-                'user_id': user_id,
-                'bet': bet,
-                'result': win
-            }])
+        # Баланс и запись об игре - одна операция журнала
+        balances = await ledger.settle_round('slots', [{
+            'user_id': user_id,
+            'bet': bet,
+            'result': win if win > 0 else -bet
+        }], {'symbols': combination, 'fair': fair}, request.get('idempotency_key'))
+        new_balance = balances.get(user_id)
+        if new_balance is None:
+            return web.json_response({
+                'error': 'Insufficient balance'
+            }, status=400)
+        
+        if isinstance(new_balance, Replayed):
+            # Повтор запроса: отвечаем проведенным вращением
+            if not new_balance.sessions:
+                return web.json_response({
+                    'error': 'Already settled',
+                    'result': new_balance.result,
+                    'balance': new_balance.balance
+                }, status=409)
+            return web.json_response({
+                'combination': new_balance.sessions[0]['outcome']['symbols'],
+                'win': max(new_balance.result, 0),
+                'balance': new_balance.balance
+            })
         
         return web.json_response({
             'combination': combination,
             'win': win,
-            'game_id': game_id
+            'balance': new_balance
         })
     
     except Exception as e:
@@ -99,6 +170,50 @@ async def handle_slots(request):
             'error': str(e)
         }, status=500)
 
+def optional_int(value):
+    return int(value) if value is not None else None
+
+async def handle_slots_autoplay(request):
+    """Автоигра в слоты: серия вращений одним запросом и одной проводкой"""
+    try:
+        data = await request.json()
+        user_id = int(data['user_id'])
+        balance = await db.get_user_balance(user_id)
+        try:
+            series = autoplay(user_id, int(data['bet']), int(data['spins']), balance,
+                              optional_int(data.get('stop_on_win')), optional_int(data.get('stop_below')))
+        except ValueError as e:
+            return web.json_response({
+                'error': str(e)
+            }, status=400)
+        
+        new_balance = None
+        if series['rounds']:
+            new_balance = await ledger.settle_series(user_id, 'slots', series['rounds'],
+                                                     settlement_key(request, user_id))
+        if new_balance is None:
+            return web.json_response({
+                'error': 'Insufficient balance'
+            }, status=400)
+        if isinstance(new_balance, Replayed):
+            # Повтор запроса: серия уже проведена, новая не играется - отвечаем ее итогом
+            if not new_balance.sessions:
+                return web.json_response({
+                    'error': 'Already settled',
+                    'net': new_balance.result,
+                    'balance': new_balance.balance
+                }, status=409)
+            return web.json_response({**autoplay_summary(settled_series(new_balance.sessions)),
+                                      'balance': new_balance.balance})
+        
+        return web.json_response({**autoplay_summary(series), 'balance': new_balance})
+    
+    except Exception as e:
+        logger.error(f"Ошибка в автоигре слотов: {e}")
+        return web.json_response({
+            'error': str(e)
+        }, status=500)
+
 async def handle_blackjack(request):
     """Обработчик игры в блэкджек"""
     try:
@@ -167,13 +282,16 @@ async def handle_blackjack(request):
                 if game.stand(user_id):
                     if game.is_game_over():
                         results = game.finish_game()
-                        # Обновляем балансы
-                        with Session(engine) as session:
-                            for player_id, amount in results.items():
-                                if amount > 0:
-                                    update_balance(session, player_id, amount, TransactionType.GAME_WIN, 'blackjack')
-                                else:
-                                    update_balance(session, player_id, -amount, TransactionType.GAME_LOSS, 'blackjack')
+                        # Балансы и сессия - одна операция журнала с ключом запроса
+                        balances = await ledger.settle_round('blackjack', [
+                            {'user_id': player_id, 'bet': game.players[player_id].bet, 'result': amount}
+                            for player_id, amount in results.items()
+                        ], {'fair': game.fairness()}, request.get('idempotency_key'))
+                        # При повторе запроса отвечаем уже проведенными результатами
+                        results = {
+                            player_id: balance.result if isinstance(balance, Replayed) else results[player_id]
+                            for player_id, balance in balances.items()
+                        }
                         
                         # Удаляем игру
                         del active_blackjack_games[game_id]
@@ -196,55 +314,76 @@ async def handle_blackjack(request):
         }, status=500)
 
 async def handle_roulette(request):
-    """Обработчик игры в рулетку"""
+    """Обработчик игры в рулетку: ставки любого типа копятся, вращение проводится одной транзакцией"""
     try:
         data = await request.json()
         action = data['action']
         user_id = int(data['user_id'])
         
         if action == 'bet':
-            bet_type = data['bet_type']
-            value = data['value']
-            amount = int(data['amount'])
-            
-            bet = Bet(bet_type, value, amount)
+            bet = Bet(data['bet_type'], data['value'], int(data['amount']))
+            if not bet.is_valid():
+                return web.json_response({
+                    'error': 'Invalid bet'
+                }, status=400)
             
             if user_id not in active_roulette_games:
-                active_roulette_games[user_id] = RouletteGame()
+                game = RouletteGame()
+                game.add_player(user_id, bet.amount)
+                game.start_game()
+                active_roulette_games[user_id] = game
             
             game = active_roulette_games[user_id]
-            if game.place_bet(user_id, bet):
+            staked = sum(placed.amount for placed in game.players[user_id])
+            if staked + bet.amount > await db.get_user_balance(user_id):
                 return web.json_response({
-                    'message': 'Bet placed'
+                    'error': 'Insufficient balance'
+                }, status=400)
+            success, message = game.place_bet(user_id, bet)
+            if success:
+                return web.json_response({
+                    'message': 'Bet placed',
+                    'staked': staked + bet.amount
                 })
             return web.json_response({
-                'error': 'Invalid bet'
+                'error': message
             }, status=400)
         
         elif action == 'spin':
-            if user_id in active_roulette_games:
-                game = active_roulette_games[user_id]
-                number, results = game.spin()
-                
-                # Обновляем балансы
-                with Session(engine) as session:
-                    for player_id, amount in results.items():
-                        if amount > 0:
-                            update_balance(session, player_id, amount, TransactionType.GAME_WIN, 'roulette')
-                
-                # Удаляем игру
-                del active_roulette_games[user_id]
-                
+            game = active_roulette_games.pop(user_id, None)
+            if game is None or not game.players.get(user_id):
                 return web.json_response({
-                    'number': number,
-                    'color': game.get_number_color(number),
-                    'dozen': game.get_number_dozen(number),
-                    'column': game.get_number_column(number),
-                    'results': results
-                })
+                    'error': 'No active game'
+                }, status=400)
+            results = game.spin()
+            number = game.current_number
+            players = game.session_players(results)
+            
+            # Все ставки раунда - одна операция журнала
+            key = request.get('idempotency_key')
+            balances = await ledger.settle_round('roulette', players, {'number': number, 'fair': game.fairness()},
+                                                 key)
+            balance = balances.get(user_id)
+            if balance is None:
+                return web.json_response({
+                    'error': 'Insufficient balance'
+                }, status=400)
+            if isinstance(balance, Replayed):
+                # Повтор запроса: отвечаем исходом уже проведенного раунда
+                number = balance.sessions[0]['outcome']['number']
+                results = {user_id: balance.result}
+                balance = balance.balance
+            
             return web.json_response({
-                'error': 'No active game'
-            }, status=400)
+                'number': number,
+                'color': number_color(number),
+                'results': results,
+                'balance': balance
+            })
+        
+        return web.json_response({
+            'error': 'Unknown action'
+        }, status=400)
     
     except Exception as e:
         logger.error(f"Ошибка в рулетке: {e}")
@@ -261,12 +400,24 @@ def setup_routes(app):
     app.router.add_get('/', handle_index)
     app.router.add_get('/api/balance', handle_balance)
     app.router.add_post('/api/slots', handle_slots)
+    app.router.add_post('/api/slots/autoplay', handle_slots_autoplay)
     app.router.add_post('/api/blackjack', handle_blackjack)
     app.router.add_post('/api/roulette', handle_roulette)
 
+async def on_startup(app):
+    """Запуск фоновой записи журнала транзакций"""
+    ledger.start()
+
+async def on_cleanup(app):
+    """Сброс журнала транзакций и остановка потоков базы данных"""
+    await ledger.close()
+    db.shutdown()
+
 def create_app():
     """Создание приложения"""
-    app = web.Application()
+    app = web.Application(middlewares=[idempotency_middleware, rate_limit_middleware])
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
     
     # Настройка CORS
     cors = cors_setup(app, defaults={